@@ -5,7 +5,11 @@ from queue import Queue
 from constants import *
 from maze_clause import *
 from maze_knowledge_base import *
-from itertools import combinations
+from maze_pit_probability import PitProbability
+from maze_linear_constraints import WarningEquations
+from maze_symbols import SYMBOLS
+from maze_parallel import ParallelAsker
+from maze_bdd import KnowledgeCompiler
 
 class MazeAgent:
     '''
@@ -14,6 +18,25 @@ class MazeAgent:
     Problem. Have fun!
     '''
     
+    # Seconds of inference allowed per think (or per stand-alone query);
+    # tiles that cannot be decided in time are treated as undetermined
+    THINK_TIME_LIMIT = 1.0
+    # Expected cost of each tile of distance still left to the goal, which
+    # is more than one move since paths detour around pits and unknowns
+    GOAL_DISTANCE_WEIGHT = 2
+    # WalkSAT flips tried for a model showing a query is not entailed before
+    # proving it (see MazeKnowledgeBase.find_countermodel)
+    WALK_FLIPS = 100
+    # Thinks between eliminations of the props away from the frontier (see
+    # MazeKnowledgeBase.eliminate)
+    ELIMINATE_EVERY = 8
+    # Worker processes that classify_tiles may spread its queries over (see
+    # ParallelAsker), or 0 to always ask serially
+    PARALLEL_WORKERS = 0
+    # Node cap of the BDD compiled for each component of the KB (see
+    # KnowledgeCompiler), or 0 to answer every query by search
+    COMPILE_MAX_NODES = KnowledgeCompiler.MAX_NODES
+    
     def __init__ (self, env: "Environment", perception: dict) -> None:
         """
         Initializes the MazeAgent with any attributes it will need to
@@ -41,7 +64,10 @@ class MazeAgent:
         # [!] Feel free to change self.maze at will
         self.maze: list = env.get_agent_maze()
         # Standard set of attributes you'll want to maintain
-        self.kb: "MazeKnowledgeBase" = MazeKnowledgeBase()
+        self.kb: "MazeKnowledgeBase" = MazeKnowledgeBase(backend = "cdcl")
+        self.kb.walk_flips = MazeAgent.WALK_FLIPS
+        if MazeAgent.COMPILE_MAX_NODES > 0:
+            self.kb.compiler = KnowledgeCompiler(MazeAgent.COMPILE_MAX_NODES)
         self.possible_pits: set[tuple[int, int]] = set()
         self.safe_tiles: set[tuple[int, int]] = set()
         self.pit_tiles: set[tuple[int, int]] = set()
@@ -51,6 +77,16 @@ class MazeAgent:
         # agent here, or any other record-keeping attributes you'd like
         self.moveOrder: list[tuple[tuple[int, int], int]] = list()
         self.startLoc = self.env._initial_loc  
+        # Settles the easy tiles from the warning counts before the KB is asked
+        self.equations: "WarningEquations" = WarningEquations()
+        # Estimates the chance of each frontier tile being a pit when logic can't tell
+        self.pit_probability: "PitProbability" = PitProbability()
+        # Each location's pit proposition id (see SymbolTable), interned once
+        self.pit_ids: dict[tuple[int, int], int] = dict()
+        # Deadline shared by every query of the think in progress, if any
+        self.tick_deadline: Optional[float] = None
+        self.thinks: int = 0
+        self.parallel: Optional["ParallelAsker"] = ParallelAsker(MazeAgent.PARALLEL_WORKERS) if MazeAgent.PARALLEL_WORKERS > 1 else None
         
         #add goal to safetiles
         self.kb.tell(MazeClause([((Constants.PIT_BLOCK, self.goal),False)]))
@@ -101,6 +137,7 @@ class MazeAgent:
         # [!] TODO! Agent is currently just making a random choice from the
         # frontier -- use logic and your own strategy to improve this!
         loc = self.env.get_player_loc()
+        self.tick_deadline = time.monotonic() + MazeAgent.THINK_TIME_LIMIT
         
         #part 1
         #Check if goal, start, and cardinals are in safetiles. 
@@ -113,105 +150,97 @@ class MazeAgent:
         self.kb.tell(MazeClause([(("P", tileType),pit)]))
 
         pit_locations = self.env.get_cardinal_locs(loc, 1) - self.safe_tiles
-        comb = combinations(pit_locations, 2)
      
         match tileType:
             case ".":
-                self.kb.tell(MazeClause([(("P", loc),False)]))
+                self.kb.tell(self.pit_clause(loc, False))
                 self.safe_tiles.add(loc)
 
                 for cardinal in self.env.get_cardinal_locs(loc,1):
-                    self.kb.tell(MazeClause([(("P", cardinal),False)]))
+                    self.kb.tell(self.pit_clause(cardinal, False))
                     self.safe_tiles.add(cardinal)
-            case "4":
-                self.safe_tiles.add(loc)
-                self.kb.tell(MazeClause([(("P", loc),False)]))
-
-                for cardinal in self.env.get_cardinal_locs(loc,1):
-                    self.kb.tell(MazeClause([(("P", cardinal),True)]))
-            case "3":
-                self.safe_tiles.add(loc)
-                self.kb.tell(MazeClause([(("P", loc),False)]))
-
-                for l in pit_locations:
-                    self.kb.tell(MazeClause([(("P", l), True)]))
-            case "2":
-                self.safe_tiles.add(loc)
-                self.kb.tell(MazeClause([(("P", loc),False)]))
-
-                for prop in comb:
-                    self.kb.tell(MazeClause([
-                        (("P", prop[0]),True),
-                        (("P", prop[1]),True)]))
-                
-                self.kb.tell(MazeClause([(("P", l),False) for l in pit_locations]))
-            case "1":
+            case "1" | "2" | "3" | "4":
                 self.safe_tiles.add(loc)
-                self.kb.tell(MazeClause([(("P", loc),False)]))
+                self.kb.tell(self.pit_clause(loc, False))
 
-                for prop in comb:
-                    self.kb.tell(MazeClause([
-                        (("P", prop[0]),False),
-                        (("P", prop[1]),False)]))
-                
-                self.kb.tell(MazeClause([(("P", l),True) for l in pit_locations]))
+                # Exactly as many of the neighbors not known to be safe are pits
+                # as the warning says
+                self.kb.tell_exactly([("P", l) for l in pit_locations], int(tileType))
             case "P":
                 self.pit_tiles.add(loc)
-                self.kb.tell(MazeClause([(("P", loc), True)]))
+                self.kb.tell(self.pit_clause(loc, True))
             
-        self.kb.simplify_from_known_locs(self.kb.clauses, self.safe_tiles, self.pit_tiles)
+        self.kb.simplify_self(self.pit_tiles, self.safe_tiles)
+
+        #Feed what is now known, and any new warning count, to the equations
+        for l in (self.safe_tiles | self.pit_tiles) - self.equations.known.keys():
+            self.equations.set_known(l, l in self.pit_tiles)
+        if tileType in Constants.WRN_BLOCKS:
+            self.equations.add_equation(pit_locations, int(tileType))
 
         #part 3
         #Check if any possible pits are now definitely safe or not
+        self.possible_pits |= frontier - self.safe_tiles - self.pit_tiles
         self.scanKB(loc)
+        self.tick_deadline = None
+        self.thinks += 1
+        if self.thinks % MazeAgent.ELIMINATE_EVERY == 0:
+            self.compact_kb(frontier)
 
-        #Priority for sorting: 
-        #1.Number of warning tiles
-        #2.Distance from goal
-        #3.Tile included in most number of props?
-
-        # Initialize priority outside the loop
-        best_tile = (0,0)
-        best_distance = 100
-        weight:float = 1
-
-        for tile in frontier:
-            
-            if tileType == Constants.GOAL_BLOCK:
-                return tile
-            # Update priority based on the current tileType
-            
-            match tileType:
-                case ".":
-                    weight = 2
-                case "3":
-                    weight = 3
-                case "2":
-                    weight = 1.5
-                case "1":
-                    weight = .25
-                case "P":
-                    weight = 3
-                    
-            if tile in frontier - self.pit_tiles:
-                mDist = int(abs(tile[0] - self.goal[0]) + abs(tile[1] - self.goal[1])*(weight))
-                if mDist < best_distance:
-                    best_distance = mDist
-                    best_tile = tile
-                 
-            
-            
-                    
-        if best_tile == (0,0):
-            best_tile = min(
-                frontier - self.pit_tiles,
-                key = lambda tile: abs(tile[0] - self.goal[0]) + abs(tile[1] - self.goal[1]*weight)
-            )
-
-            # Manhattan Distance for priority
-
-        # Sort based on priority and Manhattan Distance
-        return best_tile
+        #part 4
+        #Move where the expected penalty is lowest, weighing each frontier
+        #tile's chance of being a pit
+        return self.choose_tile(loc, frontier)
+    
+    def choose_tile (self, loc: tuple[int, int], frontier: set[tuple[int, int]]) -> tuple[int, int]:
+        """
+        Chooses the frontier tile with the least expected penalty: the cost of
+        moving there, plus the pit penalty times the probability that it holds a
+        pit, plus the expected cost of the distance still left to the goal (see
+        GOAL_DISTANCE_WEIGHT). Pit probabilities are counted over the KB's
+        BDDs where it has them (see KnowledgeCompiler.marginals), and are
+        otherwise enumerated over the warning constraints (see PitProbability).
+        Known pits are only chosen when nothing else is left.
+        
+        Parameters:
+            loc (tuple[int, int]):
+                The agent's current location
+            frontier (set[tuple[int, int]]):
+                The locations the agent may move to next
+        
+        Returns:
+            tuple[int, int]:
+                The frontier location to move into next
+        """
+        if self.goal in frontier:
+            return self.goal
+        candidates = frontier - self.pit_tiles or frontier
+        pit_chance: dict[tuple[int, int], float] = dict()
+        if self.kb.compiler is not None:
+            compiled = self.kb.compiler.marginals(self.kb, [self.pit_id(tile) for tile in candidates], self.pit_prior)
+            pit_chance = {tile: compiled[self.pit_id(tile)] for tile in candidates if self.pit_id(tile) in compiled}
+        if len(pit_chance) < len(candidates):
+            pit_chance.update(self.pit_probability.get_probabilities(self.kb.constraints, candidates - pit_chance.keys(), self.pit_tiles, self.safe_tiles))
+        
+        def expected_penalty (tile: tuple[int, int]) -> float:
+            move = abs(tile[0] - loc[0]) + abs(tile[1] - loc[1])
+            remaining = abs(tile[0] - self.goal[0]) + abs(tile[1] - self.goal[1])
+            return move + pit_chance[tile] * Constants.get_pit_penalty() + remaining * MazeAgent.GOAL_DISTANCE_WEIGHT
+        
+        return min(sorted(candidates), key = expected_penalty)
+        
+    def compact_kb (self, frontier: set[tuple[int, int]]) -> None:
+        """
+        Forgets the pit propositions of every location that is no longer on
+        or next to the frontier or the goal (and any other proposition of the
+        KB besides), by variable elimination, so that the KB scales with the
+        frontier rather than with the explored area. Whether those locations
+        are pits stays recorded in safe_tiles and pit_tiles.
+        """
+        near = frontier | {self.goal}
+        for l in frontier | {self.goal}:
+            near |= self.env.get_cardinal_locs(l, 1)
+        self.kb.eliminate([("P", l) for l in near])
         
     def is_safe_tile (self, loc: tuple[int, int ]) -> Optional[bool]:
         """
@@ -219,8 +248,12 @@ class MazeAgent:
         safe (i.e., not containing a pit), following the steps:
         1. Check to see if the location is already a known pit or safe tile,
            responding accordingly
-        2. If not, performs the necessary queries on the knowledge base in an
-           attempt to deduce its safety
+        2. If unit propagation has already forced whether it is a pit (see
+           MazeKnowledgeBase.forced), answers from that at once, and if the
+           knowledge base's cached models disagree, it cannot be deduced
+        3. If not, performs the necessary queries on the knowledge base in an
+           attempt to deduce its safety (which is only proven if no model of
+           the KB falsifying it turns up, see MazeKnowledgeBase.find_countermodel)
         
         Parameters:
             loc (tuple[int, int]):
@@ -230,7 +263,8 @@ class MazeAgent:
             One of three return values:
             1. True if the location is certainly safe (i.e., not pit)
             2. False if the location is certainly dangerous (i.e., pit)
-            3. None if the safety of the location cannot be currently determined
+            3. None if the safety of the location cannot be currently determined,
+               including when the queries run out of time (see THINK_TIME_LIMIT)
         """
         # [!] TODO! Agent is currently dumb; this method should perform queries
         # on the agent's knowledge base from its gathered perceptions
@@ -238,19 +272,106 @@ class MazeAgent:
             return True
         elif loc in self.pit_tiles:
             return False 
+        forced = self.kb.forced.get(self.pit_id(loc))
+        if forced is not None:
+            return not forced
+        elif self.kb.models.disagree(self.pit_id(loc)):
+            return None
 
-        if self.kb.ask(MazeClause([(("P", loc),True)])):
+        deadline = self.get_query_deadline()
+        if self.kb.ask(self.pit_clause(loc, True), deadline = deadline):
             return False
-        elif self.kb.ask(MazeClause([(("P", loc),False)])):
+        elif self.kb.ask(self.pit_clause(loc, False), deadline = deadline):
             return True
         else:   
             return None
+    
+    def pit_clause (self, loc: tuple[int, int], is_pit: bool) -> "MazeClause":
+        """
+        Returns the unit clause stating that the given location is (or is
+        not) a pit, built straight from its interned pit proposition id.
+        """
+        pit_id = self.pit_id(loc)
+        return MazeClause.from_lits([pit_id if is_pit else -pit_id])
+    
+    def pit_id (self, loc: tuple[int, int]) -> int:
+        """
+        Returns the id (see SymbolTable) of the given location's pit proposition.
+        """
+        pit_id = self.pit_ids.get(loc)
+        if pit_id is None:
+            pit_id = self.pit_ids[loc] = SYMBOLS.id_of(("P", loc))
+        return pit_id
+    
+    def pit_prior (self, prop_id: int) -> float:
+        """
+        Returns the prior probability that the given proposition is true, for
+        counting models of the KB: the pit density for a location's pit
+        proposition, and one half for anything else.
+        """
+        prop = SYMBOLS.prop_of(prop_id)
+        return self.pit_probability.density if prop[0] == "P" and isinstance(prop[1], tuple) else 0.5
+    
+    def get_query_deadline (self) -> float:
+        """
+        Returns the time.monotonic() deadline for knowledge base queries: that
+        of the current think if one is in progress, else THINK_TIME_LIMIT
+        seconds from now.
+        """
+        if self.tick_deadline is not None:
+            return self.tick_deadline
+        return time.monotonic() + MazeAgent.THINK_TIME_LIMIT
+        
+    def classify_tiles (self, locs: Iterable[tuple[int, int]]) -> dict[tuple[int, int], Optional[bool]]:
+        """
+        Determines the safety of many maze locations at once, exactly as
+        is_safe_tile would for each, but sending all of the needed queries to
+        the knowledge base in a single ask_many batch (spread over worker
+        processes if PARALLEL_WORKERS is set and the KB is large enough).
+        
+        Parameters:
+            locs (Iterable[tuple[int, int]]):
+                The maze locations in question
+        
+        Returns:
+            dict[tuple[int, int], Optional[bool]]:
+                Each location mapped to True if certainly safe, False if certainly
+                a pit, or None if its safety cannot be currently determined (or
+                was not determined in time)
+        """
+        safety: dict[tuple[int, int], Optional[bool]] = dict()
+        undecided: list[tuple[int, int]] = list()
+        for loc in locs:
+            if loc in self.safe_tiles:
+                safety[loc] = True
+            elif loc in self.pit_tiles:
+                safety[loc] = False
+            elif self.pit_id(loc) in self.kb.forced:
+                safety[loc] = not self.kb.forced[self.pit_id(loc)]
+            elif self.kb.models.disagree(self.pit_id(loc)):
+                safety[loc] = None
+            else:
+                undecided.append(loc)
+        
+        queries: list[MazeClause] = list()
+        for loc in undecided:
+            queries.append(self.pit_clause(loc, True))
+            queries.append(self.pit_clause(loc, False))
+        if self.parallel is not None:
+            answers = self.parallel.ask_many(self.kb, queries, deadline = self.get_query_deadline())
+        else:
+            answers = self.kb.ask_many(queries, deadline = self.get_query_deadline())
+        for i, loc in enumerate(undecided):
+            safety[loc] = False if answers[2*i] else True if answers[2*i + 1] else None
+        return safety
         
     def scanKB (self, loc: tuple[int, int]) -> None:
         """
         Determines whether any new information passed into KB
         entails that any tile is now definitely safe, a pit,
-        or neither
+        or neither. Tiles settled by the warning equations are
+        taken first, and only the rest are classified by the KB,
+        in one batch
 
         Returns:
             None:
@@ -258,22 +379,36 @@ class MazeAgent:
                 possible pits, nothing else
         """
 
+        self.learn_deductions()
         copySet: set[tuple[int, int]] = set()
 
-        for l in self.possible_pits:
-            confirmed = False
-            if not self.is_safe_tile(l):
-                self.kb.tell(MazeClause([(("P", loc),False)]))
-                self.pit_tiles.add(l)
-                confirmed = True
-            elif self.is_safe_tile(l):
-                self.kb.tell(MazeClause([(("P", loc),True)]))
-                self.safe_tiles.add(l)
-                confirmed = True
-            elif not confirmed:
+        for l, safe in self.classify_tiles(self.possible_pits - self.safe_tiles - self.pit_tiles).items():
+            if safe is None:
                 copySet.add(l)
+            elif safe:
+                self.kb.tell(self.pit_clause(l, False))
+                self.safe_tiles.add(l)
+                self.equations.set_known(l, False)
+            else:
+                self.kb.tell(self.pit_clause(l, True))
+                self.pit_tiles.add(l)
+                self.equations.set_known(l, True)
         
-        self.possible_pits = copySet
+        # What the KB settled may let the equations settle more
+        self.learn_deductions()
+        self.possible_pits = copySet - self.safe_tiles - self.pit_tiles
+    
+    def learn_deductions (self) -> None:
+        """
+        Records the tiles newly settled by the warning equations as known pits
+        or safe tiles, telling them to the KB so that later queries use them.
+        """
+        for l, is_pit in self.equations.pop_deductions().items():
+            self.kb.tell(self.pit_clause(l, is_pit))
+            if is_pit:
+                self.pit_tiles.add(l)
+            else:
+                self.safe_tiles.add(l)
 
 # Declared here to avoid circular dependency
 from environment import Environment
\ No newline at end of file
@@ -0,0 +1,489 @@
+import random
+import time
+from typing import *
+from maze_clause import MazeClause
+from maze_cardinality import CardinalityConstraint
+from maze_symbols import SYMBOLS
+
+if TYPE_CHECKING:
+    from maze_knowledge_base import MazeKnowledgeBase
+
+class BDDOverflow(Exception):
+    '''
+    Raised when building a BDD would take it past its node cap.
+    '''
+
+class BDD:
+    '''
+    A reduced ordered binary decision diagram over prop ids (see
+    SymbolTable), ordered by id, i.e., props with smaller ids are tested
+    nearer the root. Nodes are ints indexing the arrays var, low and high:
+    nodes 0 and 1 are the terminals FALSE and TRUE, and every other node n
+    tests prop var[n], continuing to low[n] if it is false and to high[n] if
+    it is true. Nodes are hash-consed in a unique table, so equal functions
+    are one node, and are only ever created after their children, so that
+    children always have smaller indexes than their parents.
+
+    Clauses and "exactly k" constraints are conjoined into the diagram one
+    at a time (see conjoin), after which whether the diagram allows an
+    assignment, and the weighted share of its models in which each prop is
+    true, take time linear in its size (see satisfiable and marginals).
+    Nodes left unreachable by a conjoin are only reclaimed by compaction.
+    '''
+
+    FALSE = 0
+    TRUE = 1
+    # Stands for the var of the terminals, after every prop in the order
+    TERMINAL = 1 << 62
+
+    def __init__ (self, max_nodes: Optional[int] = None) -> None:
+        """
+        Initializes the diagram of TRUE (i.e., of no constraints at all).
+
+        Parameters:
+            max_nodes (Optional[int]):
+                The most nodes (live or not yet reclaimed) the diagram may
+                hold before BDDOverflow is raised, or None for no limit
+        """
+        self.var: list[int] = [BDD.TERMINAL, BDD.TERMINAL]
+        self.low: list[int] = [0, 1]
+        self.high: list[int] = [0, 1]
+        self.unique: dict[tuple[int, int, int], int] = dict()
+        self.root: int = BDD.TRUE
+        self.max_nodes: Optional[int] = max_nodes
+
+    def _node (self, var: int, low: int, high: int) -> int:
+        """
+        Returns the node testing var with the given children, creating it
+        if it does not exist yet (and skipping the test if both are equal).
+        """
+        if low == high:
+            return low
+        key = (var, low, high)
+        node = self.unique.get(key)
+        if node is None:
+            node = len(self.var)
+            if self.max_nodes is not None and node >= self.max_nodes:
+                raise BDDOverflow()
+            self.unique[key] = node
+            self.var.append(var)
+            self.low.append(low)
+            self.high.append(high)
+        return node
+
+    def _clause (self, clause: "MazeClause") -> int:
+        """
+        Builds the (non-valid) clause as a chain of nodes and returns its root.
+        """
+        node = BDD.FALSE
+        for lit in sorted(clause.lits, key = abs, reverse = True):
+            node = self._node(lit, node, BDD.TRUE) if lit > 0 else self._node(-lit, BDD.TRUE, node)
+        return node
+
+    def _exactly (self, constraint: "CardinalityConstraint") -> int:
+        """
+        Builds the constraint that exactly k of its props are true, as a grid
+        of nodes (prop i, j still needed), and returns its root.
+        """
+        ids = sorted(constraint.ids)
+        # needs[j] is the node of the props after i with j of them to be true
+        needs = [BDD.TRUE] + [BDD.FALSE] * constraint.k
+        for prop_id in reversed(ids):
+            needs = [self._node(prop_id, needs[j], needs[j - 1] if j > 0 else BDD.FALSE) for j in range(constraint.k + 1)]
+        return needs[constraint.k]
+
+    def _import (self, other: "BDD") -> int:
+        """
+        Copies the live nodes of another diagram into this one and returns
+        the copy of its root.
+        """
+        copies = {BDD.FALSE: BDD.FALSE, BDD.TRUE: BDD.TRUE}
+        for node in other._reachable(other.root):
+            copies[node] = self._node(other.var[node], copies[other.low[node]], copies[other.high[node]])
+        return copies[other.root]
+
+    def _and (self, f: int, g: int) -> int:
+        """
+        Returns the conjunction of two nodes, by the usual apply recursion
+        (memoized on the pair of nodes), unrolled onto an explicit stack so
+        that long orders do not reach Python's recursion limit.
+        """
+        memo: dict[tuple[int, int], int] = dict()
+        results: list[int] = list()
+        # Each frame is (f, g, None) to conjoin, or (f, g, var) to build the
+        # node of var from the two results on top of the results stack
+        stack: list[tuple[int, int, Optional[int]]] = [(f, g, None)]
+        while stack:
+            f, g, var = stack.pop()
+            if var is not None:
+                high = results.pop()
+                low = results.pop()
+                node = memo[f, g] = self._node(var, low, high)
+                results.append(node)
+                continue
+            if f == BDD.FALSE or g == BDD.FALSE:
+                results.append(BDD.FALSE)
+            elif f == BDD.TRUE or f == g:
+                results.append(g)
+            elif g == BDD.TRUE:
+                results.append(f)
+            else:
+                if f > g:
+                    f, g = g, f
+                cached = memo.get((f, g))
+                if cached is not None:
+                    results.append(cached)
+                    continue
+                var = min(self.var[f], self.var[g])
+                f_low, f_high = (self.low[f], self.high[f]) if self.var[f] == var else (f, f)
+                g_low, g_high = (self.low[g], self.high[g]) if self.var[g] == var else (g, g)
+                stack.append((f, g, var))
+                stack.append((f_high, g_high, None))
+                stack.append((f_low, g_low, None))
+        return results.pop()
+
+    def conjoin (self, item: Union["MazeClause", "CardinalityConstraint", "BDD"]) -> None:
+        """
+        Conjoins a clause, an "exactly k" constraint, or another diagram into
+        this one, compacting first if over half of max_nodes is in use.
+
+        Raises:
+            BDDOverflow: if the result does not fit in max_nodes, in which
+                case the diagram must no longer be used
+        """
+        if self.max_nodes is not None and len(self.var) > self.max_nodes // 2:
+            self.compact()
+        if isinstance(item, BDD):
+            node = self._import(item)
+        elif isinstance(item, CardinalityConstraint):
+            node = self._exactly(item)
+        else:
+            node = self._clause(item)
+        self.root = self._and(self.root, node)
+
+    def _reachable (self, root: int) -> list[int]:
+        """
+        Returns the non-terminal nodes reachable from root, in increasing
+        order, i.e., every node after its children.
+        """
+        seen: set[int] = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node > BDD.TRUE and node not in seen:
+                seen.add(node)
+                stack.append(self.low[node])
+                stack.append(self.high[node])
+        return sorted(seen)
+
+    def compact (self) -> None:
+        """
+        Reclaims every node no longer reachable from the root.
+        """
+        live = self._reachable(self.root)
+        var, low, high = self.var, self.low, self.high
+        self.var, self.low, self.high = var[:2], low[:2], high[:2]
+        self.unique = dict()
+        index = {BDD.FALSE: BDD.FALSE, BDD.TRUE: BDD.TRUE}
+        for node in live:
+            index[node] = self._node(var[node], index[low[node]], index[high[node]])
+        self.root = index[self.root]
+
+    def satisfiable (self, assignment: dict[int, bool]) -> bool:
+        """
+        Returns whether the diagram has a model extending the given
+        (partial) assignment of prop ids to bools, in one pass over the
+        nodes reachable under it.
+        """
+        seen: set[int] = set()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node == BDD.TRUE:
+                return True
+            if node == BDD.FALSE or node in seen:
+                continue
+            seen.add(node)
+            value = assignment.get(self.var[node])
+            if value is not True:
+                stack.append(self.low[node])
+            if value is not False:
+                stack.append(self.high[node])
+        return False
+
+    def marginals (self, weight: Callable[[int], float]) -> Optional[dict[int, float]]:
+        """
+        Computes, for every prop in the diagram, the weighted share of its
+        models in which the prop is true, in two passes over the nodes: one
+        weighing each node's sub-diagram (bottom-up), and one weighing the
+        paths reaching each node (top-down). Each prop is true with prior
+        probability weight(prop id), independently of the others, so the
+        share is the prop's probability given that the diagram holds.
+
+        Returns:
+            Optional[dict[int, float]]:
+                Each prop id tested in the diagram mapped to its probability,
+                or None if the diagram has no models
+        """
+        live = self._reachable(self.root)
+        prior = {var: weight(var) for var in {self.var[node] for node in live}}
+        # count[n]: the probability of n's sub-diagram under the priors
+        count: dict[int, float] = {BDD.FALSE: 0.0, BDD.TRUE: 1.0}
+        for node in live:
+            p = prior[self.var[node]]
+            count[node] = (1 - p) * count[self.low[node]] + p * count[self.high[node]]
+        total = count[self.root]
+        if total == 0:
+            return None
+        # flow[n]: the probability of the paths from the root reaching n;
+        # a prop is true on the paths through its nodes' high edges, and
+        # with its prior on the paths skipping it
+        flow: dict[int, float] = {node: 0.0 for node in live}
+        flow[self.root] = 1.0
+        through = {var: 0.0 for var in prior}
+        true = {var: 0.0 for var in prior}
+        for node in reversed(live):
+            var, p = self.var[node], prior[self.var[node]]
+            low, high = self.low[node], self.high[node]
+            through[var] += flow[node] * count[node]
+            true[var] += flow[node] * p * count[high]
+            if low > BDD.TRUE:
+                flow[low] += flow[node] * (1 - p)
+            if high > BDD.TRUE:
+                flow[high] += flow[node] * p
+        return {var: (true[var] + prior[var] * (total - through[var])) / total for var in prior}
+
+    def __len__ (self) -> int:
+        """
+        Returns the number of nodes reachable from the root, terminals aside.
+        """
+        return len(self._reachable(self.root))
+
+class KnowledgeCompiler:
+    '''
+    Compiles each connected component of a MazeKnowledgeBase (see
+    MazeKnowledgeBase.get_component_clauses), i.e., its clauses and
+    constraints, into a BDD, so that the many queries asked between moves
+    are each answered in time linear in their components' diagrams, as
+    are the pit probabilities (see entails and marginals).
+
+    Diagrams are kept up to date as the KB changes, through the hooks it
+    calls: clauses and constraints told are queued on their component's
+    diagram (see add) and conjoined into it on its next use, and joining
+    two components queues one's diagram on the other's (see merge). A
+    component that loses an item is marked stale (see discard) and compiled
+    afresh from the KB on its next use, unless the KB still entails the
+    item, e.g., when it is subsumed by the clause being told. A component
+    whose diagram would outgrow max_nodes is marked failed, and queries
+    about it are left to the KB's backend, until it is next marked stale.
+
+    A component that has no entry here holds nothing, so that its diagram
+    is TRUE; see MazeKnowledgeBase.compiler for how the components that
+    already hold items when a compiler is attached are marked stale.
+    '''
+
+    # Default cap on the nodes of any one component's diagram
+    MAX_NODES = 20000
+
+    def __init__ (self, max_nodes: Optional[int] = MAX_NODES) -> None:
+        """
+        Initializes a compiler with no diagrams.
+
+        Parameters:
+            max_nodes (Optional[int]):
+                The most nodes that any one component's diagram may hold
+                (including some not yet reclaimed, see BDD), or None for no limit
+        """
+        self.max_nodes: Optional[int] = max_nodes
+        # Each component (by its root in the KB's prop_union) that has a
+        # diagram, the items still to be conjoined into it, and the
+        # components that must be compiled afresh or that overflowed
+        self.diagrams: dict[Hashable, "BDD"] = dict()
+        self.pending: dict[Hashable, list[Union["MazeClause", "CardinalityConstraint", "BDD"]]] = dict()
+        self.stale: set[Hashable] = set()
+        self.failed: set[Hashable] = set()
+        # Diagrams compiled afresh, items conjoined, overflows, seconds spent
+        # compiling, and queries answered
+        self.stats: dict[str, Any] = {"compiles": 0, "conjoined": 0, "overflows": 0, "seconds": 0.0, "answered": 0}
+
+    def reset (self, roots: Iterable[Hashable]) -> None:
+        """
+        Forgets every diagram, marking the given components stale.
+        """
+        self.diagrams.clear()
+        self.pending.clear()
+        self.failed.clear()
+        self.stale = set(roots)
+
+    def add (self, root: Hashable, item: Union["MazeClause", "CardinalityConstraint"]) -> None:
+        """
+        Queues a clause or constraint just stored in the given component.
+        """
+        if root not in self.stale and root not in self.failed:
+            self.pending.setdefault(root, []).append(item)
+
+    def merge (self, merged: Hashable, absorbed: Hashable) -> None:
+        """
+        Joins the absorbed component into the merged one, queueing its
+        diagram and pending items there. The result has failed (or is stale)
+        if either component has.
+        """
+        diagram = self.diagrams.pop(absorbed, None)
+        pending = self.pending.pop(absorbed, [])
+        if absorbed in self.failed or merged in self.failed:
+            self.failed.discard(absorbed)
+            self.failed.add(merged)
+            self.diagrams.pop(merged, None)
+            self.pending.pop(merged, None)
+        elif absorbed in self.stale or merged in self.stale:
+            self.stale.discard(absorbed)
+            self.discard(merged)
+        else:
+            queued = self.pending.setdefault(merged, [])
+            if diagram is not None:
+                queued.append(diagram)
+            queued.extend(pending)
+
+    def discard (self, root: Hashable) -> None:
+        """
+        Marks the given component stale, e.g., after an item was removed.
+        """
+        self.diagrams.pop(root, None)
+        self.pending.pop(root, None)
+        self.failed.discard(root)
+        self.stale.add(root)
+
+    def get_diagram (self, kb: "MazeKnowledgeBase", root: Hashable) -> Optional["BDD"]:
+        """
+        Returns the up-to-date diagram of the given component of the KB,
+        compiling it afresh from the KB's items if it is stale (in order
+        of their smallest prop, so that neighbouring items meet early), and
+        otherwise conjoining its pending items.
+
+        Returns:
+            Optional[BDD]:
+                The component's diagram, or None if it outgrew max_nodes
+        """
+        if root in self.failed:
+            return None
+        start = time.perf_counter()
+        diagram = self.diagrams.get(root)
+        try:
+            if root in self.stale:
+                diagram = BDD(self.max_nodes)
+                items: list[Union[MazeClause, CardinalityConstraint]] = [clause for clause in kb.components.get(root, ()) if not clause.is_valid()]
+                items += [constraint for constraint in kb.constraints if kb.prop_union.find(constraint.ids[0]) == root]
+                items.sort(key = lambda item: min(map(abs, item.lits)) if isinstance(item, MazeClause) else min(item.ids))
+                for item in items:
+                    diagram.conjoin(item)
+                self.stale.discard(root)
+                self.diagrams[root] = diagram
+                self.stats["compiles"] += 1
+            for queued in self.pending.pop(root, ()):
+                if diagram is None:
+                    diagram = self.diagrams[root] = BDD(self.max_nodes)
+                diagram.conjoin(queued)
+                self.stats["conjoined"] += 1
+        except BDDOverflow:
+            self.stale.discard(root)
+            self.diagrams.pop(root, None)
+            self.failed.add(root)
+            self.stats["overflows"] += 1
+            self.stats["seconds"] += time.perf_counter() - start
+            return None
+        self.stats["seconds"] += time.perf_counter() - start
+        # A component never told anything holds no items
+        return diagram if diagram is not None else BDD()
+
+    def entails (self, kb: "MazeKnowledgeBase", query: "MazeClause") -> Optional[bool]:
+        """
+        Decides whether the (consistent) KB entails the query, i.e., whether
+        the diagram of some component of the query's props has no model
+        falsifying the query; KB ^ ~query splits into one independent part
+        per component, which is unsatisfiable if and only if one part is.
+
+        Returns:
+            Optional[bool]:
+                True if the KB entails the query, False if not, or None if a
+                component involved has failed to compile
+        """
+        falsifying = {abs(lit): lit < 0 for lit in query.lits}
+        roots = {kb.prop_union.find(prop_id) for prop_id in falsifying if prop_id in kb.prop_union}
+        result: Optional[bool] = False
+        for root in roots:
+            diagram = self.get_diagram(kb, root)
+            if diagram is None:
+                result = None
+            elif not diagram.satisfiable(falsifying):
+                result = True
+                break
+        if result is not None:
+            self.stats["answered"] += 1
+        return result
+
+    def marginals (self, kb: "MazeKnowledgeBase", prop_ids: Iterable[int], weight: Callable[[int], float]) -> dict[int, float]:
+        """
+        Returns the probability that each of the given props is true given
+        the KB, as weighted model counts over the components' diagrams (see
+        BDD.marginals), each prop being true with prior probability
+        weight(prop id). Props in no component keep their prior, and those
+        in components that failed to compile (or have no models) are left out.
+        """
+        probabilities: dict[int, float] = dict()
+        components: dict[Hashable, list[int]] = dict()
+        for prop_id in prop_ids:
+            if prop_id in kb.prop_union:
+                components.setdefault(kb.prop_union.find(prop_id), []).append(prop_id)
+            else:
+                probabilities[prop_id] = weight(prop_id)
+        for root, members in components.items():
+            diagram = self.get_diagram(kb, root)
+            shares = diagram.marginals(weight) if diagram is not None else None
+            if shares is not None:
+                for prop_id in members:
+                    probabilities[prop_id] = shares.get(prop_id, weight(prop_id))
+        return probabilities
+
+    def get_nodes (self) -> int:
+        """
+        Returns the number of nodes held by every diagram, reclaimed or not.
+        """
+        return sum(len(diagram.var) - 2 for diagram in self.diagrams.values())
+
+def _benchmark (width: int, height: int, seed: int = 0) -> None:
+    """
+    Times one batch of pit / not-pit queries over every tile of a random
+    grid of warning constraints, by the CDCL backend alone and through a
+    compiler (first compiling, then once compiled), and the pit marginals.
+    """
+    from maze_knowledge_base import MazeKnowledgeBase
+    from maze_pit_probability import PitProbability
+    rng = random.Random(seed)
+    kb = MazeKnowledgeBase(backend = "cdcl")
+    pits = {(x, y) for x in range(width) for y in range(height) if rng.random() < 0.2}
+    for x in range(0, width, 2):
+        for y in range(0, height, 2):
+            near = [(x + dx, y + dy) for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)) if 0 <= x + dx < width and 0 <= y + dy < height]
+            kb.tell_exactly([("P", loc) for loc in near], sum(1 for loc in near if loc in pits))
+    locs = [(x, y) for x in range(width) for y in range(height) if (x + y) % 2]
+    queries = [MazeClause([(("P", loc), truth_val)]) for loc in locs for truth_val in (True, False)]
+    for label in ("cdcl", "compiling", "compiled"):
+        if label == "compiling":
+            kb.compiler = KnowledgeCompiler()
+        kb.cache.clear()
+        start = time.perf_counter()
+        answers = kb.ask_many(queries)
+        print("  %-10s %6.3fs, %d entailed" % (label, time.perf_counter() - start, sum(1 for answer in answers if answer)))
+    compiler = cast(KnowledgeCompiler, kb.compiler)
+    print("  compiled %d nodes in %.3fs, %d overflows" % (compiler.get_nodes(), compiler.stats["seconds"], compiler.stats["overflows"]))
+    start = time.perf_counter()
+    PitProbability().get_probabilities(kb.constraints, locs, set(), set())
+    print("  %-10s %6.3fs" % ("enumerated", time.perf_counter() - start))
+    start = time.perf_counter()
+    compiler.marginals(kb, [SYMBOLS.id_of(("P", loc)) for loc in locs], lambda prop_id: PitProbability.DEFAULT_DENSITY)
+    print("  %-10s %6.3fs" % ("counted", time.perf_counter() - start))
+
+if __name__ == "__main__":
+    for width, height in ((12, 12), (30, 30)):
+        print("%dx%d grid:" % (width, height))
+        _benchmark(width, height)
@@ -0,0 +1,47 @@
+import time
+from typing import *
+
+class InferenceBudget:
+    '''
+    Step and wall-clock limits on a single MazeKnowledgeBase inference.
+    Backends call spend as they work (one step per resolution attempt,
+    propagated literal, decision, or conflict) and give up with an
+    "unknown" answer once it returns False.
+    '''
+
+    # The clock is only read once per this many steps, to keep spend cheap
+    CLOCK_EVERY = 32
+
+    def __init__ (self, max_steps: Optional[int] = None, deadline: Optional[float] = None) -> None:
+        """
+        Initializes a new budget; with neither limit given it never runs out.
+
+        Parameters:
+            max_steps (Optional[int]):
+                The most inference steps that may be taken
+            deadline (Optional[float]):
+                The time.monotonic() value by which inference must stop
+        """
+        self.max_steps: Optional[int] = max_steps
+        self.deadline: Optional[float] = deadline
+        self.steps: int = 0
+        self.exhausted: bool = False
+        self._next_clock: int = 0
+
+    def spend (self, steps: int = 1) -> bool:
+        """
+        Records that the given number of steps were taken.
+
+        Returns:
+            bool:
+                True if the budget still allows more work, False once either
+                the step limit or the deadline has been passed
+        """
+        self.steps += steps
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.exhausted = True
+        elif self.deadline is not None and self.steps >= self._next_clock:
+            self._next_clock = self.steps + InferenceBudget.CLOCK_EVERY
+            if time.monotonic() > self.deadline:
+                self.exhausted = True
+        return not self.exhausted
@@ -0,0 +1,164 @@
+from itertools import combinations
+from math import comb
+from typing import *
+from maze_clause import MazeClause
+from maze_symbols import SYMBOLS
+
+class CardinalityConstraint:
+    '''
+    First-class "exactly k of these propositions are true" constraint,
+    e.g., that exactly 2 of the unexplored neighbors of a "2" warning
+    tile are pits. MazeKnowledgeBase reasons over it directly by counting
+    (see propagate) and only expands it into CNF when a clausal backend
+    needs it (see to_clauses).
+    '''
+
+    def __init__ (self, props: Iterable[tuple], k: int, tag: str = "#") -> None:
+        """
+        Constructs the constraint that exactly k of the given props are true.
+
+        Parameters:
+            props (Iterable[tuple]):
+                The constrained propositions, e.g., ("P", (1, 1)); repeats
+                are ignored
+            k (int):
+                The exact number of them that are true
+            tag (str):
+                Prefix of the symbols of any auxiliary propositions introduced
+                by to_clauses; must be unique among the constraints of a KB
+        """
+        self.props: tuple[tuple, ...] = tuple(dict.fromkeys(props))
+        # The props' ids in SYMBOLS, in the same order
+        self.ids: tuple[int, ...] = tuple(SYMBOLS.id_of(prop) for prop in self.props)
+        self.k: int = k
+        self.tag: str = tag
+        self._clauses: Optional[list[MazeClause]] = None
+
+    def propagate (self, known: dict[int, bool]) -> Optional[list[int]]:
+        """
+        Counting propagation: given the props whose truth values are known,
+        returns the literals the constraint forces on the remaining ones. If
+        k are already true, the rest are false; if every unknown prop is
+        needed to reach k, they are all true.
+
+        Parameters:
+            known (dict[int, bool]):
+                Known prop ids (see SymbolTable) mapped to their truth values
+
+        Returns:
+            Optional[list[int]]:
+                The forced literals (signed prop ids), or None if the known
+                values already violate the constraint
+        """
+        true = 0
+        free: list[int] = list()
+        for prop_id in self.ids:
+            value = known.get(prop_id)
+            if value is None:
+                free.append(prop_id)
+            elif value:
+                true += 1
+        if true > self.k or true + len(free) < self.k:
+            return None
+        if true == self.k:
+            return [-prop_id for prop_id in free]
+        if true + len(free) == self.k:
+            return free
+        return []
+
+    def reduce (self, known: dict[int, bool]) -> Optional["CardinalityConstraint"]:
+        """
+        Returns the residual constraint over the props whose values are not
+        known (given, as for propagate, by prop id), or None if every prop is known.
+        """
+        free = [prop for prop, prop_id in zip(self.props, self.ids) if prop_id not in known]
+        if not free:
+            return None
+        true = sum(1 for prop_id in self.ids if known.get(prop_id) is True)
+        return CardinalityConstraint(free, self.k - true, self.tag)
+
+    def to_clauses (self) -> list["MazeClause"]:
+        """
+        Expands the constraint into CNF (computed once, then remembered), as
+        the conjunction of "at most k" and "at least k" (i.e., at most n - k
+        are false). Each half uses whichever is smaller of the direct binomial
+        encoding, which needs no new propositions and is best for the handful
+        of neighbors of a warning tile, and Sinz's sequential counter, which
+        is linear in n * k using auxiliary propositions.
+
+        Returns:
+            list[MazeClause]:
+                Clauses satisfiable (over the original props) exactly by the
+                assignments that satisfy the constraint
+        """
+        if self._clauses is None:
+            n = len(self.props)
+            if self.k < 0 or self.k > n:
+                self._clauses = [MazeClause([])]
+            else:
+                self._clauses = CardinalityConstraint._at_most([(prop, True) for prop in self.props], self.k, self.tag + "<") \
+                              + CardinalityConstraint._at_most([(prop, False) for prop in self.props], n - self.k, self.tag + ">")
+        return self._clauses
+
+    @staticmethod
+    def _at_most (lits: list[tuple[tuple, bool]], k: int, symbol: str) -> list["MazeClause"]:
+        """
+        Encodes that at most k of the given literals are true.
+
+        Parameters:
+            lits (list[tuple[tuple, bool]]):
+                The (prop, truth_val) literals being counted
+            k (int):
+                The most of them that may be true
+            symbol (str):
+                Symbol of the auxiliary counter propositions (symbol, (i, j)),
+                meaning "at least j of the first i literals are true"
+        """
+        n = len(lits)
+        if k >= n:
+            return []
+        neg = [(prop, not truth_val) for prop, truth_val in lits]
+        if k == 0:
+            return [MazeClause([lit]) for lit in neg]
+        if comb(n, k + 1) <= 2 * n * k + n:
+            return [MazeClause(list(subset)) for subset in combinations(neg, k + 1)]
+
+        def s (i: int, j: int, truth_val: bool) -> tuple[tuple, bool]:
+            return ((symbol, (i, j)), truth_val)
+
+        clauses = [MazeClause([neg[0], s(1, 1, True)])]
+        clauses += [MazeClause([s(1, j, False)]) for j in range(2, k + 1)]
+        for i in range(2, n):
+            clauses.append(MazeClause([neg[i-1], s(i, 1, True)]))
+            clauses.append(MazeClause([s(i-1, 1, False), s(i, 1, True)]))
+            for j in range(2, k + 1):
+                clauses.append(MazeClause([neg[i-1], s(i-1, j-1, False), s(i, j, True)]))
+                clauses.append(MazeClause([s(i-1, j, False), s(i, j, True)]))
+            clauses.append(MazeClause([neg[i-1], s(i-1, k, False)]))
+        clauses.append(MazeClause([neg[n-1], s(n-1, k, False)]))
+        return clauses
+
+    def __eq__ (self, other: Any) -> bool:
+        """
+        Two constraints are equal if they count the same props to the same k.
+        """
+        if not isinstance(other, CardinalityConstraint): return False
+        return frozenset(self.props) == frozenset(other.props) and self.k == other.k
+
+    def __hash__ (self) -> int:
+        """
+        Provides a hash to enable set membership.
+        """
+        return hash((frozenset(self.props), self.k))
+
+    def __len__ (self) -> int:
+        """
+        Returns the number of constrained props.
+        """
+        return len(self.props)
+
+    def __str__ (self) -> str:
+        """
+        Returns a string like: Exactly 2 of {(P, (1,1)), (P, (2,1))}
+        """
+        return "Exactly " + str(self.k) + " of {" + ", ".join("(" + str(prop[0]) + ", " + str(prop[1]) + ")" for prop in self.props) + "}"
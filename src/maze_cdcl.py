@@ -0,0 +1,480 @@
+from typing import *
+from maze_clause import MazeClause
+from maze_budget import InferenceBudget
+
+class CDCLSolver:
+    '''
+    Incremental conflict-driven clause-learning (CDCL) SAT solver that
+    lives alongside a MazeKnowledgeBase for the whole game: clauses are
+    added as they are told, and each query is answered by solving under
+    assumptions (the negated query) rather than by rebuilding anything.
+
+    Propositions (by their ids in SYMBOLS) are renumbered 1..n as they
+    are first seen and literals are stored as signed ints (+v / -v). The solver uses two watched
+    literals per clause, first-UIP conflict analysis, VSIDS variable
+    activity with phase saving, and Luby restarts. Learned clauses, the
+    level-0 trail, watches, activities, and saved phases all persist
+    between calls to solve, so later queries reuse earlier work.
+
+    Clauses may also be added under an activation variable (see
+    new_activation), in which case they only hold while that variable is
+    assumed true, and are retired for good by deactivate; this is how the
+    clauses told inside a MazeKnowledgeBase.push scope are undone.
+
+    The learned clauses may be capped (see max_learned and reduce): each
+    has an activity, bumped whenever it takes part in conflict analysis,
+    and the least active, longest, and oldest are deleted first, down to
+    half of the cap. Added clauses are never deleted, save for those
+    satisfied for good (e.g., those of a deactivated scope).
+    '''
+
+    # Conflicts between restarts are RESTART_BASE times the Luby sequence
+    RESTART_BASE = 64
+    # Multiplicative decay applied to variable activity after each conflict
+    ACTIVITY_DECAY = 0.95
+    # Multiplicative decay applied to learned clause activity after each conflict
+    CLAUSE_DECAY = 0.999
+
+    def __init__ (self) -> None:
+        """
+        Initializes an empty solver with no variables and no clauses.
+        """
+        # Maps each proposition id (see SymbolTable) to its variable
+        self.var_of: dict[int, int] = dict()
+        self.clauses: list[list[int]] = list()
+        self.num_learned: int = 0
+        # Activity of each learned clause still held, keyed by clause index
+        self.clause_activity: dict[int, float] = dict()
+        self.clause_inc: float = 1.0
+        # Most learned clauses held at once, or None for no limit (see reduce)
+        self.max_learned: Optional[int] = None
+        self.num_deleted: int = 0
+        # False once the clauses alone have been found unsatisfiable
+        self.ok: bool = True
+
+        # Per-variable state, indexed by variable (index 0 is unused)
+        self.value: list[int] = [0]
+        self.level: list[int] = [0]
+        self.reason: list[int] = [-1]
+        self.activity: list[float] = [0.0]
+        self.phase: list[bool] = [False]
+        # Per-literal watch lists of clause indexes, see _widx
+        self.watches: list[list[int]] = [[], []]
+
+        self.trail: list[int] = list()
+        self.trail_lim: list[int] = list()
+        self.qhead: int = 0
+        self.var_inc: float = 1.0
+        self.conflicts: int = 0
+        self.decisions: int = 0
+        self.propagations: int = 0
+        # Truth value of each proposition id in the last satisfying assignment
+        self.model: dict[int, bool] = dict()
+
+    # Clause and Variable Management
+    # -----------------------------------------------------------------------------------------
+
+    def var (self, prop_id: int) -> int:
+        """
+        Returns the variable number for the given proposition, allocating
+        a new variable (and its watch lists) the first time it is seen.
+
+        Parameters:
+            prop_id (int):
+                The id of a maze proposition (see SymbolTable)
+
+        Returns:
+            int:
+                The proposition's variable number
+        """
+        var = self.var_of.get(prop_id)
+        if var is None:
+            var = self._new_var()
+            self.var_of[prop_id] = var
+        return var
+
+    def _new_var (self) -> int:
+        """
+        Allocates the next variable and its per-variable state.
+        """
+        var = len(self.value)
+        self.value.append(0)
+        self.level.append(0)
+        self.reason.append(-1)
+        self.activity.append(0.0)
+        self.phase.append(False)
+        self.watches.extend(([], []))
+        return var
+
+    def new_activation (self) -> int:
+        """
+        Allocates a fresh activation variable, standing for no proposition,
+        for clauses to be added under (see add_clause).
+
+        Returns:
+            int:
+                The activation literal, to be passed among the assumptions of
+                solve for as long as its clauses should hold
+        """
+        return self._new_var()
+
+    def deactivate (self, activation: int) -> None:
+        """
+        Permanently retires the clauses added under the given activation
+        literal, by asserting its negation. Must only be called between solves.
+        """
+        if self.ok and self._lit_value(activation) == 0:
+            self._enqueue(-activation, -1)
+            self.ok = self._propagate() is None
+
+    def lit (self, lit: int) -> int:
+        """
+        Returns the solver's literal for the given clause literal (signed
+        proposition id, see SymbolTable).
+        """
+        var = self.var(abs(lit))
+        return var if lit > 0 else -var
+
+    def add_clause (self, clause: "MazeClause", activation: Optional[int] = None) -> None:
+        """
+        Adds a MazeClause to the solver permanently, or for as long as the
+        given activation literal is assumed. Must only be called between
+        solves (i.e., when no decisions are on the trail).
+
+        Parameters:
+            clause (MazeClause):
+                The clause being added; valid clauses are ignored
+            activation (Optional[int]):
+                An activation literal (see new_activation), if the clause
+                should only hold while it is assumed
+        """
+        if clause.is_valid() or not self.ok:
+            return
+        lits: list[int] = list()
+        if activation is not None:
+            if self._lit_value(activation) < 0:
+                return
+            lits.append(-activation)
+        for clause_lit in clause.lits:
+            lit = self.lit(clause_lit)
+            value = self._lit_value(lit)
+            if value > 0 and self.level[abs(lit)] == 0:
+                return
+            if value < 0 and self.level[abs(lit)] == 0:
+                continue
+            lits.append(lit)
+
+        if len(lits) == 0:
+            self.ok = False
+        elif len(lits) == 1:
+            self._enqueue(lits[0], -1)
+            self.ok = self._propagate() is None
+        else:
+            self._attach(lits)
+
+    def _widx (self, lit: int) -> int:
+        """
+        Returns the index into the watch lists for the given literal.
+        """
+        return 2 * lit if lit > 0 else -2 * lit + 1
+
+    def _attach (self, lits: list[int], learned: bool = False) -> int:
+        """
+        Stores a clause of 2+ literals, watching its first two literals.
+
+        Returns:
+            int:
+                The index of the newly stored clause
+        """
+        index = len(self.clauses)
+        self.clauses.append(lits)
+        self.watches[self._widx(lits[0])].append(index)
+        self.watches[self._widx(lits[1])].append(index)
+        if learned:
+            self.num_learned += 1
+            self.clause_activity[index] = self.clause_inc
+        return index
+
+    def reduce (self) -> int:
+        """
+        Deletes learned clauses once more than max_learned are held, keeping
+        the half of the cap with the highest activity (binary clauses last to
+        go, then preferring shorter and younger clauses among equals), along
+        with every clause satisfied at level 0. Must only be called between
+        solves or at a restart (i.e., when no decisions are on the trail),
+        when no clause is the reason for a decision-level assignment.
+
+        Returns:
+            int:
+                The number of clauses deleted
+        """
+        if self.max_learned is None or len(self.clause_activity) <= self.max_learned or len(self.trail_lim) > 0:
+            return 0
+        ranked = sorted(self.clause_activity, key = lambda index: (len(self.clauses[index]) <= 2, self.clause_activity[index], -len(self.clauses[index]), index))
+        doomed = set(ranked[:len(ranked) - self.max_learned // 2])
+        doomed.update(index for index, lits in enumerate(self.clauses) if any(self._lit_value(lit) > 0 for lit in lits))
+
+        remap: dict[int, int] = dict()
+        clauses: list[list[int]] = list()
+        for index, lits in enumerate(self.clauses):
+            if index not in doomed:
+                remap[index] = len(clauses)
+                clauses.append(lits)
+        self.clauses = clauses
+        self.clause_activity = {remap[index]: activity for index, activity in self.clause_activity.items() if index in remap}
+        self.reason = [remap.get(reason, -1) for reason in self.reason]
+        self.watches = [[] for _ in self.watches]
+        for index, lits in enumerate(clauses):
+            self.watches[self._widx(lits[0])].append(index)
+            self.watches[self._widx(lits[1])].append(index)
+        self.num_deleted += len(doomed)
+        return len(doomed)
+
+    # Assignment Trail
+    # -----------------------------------------------------------------------------------------
+
+    def _lit_value (self, lit: int) -> int:
+        """
+        Returns 1 if lit is currently true, -1 if false, 0 if unassigned.
+        """
+        value = self.value[abs(lit)]
+        return value if lit > 0 else -value
+
+    def _enqueue (self, lit: int, reason: int) -> None:
+        """
+        Makes lit true at the current decision level, because of the clause at
+        index reason (or -1 for decisions, assumptions, and unit clauses).
+        """
+        var = abs(lit)
+        self.value[var] = 1 if lit > 0 else -1
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def _cancel_until (self, level: int) -> None:
+        """
+        Backtracks, unassigning every literal above the given decision level
+        but saving its phase for when it is next decided.
+        """
+        if len(self.trail_lim) <= level:
+            return
+        for lit in self.trail[self.trail_lim[level]:]:
+            var = abs(lit)
+            self.phase[var] = lit > 0
+            self.value[var] = 0
+            self.reason[var] = -1
+        del self.trail[self.trail_lim[level]:]
+        del self.trail_lim[level:]
+        self.qhead = min(self.qhead, len(self.trail))
+
+    def _propagate (self) -> Optional[int]:
+        """
+        Unit propagation with two watched literals over the unprocessed part
+        of the trail.
+
+        Returns:
+            Optional[int]:
+                The index of a falsified (conflict) clause, or None
+        """
+        while self.qhead < len(self.trail):
+            false_lit = -self.trail[self.qhead]
+            self.qhead += 1
+            self.propagations += 1
+            watching = self.watches[self._widx(false_lit)]
+            kept: list[int] = list()
+            conflict: Optional[int] = None
+            for pos, index in enumerate(watching):
+                lits = self.clauses[index]
+                if lits[0] == false_lit:
+                    lits[0], lits[1] = lits[1], lits[0]
+                if self._lit_value(lits[0]) > 0:
+                    kept.append(index)
+                    continue
+                for k in range(2, len(lits)):
+                    if self._lit_value(lits[k]) >= 0:
+                        lits[1], lits[k] = lits[k], lits[1]
+                        self.watches[self._widx(lits[1])].append(index)
+                        break
+                else:
+                    kept.append(index)
+                    if self._lit_value(lits[0]) < 0:
+                        conflict = index
+                        kept.extend(watching[pos + 1:])
+                        break
+                    self._enqueue(lits[0], index)
+            self.watches[self._widx(false_lit)] = kept
+            if conflict is not None:
+                self.qhead = len(self.trail)
+                return conflict
+        return None
+
+    # Conflict Analysis and Heuristics
+    # -----------------------------------------------------------------------------------------
+
+    def _bump (self, var: int) -> None:
+        """
+        Increases the VSIDS activity of var, rescaling all activities if needed.
+        """
+        self.activity[var] += self.var_inc
+        if self.activity[var] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.var_inc *= 1e-100
+
+    def _bump_clause (self, index: int) -> None:
+        """
+        Increases the activity of the learned clause at index, rescaling all
+        clause activities if needed.
+        """
+        self.clause_activity[index] += self.clause_inc
+        if self.clause_activity[index] > 1e20:
+            self.clause_activity = {i: a * 1e-20 for i, a in self.clause_activity.items()}
+            self.clause_inc *= 1e-20
+
+    def _analyze (self, conflict: int) -> tuple[list[int], int]:
+        """
+        Derives the first-UIP learned clause from the given conflict clause.
+
+        Returns:
+            tuple[list[int], int]:
+                The learned clause (its asserting literal first, and a literal
+                of the backtrack level second), and the level to backtrack to
+        """
+        current = len(self.trail_lim)
+        seen: set[int] = set()
+        learned: list[int] = [0]
+        pending = 0
+        index = len(self.trail) - 1
+        resolved_var = 0
+        reason = conflict
+        while True:
+            if reason in self.clause_activity:
+                self._bump_clause(reason)
+            for lit in self.clauses[reason]:
+                var = abs(lit)
+                if var == resolved_var or var in seen or self.level[var] == 0:
+                    continue
+                seen.add(var)
+                self._bump(var)
+                if self.level[var] == current:
+                    pending += 1
+                else:
+                    learned.append(lit)
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            uip = self.trail[index]
+            resolved_var = abs(uip)
+            index -= 1
+            pending -= 1
+            if pending == 0:
+                break
+            reason = self.reason[resolved_var]
+        learned[0] = -uip
+
+        backtrack = 0
+        if len(learned) > 1:
+            best = max(range(1, len(learned)), key = lambda i: self.level[abs(learned[i])])
+            learned[1], learned[best] = learned[best], learned[1]
+            backtrack = self.level[abs(learned[1])]
+        return learned, backtrack
+
+    def _pick_branch (self) -> int:
+        """
+        Returns the unassigned variable of highest activity as a literal in
+        its saved phase, or 0 if every variable is assigned.
+        """
+        best = 0
+        for var in range(1, len(self.value)):
+            if self.value[var] == 0 and (best == 0 or self.activity[var] > self.activity[best]):
+                best = var
+        if best == 0:
+            return 0
+        return best if self.phase[best] else -best
+
+    @staticmethod
+    def _luby (i: int) -> int:
+        """
+        Returns the i-th (0-indexed) term of the Luby sequence 1,1,2,1,1,2,4,...
+        """
+        size, seq = 1, 0
+        while size < i + 1:
+            seq += 1
+            size = 2 * size + 1
+        while size - 1 != i:
+            size = (size - 1) >> 1
+            seq -= 1
+            i = i % size
+        return int(2 ** seq)
+
+    # Solving
+    # -----------------------------------------------------------------------------------------
+
+    def solve (self, assumptions: Sequence[int] = (), budget: Optional["InferenceBudget"] = None) -> Optional[bool]:
+        """
+        Determines whether the solver's clauses are satisfiable together with
+        the given assumption literals. Assumptions are decided first, so any
+        clause learned along the way follows from the clauses alone and is
+        kept for later calls. On success, the satisfying assignment is left in
+        self.model (keyed by proposition id).
+
+        Parameters:
+            assumptions (Sequence[int]):
+                Literals (see lit) that are assumed true for this call only
+            budget (Optional[InferenceBudget]):
+                Limits on the search, spent one step per propagation round;
+                clauses learned before it runs out are kept
+
+        Returns:
+            Optional[bool]:
+                True if satisfiable under the assumptions, False if not, or
+                None if the budget ran out first
+        """
+        if not self.ok:
+            return False
+        self.reduce()
+        restarts = 0
+        until_restart = CDCLSolver.RESTART_BASE * CDCLSolver._luby(restarts)
+        while True:
+            conflict = self._propagate()
+            if budget is not None and not budget.spend():
+                self._cancel_until(0)
+                return None
+            if conflict is not None:
+                self.conflicts += 1
+                if len(self.trail_lim) == 0:
+                    self.ok = False
+                    return False
+                learned, backtrack = self._analyze(conflict)
+                self._cancel_until(backtrack)
+                if len(learned) == 1:
+                    self._enqueue(learned[0], -1)
+                else:
+                    self._enqueue(learned[0], self._attach(learned, learned = True))
+                self.var_inc /= CDCLSolver.ACTIVITY_DECAY
+                self.clause_inc /= CDCLSolver.CLAUSE_DECAY
+                until_restart -= 1
+                if until_restart <= 0:
+                    restarts += 1
+                    until_restart = CDCLSolver.RESTART_BASE * CDCLSolver._luby(restarts)
+                    self._cancel_until(0)
+                    self.reduce()
+                continue
+
+            level = len(self.trail_lim)
+            if level < len(assumptions):
+                lit = assumptions[level]
+                if self._lit_value(lit) < 0:
+                    self._cancel_until(0)
+                    return False
+                self.trail_lim.append(len(self.trail))
+                if self._lit_value(lit) == 0:
+                    self._enqueue(lit, -1)
+                continue
+
+            lit = self._pick_branch()
+            if lit == 0:
+                self.model = {prop_id: self.value[var] > 0 for prop_id, var in self.var_of.items()}
+                self._cancel_until(0)
+                return True
+            self.decisions += 1
+            self.trail_lim.append(len(self.trail))
+            self._enqueue(lit, -1)
@@ -1,6 +1,8 @@
 from environment import *
 from maze_clause import *
 from maze_knowledge_base import *
+from maze_compact_clause import *
+from maze_symbols import *
 from copy import deepcopy
 import unittest
 
@@ -115,6 +117,83 @@ class MazeClauseTests(unittest.TestCase):
         res = MazeClause.resolve(mc1, mc2)
         self.assertEqual(0, len(res))
     
+    # CompactMazeClause Tests
+    # -----------------------------------------------------------------------------------------
+
+    def test_compactclause_construction(self) -> None:
+        mc = CompactMazeClause([(("X", (1, 1)), True), (("X", (2, 1)), True), (("Y", (1, 2)), False)])
+        self.assertTrue(mc.get_prop(("X", (1, 1))))
+        self.assertFalse(mc.get_prop(("Y", (1, 2))))
+        self.assertEqual(None, mc.get_prop(("X", (2, 2))))
+        self.assertEqual(3, len(mc))
+        self.assertFalse(mc.is_empty())
+        self.assertTrue(CompactMazeClause([(("X", (1, 1)), True), (("X", (1, 1)), False)]).is_valid())
+        self.assertTrue(CompactMazeClause([]).is_empty())
+
+    def test_compactclause_round_trip(self) -> None:
+        mc = MazeClause([(("A", (1, 0)), True), (("A", (0, 0)), False), (("B", (1, 4)), True)])
+        cc = CompactMazeClause.from_clause(mc)
+        self.assertEqual(mc, cc.to_clause())
+        self.assertEqual(mc.props, cc.props)
+        self.assertTrue(CompactMazeClause.from_clause(MazeClause([(("A", (1, 0)), True), (("A", (1, 0)), False)])).is_valid())
+
+    def test_compactclause_resolution_matches(self) -> None:
+        # Every resolution case above gives the same answer with compact clauses
+        X, Y, Z, W = ("X", (1, 1)), ("Y", (1, 1)), ("Z", (1, 1)), ("W", (1, 1))
+        A, B, C, D = ("A", (1, 0)), ("A", (0, 0)), ("A", (1, 4)), ("A", (2, 0))
+        pairs = [
+            ([(X, True)], [(X, True)]),
+            ([(X, True)], [(X, False)]),
+            ([(X, True), (Y, True)], [(X, False), (("Y", (2, 2)), True)]),
+            ([(X, True), (Y, False)], [(X, False), (Y, True)]),
+            ([(X, True), (Y, False), (Z, True)], [(X, False), (Y, True), (W, False)]),
+            ([(X, True), (Y, False), (Z, True)], [(X, False), (Y, False), (W, False)]),
+            ([(A, True), (B, False), (C, True), (D, False)], [(A, True), (B, False), (C, True), (D, False)]),
+            ([(A, True), (B, False), (C, True), (D, False)], [(A, True), (B, False), (C, False), (D, False)]),
+            ([(A, True), (B, False), (C, True), (D, False)], [(A, True), (B, False), (C, False), (D, True)]),
+        ]
+        for props1, props2 in pairs:
+            expected = MazeClause.resolve(MazeClause(props1), MazeClause(props2))
+            res = CompactMazeClause.resolve(CompactMazeClause(props1), CompactMazeClause(props2))
+            self.assertEqual(expected, {clause.to_clause() for clause in res})
+
+    def test_compactclause_subsumption(self) -> None:
+        small = CompactMazeClause([(("X", (1, 1)), True)])
+        large = CompactMazeClause([(("X", (1, 1)), True), (("Y", (1, 1)), False)])
+        self.assertTrue(small.subsumes(large))
+        self.assertFalse(large.subsumes(small))
+        self.assertFalse(CompactMazeClause([(("X", (1, 1)), False)]).subsumes(large))
+        self.assertEqual(large, CompactMazeClause([(("Y", (1, 1)), False), (("X", (1, 1)), True)]))
+        self.assertEqual(1, len({large, CompactMazeClause([(("Y", (1, 1)), False), (("X", (1, 1)), True)])}))
+        valid = CompactMazeClause([(("X", (1, 1)), True), (("X", (1, 1)), False)])
+        self.assertTrue(valid.to_clause().is_valid())
+        self.assertIs(MazeClause.tautology(), valid.to_clause())
+        self.assertEqual(valid, CompactMazeClause.from_clause(valid.to_clause()))
+
+    def test_mazeclause_symbols(self) -> None:
+        # Propositions are interned once, and literals map back to them
+        X, Y = ("X", (7, 7)), ("Y", (7, 7))
+        x_id = SYMBOLS.id_of(X)
+        self.assertEqual(x_id, SYMBOLS.id_of(X))
+        self.assertEqual(X, SYMBOLS.prop_of(x_id))
+        self.assertEqual((X, False), SYMBOLS.literal_of(SYMBOLS.lit(X, False)))
+        
+        # Clauses built from literals equal those built from propositions
+        clause = MazeClause([(X, True), (Y, False)])
+        self.assertEqual({x_id, -SYMBOLS.id_of(Y)}, set(clause.lits))
+        self.assertEqual(clause, MazeClause.from_lits([-SYMBOLS.id_of(Y), x_id]))
+        self.assertEqual(str(clause), str(MazeClause.from_lits(clause.lits)))
+        self.assertTrue(MazeClause.from_lits([x_id, -x_id]).valid)
+        
+        # Equal clauses are one shared, immutable instance
+        self.assertIs(clause, MazeClause([(Y, False), (X, True)]))
+        self.assertIs(MazeClause([(Y, False)]), MazeClause.resolve(clause, MazeClause([(X, False), (Y, False)])).pop())
+        self.assertIs(clause, deepcopy(clause))
+        self.assertIs(MazeClause([]), MazeClause.from_lits([]))
+        self.assertIsNot(MazeClause([]), MazeClause([(X, True), (X, False)]))
+        with self.assertRaises(AttributeError):
+            clause.valid = True
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,193 @@
+from typing import *
+from maze_clause import MazeClause
+from maze_symbols import SYMBOLS
+
+def _bits (mask: int) -> Iterator[int]:
+    """
+    Yields the positions of the set bits of mask, lowest first.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class CompactMazeClause:
+    '''
+    Memory-compact alternative to MazeClause in which each proposition is
+    identified by its id in SYMBOLS and a clause is stored as two Python
+    int bitmasks: bit i of pos is set if proposition i appears positively,
+    and bit i of neg if it appears negated. Resolution, validity, emptiness,
+    subsumption, equality and hashing are all bitwise operations.
+
+    Supports the same constructor and query API as MazeClause, and converts
+    to and from it with to_clause / from_clause.
+    '''
+
+    __slots__ = ("pos", "neg", "valid")
+
+    def __init__ (self, props: Sequence[tuple] = ()) -> None:
+        """
+        Constructs a new CompactMazeClause from the given list of maze
+        propositions, exactly as MazeClause does: the result is valid (with
+        no propositions) if some proposition appears both positively and
+        negated.
+
+        Parameters:
+            props (Sequence[tuple]):
+                A list of maze proposition tuples of the format:
+                ((symbol, location), truth_val), e.g.
+                (("P", (1, 1)), True)
+        """
+        pos = neg = 0
+        for prop, truth_val in props:
+            bit = 1 << SYMBOLS.id_of(prop)
+            if truth_val:
+                pos |= bit
+            else:
+                neg |= bit
+        self.valid: bool = (pos & neg) != 0
+        self.pos: int = 0 if self.valid else pos
+        self.neg: int = 0 if self.valid else neg
+
+    @staticmethod
+    def from_masks (pos: int, neg: int) -> "CompactMazeClause":
+        """
+        Builds a CompactMazeClause directly from its positive and negative
+        bitmasks, making it valid if the two overlap.
+        """
+        clause = CompactMazeClause()
+        clause.valid = (pos & neg) != 0
+        clause.pos = 0 if clause.valid else pos
+        clause.neg = 0 if clause.valid else neg
+        return clause
+
+    @staticmethod
+    def from_clause (clause: "MazeClause") -> "CompactMazeClause":
+        """
+        Converts a tuple-based MazeClause into a CompactMazeClause.
+        """
+        pos = neg = 0
+        for lit in clause.lits:
+            if lit > 0:
+                pos |= 1 << lit
+            else:
+                neg |= 1 << -lit
+        compact = CompactMazeClause.from_masks(pos, neg)
+        compact.valid = clause.is_valid()
+        return compact
+
+    def to_clause (self) -> "MazeClause":
+        """
+        Converts this CompactMazeClause back into a tuple-based MazeClause.
+        """
+        if self.valid:
+            return MazeClause.tautology()
+        return MazeClause.from_lits(list(_bits(self.pos)) + [-i for i in _bits(self.neg)])
+
+    @property
+    def props (self) -> dict[tuple, bool]:
+        """
+        The propositions of this clause mapped to their truth values, in the
+        same format as MazeClause.props (built on each access).
+        """
+        props = {SYMBOLS.prop_of(i): True for i in _bits(self.pos)}
+        props.update({SYMBOLS.prop_of(i): False for i in _bits(self.neg)})
+        return props
+
+    def get_prop (self, prop: tuple) -> Optional[bool]:
+        """
+        Returns the truth value of the requested proposition if it exists
+        in the current clause.
+
+        Returns:
+            - None if the requested prop is not in the clause
+            - True if the requested prop is positive in the clause
+            - False if the requested prop is negated in the clause
+        """
+        prop_id = SYMBOLS.ids.get(prop)
+        if prop_id is None:
+            return None
+        if (self.pos >> prop_id) & 1:
+            return True
+        if (self.neg >> prop_id) & 1:
+            return False
+        return None
+
+    def is_valid (self) -> bool:
+        """
+        Returns True if this clause is logically equivalent to True.
+        """
+        return self.valid
+
+    def is_empty (self) -> bool:
+        """
+        Returns True if this is the (non-valid) empty clause.
+        """
+        return not self.valid and self.pos == 0 and self.neg == 0
+
+    def subsumes (self, other: "CompactMazeClause") -> bool:
+        """
+        Determines whether this clause subsumes the other, i.e., every literal
+        of this clause also appears in the other, so that this clause entails it.
+
+        Parameters:
+            other (CompactMazeClause):
+                The clause that may be subsumed
+
+        Returns:
+            bool:
+                True if this clause subsumes other, False otherwise
+        """
+        if other.valid:
+            return True
+        if self.valid:
+            return False
+        return (self.pos & ~other.pos) == 0 and (self.neg & ~other.neg) == 0
+
+    def __eq__ (self, other: Any) -> bool:
+        """
+        Two CompactMazeClauses are equal if they have the same literals and
+        valid status.
+        """
+        if not isinstance(other, CompactMazeClause): return False
+        return self.pos == other.pos and self.neg == other.neg and self.valid == other.valid
+
+    def __hash__ (self) -> int:
+        """
+        Provides a hash for a CompactMazeClause to enable set membership.
+        """
+        return hash((self.pos, self.neg, self.valid))
+
+    def __str__ (self) -> str:
+        """
+        Returns a string in the same format as MazeClause.__str__.
+        """
+        return str(self.to_clause())
+
+    def __len__ (self) -> int:
+        """
+        Returns the number of propositions in this clause.
+        """
+        return self.pos.bit_count() + self.neg.bit_count()
+
+    @staticmethod
+    def resolve (c1: "CompactMazeClause", c2: "CompactMazeClause") -> set["CompactMazeClause"]:
+        """
+        Returns the set of non-valid CompactMazeClauses that result from
+        applying resolution to the two inputs, following MazeClause.resolve:
+        the set is empty if the clauses do not clash, or clash on more than
+        one proposition (making every resolvent valid), and otherwise holds
+        the single resolvent (possibly the empty clause).
+
+        Parameters:
+            c1, c2 (CompactMazeClause):
+                The two CompactMazeClauses being resolved.
+
+        Returns:
+            set[CompactMazeClause]:
+                Either {} or {resolvent}
+        """
+        clash = (c1.pos & c2.neg) | (c1.neg & c2.pos)
+        if clash == 0 or (clash & (clash - 1)) != 0:
+            return set()
+        return {CompactMazeClause.from_masks((c1.pos | c2.pos) & ~clash, (c1.neg | c2.neg) & ~clash)}
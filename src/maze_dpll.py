@@ -0,0 +1,191 @@
+from typing import *
+from maze_clause import MazeClause
+from maze_budget import InferenceBudget
+
+class DPLLSolver:
+    '''
+    Davis-Putnam-Logemann-Loveland satisfiability search over a set of
+    MazeClauses, used by MazeKnowledgeBase as an alternative to
+    resolution-refutation: the KB entails a query exactly when
+    KB ^ ~query is unsatisfiable.
+
+    The clauses' propositions (by their ids in SYMBOLS) are renumbered
+    1..n internally and literals are stored as signed ints (+v for a
+    positive, -v for a negated proposition).
+    The search is iterative (no recursion limits on large mazes) and
+    combines unit propagation, pure-literal elimination, and a
+    Jeroslow-Wang branching heuristic with chronological backtracking.
+    '''
+
+    def __init__ (self, clauses: Iterable["MazeClause"]) -> None:
+        """
+        Encodes the given MazeClauses into the solver's integer form;
+        valid clauses are dropped since they constrain nothing.
+
+        Parameters:
+            clauses (Iterable[MazeClause]):
+                The clauses whose conjunction is being tested
+        """
+        # Maps each proposition id (see SymbolTable) to its variable
+        self.var_of: dict[int, int] = dict()
+        self.clauses: list[list[int]] = list()
+        for clause in clauses:
+            if clause.is_valid():
+                continue
+            lits: list[int] = list()
+            for lit in clause.lits:
+                var = self.var_of.setdefault(abs(lit), len(self.var_of) + 1)
+                lits.append(var if lit > 0 else -var)
+            self.clauses.append(lits)
+
+        num_vars = len(self.var_of)
+        # occurs[lit] holds the indexes of clauses that contain lit
+        self.occurs: dict[int, list[int]] = {lit: [] for v in range(1, num_vars + 1) for lit in (v, -v)}
+        for i, lits in enumerate(self.clauses):
+            for lit in lits:
+                self.occurs[lit].append(i)
+        self.value: list[int] = [0] * (num_vars + 1)
+        self.trail: list[int] = list()
+        self.decisions = 0
+        self.propagations = 0
+        self.budget: Optional[InferenceBudget] = None
+
+    def _lit_value (self, lit: int) -> int:
+        """
+        Returns 1 if lit is currently true, -1 if false, 0 if unassigned.
+        """
+        value = self.value[abs(lit)]
+        return value if lit > 0 else -value
+
+    def _assign (self, lit: int) -> None:
+        """
+        Makes lit true and records it on the trail.
+        """
+        self.value[abs(lit)] = 1 if lit > 0 else -1
+        self.trail.append(lit)
+
+    def _undo_to (self, trail_len: int) -> None:
+        """
+        Unassigns every literal made true after the trail had the given length.
+        """
+        while len(self.trail) > trail_len:
+            self.value[abs(self.trail.pop())] = 0
+
+    def _propagate (self, start: int) -> bool:
+        """
+        Unit propagation over the literals on the trail from index start on,
+        spending one step of the budget per literal.
+
+        Returns:
+            bool:
+                False if some clause was falsified (a conflict), or if the budget
+                ran out (see self.budget.exhausted), True otherwise
+        """
+        head = start
+        while head < len(self.trail):
+            false_lit = -self.trail[head]
+            head += 1
+            self.propagations += 1
+            if self.budget is not None and not self.budget.spend():
+                return False
+            for i in self.occurs[false_lit]:
+                unassigned = 0
+                last = 0
+                satisfied = False
+                for lit in self.clauses[i]:
+                    value = self._lit_value(lit)
+                    if value > 0:
+                        satisfied = True
+                        break
+                    if value == 0:
+                        unassigned += 1
+                        last = lit
+                if satisfied:
+                    continue
+                if unassigned == 0:
+                    return False
+                if unassigned == 1:
+                    self._assign(last)
+        return True
+
+    def _pure_and_branch (self) -> tuple[list[int], int]:
+        """
+        Scans the clauses not yet satisfied, collecting the pure literals (whose
+        complement appears in none of them) and the Jeroslow-Wang branching
+        literal (maximizing the sum of 2^-len over its unsatisfied clauses).
+
+        Returns:
+            tuple[list[int], int]:
+                The pure literals, and the branching literal, or 0 if every
+                clause is already satisfied
+        """
+        score: dict[int, float] = dict()
+        for lits in self.clauses:
+            free: list[int] = list()
+            for lit in lits:
+                value = self._lit_value(lit)
+                if value > 0:
+                    break
+                if value == 0:
+                    free.append(lit)
+            else:
+                weight = 2.0 ** -len(free)
+                for lit in free:
+                    score[lit] = score.get(lit, 0.0) + weight
+        pure = [lit for lit in score if -lit not in score]
+        branch = max(score, key = lambda lit: score[lit]) if score else 0
+        return pure, branch
+
+    def solve (self, budget: Optional["InferenceBudget"] = None) -> Optional[bool]:
+        """
+        Searches for an assignment satisfying every clause.
+
+        Parameters:
+            budget (Optional[InferenceBudget]):
+                Limits on the search, spent one step per decision and per
+                propagated literal
+
+        Returns:
+            Optional[bool]:
+                True if the clauses are satisfiable, False if not, or None if
+                the budget ran out first
+        """
+        self.budget = budget
+        for lits in self.clauses:
+            if len(lits) == 0:
+                return False
+            if len(lits) == 1:
+                if self._lit_value(lits[0]) < 0:
+                    return False
+                if self._lit_value(lits[0]) == 0:
+                    self._assign(lits[0])
+        if not self._propagate(0):
+            return None if budget is not None and budget.exhausted else False
+
+        # Stack of (decision literal, trail length before it, already flipped?)
+        stack: list[tuple[int, int, bool]] = list()
+        while True:
+            pure, branch = self._pure_and_branch()
+            if branch == 0:
+                return True
+            if pure:
+                # Pure literals only ever satisfy clauses, so they cannot conflict
+                for lit in pure:
+                    self._assign(lit)
+                continue
+
+            self.decisions += 1
+            stack.append((branch, len(self.trail), False))
+            self._assign(branch)
+            ok = self._propagate(len(self.trail) - 1)
+            while not ok:
+                if budget is not None and budget.exhausted:
+                    return None
+                if not stack:
+                    return False
+                lit, trail_len, flipped = stack.pop()
+                self._undo_to(trail_len)
+                if not flipped:
+                    stack.append((-lit, trail_len, True))
+                    self._assign(-lit)
+                    ok = self._propagate(trail_len)
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from typing import *
+from maze_clause import MazeClause
+
+class EntailmentCache:
+    '''
+    Bounded, least-recently-used cache of MazeKnowledgeBase.ask results,
+    keyed by query clause and tagged with the KB version at which each
+    answer was computed.
+
+    Since tell only ever adds clauses, anything the KB entails stays
+    entailed, so positive answers are reused at any later version;
+    negative answers are only reused at the exact version they were
+    computed for. Changes that can remove knowledge (like eliminate, which
+    forgets propositions) must clear the cache instead, except for popping
+    a KB scope, which only forgets the answers put since the matching push.
+    '''
+
+    def __init__ (self, maxsize: int = 4096) -> None:
+        """
+        Initializes an empty cache.
+
+        Parameters:
+            maxsize (int):
+                The most answers kept at once; the least recently used
+                answer is evicted to make room for a new one
+        """
+        self.maxsize: int = maxsize
+        self.entries: OrderedDict[MazeClause, tuple[bool, int]] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        # The queries answered within each open scope, innermost last (see push)
+        self.scoped: list[list[MazeClause]] = list()
+
+    def get (self, query: "MazeClause", version: int) -> Optional[bool]:
+        """
+        Returns the cached answer to the query if it is still valid at the
+        given KB version, counting a hit or a miss.
+
+        Parameters:
+            query (MazeClause):
+                The query clause being asked
+            version (int):
+                The KB's current version
+
+        Returns:
+            Optional[bool]:
+                The cached answer, or None if there is no valid answer cached
+        """
+        entry = self.entries.get(query)
+        if entry is not None and (entry[0] or entry[1] == version):
+            self.entries.move_to_end(query)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            del self.entries[query]
+        self.misses += 1
+        return None
+
+    def put (self, query: "MazeClause", result: bool, version: int) -> None:
+        """
+        Records the answer to the query computed at the given KB version.
+        """
+        self.entries[query] = (result, version)
+        self.entries.move_to_end(query)
+        if self.scoped:
+            self.scoped[-1].append(query)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last = False)
+
+    def push (self) -> None:
+        """
+        Opens a scope, mirroring MazeKnowledgeBase.push: answers put from now
+        on are forgotten by the matching pop.
+        """
+        self.scoped.append([])
+    
+    def pop (self) -> None:
+        """
+        Closes the innermost scope, forgetting the answers put since it was
+        opened, which may depend on facts that no longer hold.
+        """
+        for query in self.scoped.pop():
+            self.entries.pop(query, None)
+    
+    def clear (self) -> None:
+        """
+        Discards every cached answer (but keeps the hit and miss counters).
+        """
+        self.entries.clear()
+
+    def __len__ (self) -> int:
+        """
+        Returns the number of answers currently cached.
+        """
+        return len(self.entries)
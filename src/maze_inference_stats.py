@@ -0,0 +1,83 @@
+from typing import *
+
+class InferenceStats:
+    '''
+    Instrumentation for the queries asked of a MazeKnowledgeBase. When
+    enabled, every query answered produces one event: a dictionary with
+    the keys
+      - query:        the query clause, as a string
+      - source:       what answered it: "cache", "implied" (by propagation,
+                      see MazeKnowledgeBase.ask_many), "models" (a model
+                      falsifying it, see MazeKnowledgeBase.find_countermodel),
+                      "bdd" (the compiled components, see KnowledgeCompiler),
+                      "budget" (skipped, the batch's budget having run out),
+                      or the backend name
+      - result:       True, False, or None (out of budget)
+      - attempts:     resolution attempts (or, for the DPLL / CDCL backends,
+                      propagated literals)
+      - resolvents:   resolvents derived (or CDCL clauses learned)
+      - peak_clauses: the largest clause set the backend held at once
+      - rounds:       given clauses selected (or DPLL / CDCL decisions, or
+                      WalkSAT flips)
+      - seconds:      wall time spent answering
+    Events are summed into totals and passed to every listener as they
+    happen. When disabled, the KB only pays for checking self.enabled.
+    '''
+
+    # Event keys that are summed into the totals (peak_clauses is maxed)
+    COUNTERS = ("attempts", "resolvents", "rounds", "seconds")
+
+    def __init__ (self, enabled: bool = False) -> None:
+        """
+        Initializes empty statistics, recording nothing unless enabled.
+        """
+        self.enabled: bool = enabled
+        self.listeners: list[Callable[[dict[str, Any]], None]] = list()
+        self.last: Optional[dict[str, Any]] = None
+        self.reset()
+
+    def reset (self) -> None:
+        """
+        Zeroes the aggregate statistics, keeping any listeners.
+        """
+        self.totals: dict[str, Any] = {"queries": 0, "peak_clauses": 0, "max_seconds": 0.0}
+        self.totals.update({key: 0 for key in InferenceStats.COUNTERS})
+        self.totals["seconds"] = 0.0
+        self.by_source: dict[str, int] = dict()
+
+    def add_listener (self, listener: Callable[[dict[str, Any]], None]) -> None:
+        """
+        Streams every future event to the given callable, enabling the stats.
+        """
+        self.listeners.append(listener)
+        self.enabled = True
+
+    def record (self, query: Any, source: str, result: Optional[bool], seconds: float = 0.0,
+                attempts: int = 0, resolvents: int = 0, peak_clauses: int = 0, rounds: int = 0) -> None:
+        """
+        Records a single answered query (see the class docstring for the
+        meaning of each argument), updating the totals and notifying listeners.
+        """
+        event: dict[str, Any] = {
+            "query": str(query), "source": source, "result": result,
+            "attempts": attempts, "resolvents": resolvents, "peak_clauses": peak_clauses,
+            "rounds": rounds, "seconds": seconds,
+        }
+        self.totals["queries"] += 1
+        for key in InferenceStats.COUNTERS:
+            self.totals[key] += event[key]
+        self.totals["peak_clauses"] = max(self.totals["peak_clauses"], peak_clauses)
+        self.totals["max_seconds"] = max(self.totals["max_seconds"], seconds)
+        self.by_source[source] = self.by_source.get(source, 0) + 1
+        self.last = event
+        for listener in self.listeners:
+            listener(event)
+
+    def __str__ (self) -> str:
+        """
+        Returns a one-line summary of the totals, e.g., for end-of-game logs.
+        """
+        return ("%d queries (%s) in %.3fs (slowest %.3fs): %d attempts, %d resolvents, %d rounds, peak %d clauses"
+                % (self.totals["queries"], ", ".join(s + ": " + str(n) for s, n in sorted(self.by_source.items())),
+                   self.totals["seconds"], self.totals["max_seconds"], self.totals["attempts"],
+                   self.totals["resolvents"], self.totals["rounds"], self.totals["peak_clauses"]))
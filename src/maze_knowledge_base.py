@@ -1,6 +1,20 @@
 from maze_clause import MazeClause
+from maze_resolution import GivenClauseProver
+from maze_clause_matrix import MatrixProver
+from maze_dpll import DPLLSolver
+from maze_cdcl import CDCLSolver
+from maze_entailment_cache import EntailmentCache
+from maze_union_find import PropositionUnionFind
+from maze_cardinality import CardinalityConstraint
+from maze_budget import InferenceBudget
+from maze_inference_stats import InferenceStats
+from maze_local_search import WalkSAT, ModelCache
+from maze_bdd import KnowledgeCompiler
+from maze_snapshot import KBSnapshot
+from maze_symbols import SYMBOLS
+from typing import *
 import itertools
-from copy import deepcopy
+import time
 
 class MazeKnowledgeBase:
     '''
@@ -9,7 +23,12 @@ class MazeKnowledgeBase:
     with side-information.
     '''
     
-    def __init__ (self) -> None:
+    # Entailment procedures that ask can be switched between
+    BACKENDS = ("resolution", "dpll", "cdcl")
+    # Default cap on the derived clauses held at once, see max_derived
+    MAX_DERIVED = 20000
+    
+    def __init__ (self, backend: str = "resolution") -> None:
         """
         Initializes a new MazeKnowledgeBase, which will be used to track the
         locations of pits and safe tiles (i.e., "not" pits) throughout the
@@ -17,8 +36,99 @@ class MazeKnowledgeBase:
         MazeClauses of any kind.
         
         It begins as an empty knowledgebase with no contained clauses.
+        
+        Parameters:
+            backend (str):
+                The entailment procedure used by ask, one of BACKENDS:
+                  - "resolution": resolution-refutation (see GivenClauseProver,
+                    and MatrixProver for its vectorized form on larger sets)
+                  - "dpll": DPLL satisfiability search (see DPLLSolver)
+                  - "cdcl": incremental CDCL search under assumptions, with
+                    a solver that persists across tells and asks (see CDCLSolver)
+                May be changed at any time through the backend attribute
         """
         self.clauses: set["MazeClause"] = set()
+        # Falls back to the pure-Python loop on small sets or without NumPy
+        self.prover: "GivenClauseProver" = MatrixProver()
+        # Built lazily on the first "cdcl" ask, then kept in sync by tell
+        self.solver: Optional["CDCLSolver"] = None
+        # Internally, props and literals are the ids of SYMBOLS (see SymbolTable).
+        # Maps each literal (signed prop id) to the stored clauses containing it
+        self.occurrences: dict[int, set["MazeClause"]] = dict()
+        # Propositions sharing a clause are joined in self.prop_union; the stored
+        # clauses of each component are kept under its root proposition
+        self.prop_union: "PropositionUnionFind" = PropositionUnionFind()
+        self.components: dict[Hashable, set["MazeClause"]] = dict()
+        # "Exactly k of these props" constraints, kept apart from the clauses,
+        # along with the constraints each prop appears in
+        self.constraints: set["CardinalityConstraint"] = set()
+        self.constraint_occurrences: dict[int, list["CardinalityConstraint"]] = dict()
+        # Props whose truth values the KB has already been simplified by (see simplify_self)
+        self.simplified: dict[int, bool] = dict()
+        # The literals forced by unit (and counting) propagation, kept up to
+        # date as clauses are stored: each forced prop id mapped to its truth
+        # value, and set once propagation derives a contradiction. Each stored
+        # clause of 2+ literals is watched by two of them (see _watch)
+        self.forced: dict[int, bool] = dict()
+        self.contradiction: bool = False
+        self.watches: dict[int, list["MazeClause"]] = dict()
+        self.watched: dict["MazeClause", tuple[int, int]] = dict()
+        # Bumped whenever the clauses change; tags the answers in self.cache
+        self.version: int = 0
+        self.cache: "EntailmentCache" = EntailmentCache()
+        # Per-query counters and timings, off until enabled (see InferenceStats)
+        self.stats: "InferenceStats" = InferenceStats()
+        # Undo log of the changes made inside push scopes, as (operation, item)
+        # pairs, and for each open scope the log's length and the version when
+        # it was pushed; see push and pop
+        self.trail: list[tuple[str, Any]] = list()
+        self.scopes: list[tuple[int, int]] = list()
+        # The solver's activation literal for each open scope, if it exists
+        self.activations: list[int] = list()
+        # Cap on the derived clauses held at once (the solver's learned clauses,
+        # or the clauses held during a refutation), or None for no limit; the
+        # clauses told are never evicted (see get_usage)
+        self.max_derived: Optional[int] = MazeKnowledgeBase.MAX_DERIVED
+        # A few models of the KB (from WalkSAT, and from every satisfiable CDCL
+        # solve), and the WalkSAT flips tried for one falsifying each query
+        # before proving it, or None to answer by proof alone (see ask)
+        self.models: "ModelCache" = ModelCache()
+        self.walk_flips: Optional[int] = None
+        # Compiles the components into BDDs that answer queries before any
+        # search, if set (see the compiler property)
+        self._compiler: Optional["KnowledgeCompiler"] = None
+        self.backend = backend
+    
+    @property
+    def backend (self) -> str:
+        """
+        The name of the entailment procedure currently used by ask.
+        """
+        return self._backend
+    
+    @backend.setter
+    def backend (self, backend: str) -> None:
+        if backend not in MazeKnowledgeBase.BACKENDS:
+            raise ValueError("Unknown MazeKnowledgeBase backend: " + str(backend))
+        self._backend = backend
+    
+    @property
+    def compiler (self) -> Optional["KnowledgeCompiler"]:
+        """
+        The KnowledgeCompiler keeping a BDD of each component of the KB, by
+        which ask and ask_many answer the queries about components that fit
+        its node cap, or None (the default) to always search. May be set at
+        any time, the components already holding clauses or constraints
+        being compiled on their next query.
+        """
+        return self._compiler
+    
+    @compiler.setter
+    def compiler (self, compiler: Optional["KnowledgeCompiler"]) -> None:
+        if compiler is not None:
+            roots = {self.prop_union.find(abs(clause.lits[0])) for clause in self.clauses if len(clause) > 0}
+            compiler.reset(roots | {self.prop_union.find(constraint.ids[0]) for constraint in self.constraints})
+        self._compiler = compiler
     
     def tell (self, clause: "MazeClause") -> None:
         """
@@ -28,11 +138,380 @@ class MazeKnowledgeBase:
         to save on computational efficiency and relies on your clauses
         being constructed correctly. Test carefully!
         
+        The clause is dropped if it is valid or subsumed by a stored clause
+        (forward subsumption), and otherwise any stored clauses that it
+        subsumes are removed (backward subsumption), so that the KB never
+        holds redundant clauses.
+        
         Parameters:
             clause (MazeClause):
                 A new MazeClause to add to this knowledgebase
         """
+        if clause.is_valid() or clause in self.clauses or self.is_subsumed(clause):
+            return
+        for subsumed in self.get_subsumed(clause):
+            self._remove_clause(subsumed, entailed = True)
+        self._add_clause(clause)
+        self.models.tell(clause)
+        self.version += 1
+        if self.solver is not None:
+            self.solver.add_clause(clause, self.activations[-1] if self.activations else None)
+    
+    def tell_exactly (self, props: Iterable[tuple], k: int) -> None:
+        """
+        Adds the constraint that exactly k of the given props are true, e.g.,
+        that exactly k of a warning tile's unexplored neighbors are pits. The
+        constraint is reasoned over directly by counting propagation (see
+        get_implied_literals) and only expanded into clauses when a backend
+        needs them (see CardinalityConstraint.to_clauses).
+        
+        Parameters:
+            props (Iterable[tuple]):
+                The constrained propositions, e.g., ("P", (1, 1))
+            k (int):
+                The exact number of them that are true
+        """
+        constraint = CardinalityConstraint(props, k, "#" + str(self.version))
+        if constraint in self.constraints:
+            return
+        self._add_constraint(constraint)
+        self.models.tell_exactly(constraint)
+        self.version += 1
+        if self.solver is not None:
+            for clause in constraint.to_clauses():
+                self.solver.add_clause(clause, self.activations[-1] if self.activations else None)
+    
+    def is_subsumed (self, clause: "MazeClause") -> bool:
+        """
+        Determines whether some stored clause subsumes the given one, i.e.,
+        contains only literals that also appear in it. Only clauses sharing a
+        literal with the given clause are examined, via self.occurrences.
+        
+        Parameters:
+            clause (MazeClause):
+                The clause that may be subsumed
+        
+        Returns:
+            bool:
+                True if a stored clause subsumes the given clause
+        """
+        lits = set(clause.lits)
+        size = len(lits)
+        for lit in clause.lits:
+            for other in self.occurrences.get(lit, ()):
+                if len(other.lits) <= size and lits.issuperset(other.lits):
+                    return True
+        return False
+    
+    def get_subsumed (self, clause: "MazeClause") -> list["MazeClause"]:
+        """
+        Returns the stored clauses (other than the given one) that the given
+        clause subsumes. Any such clause must contain every literal of the
+        given clause, so only the occurrences of its rarest literal are examined.
+        
+        Parameters:
+            clause (MazeClause):
+                The possibly subsuming clause
+        
+        Returns:
+            list[MazeClause]:
+                The stored clauses made redundant by the given clause
+        """
+        if len(clause) == 0:
+            return [other for other in self.clauses if other != clause]
+        rarest = min(clause.lits, key = lambda lit: len(self.occurrences.get(lit, ())))
+        lits = set(clause.lits)
+        return [other for other in self.occurrences.get(rarest, ())
+                if other is not clause and len(other.lits) >= len(lits) and lits.issubset(other.lits)]
+    
+    def _add_clause (self, clause: "MazeClause") -> None:
+        """
+        Stores the given clause and indexes its literals.
+        """
+        if self.scopes:
+            self.trail.append(("clause+", clause))
         self.clauses.add(clause)
+        for lit in clause.lits:
+            self.occurrences.setdefault(lit, set()).add(clause)
+        
+        root = self._link_props([abs(lit) for lit in clause.lits])
+        if root is not None:
+            self.components.setdefault(root, set()).add(clause)
+            if self._compiler is not None:
+                self._compiler.add(root, clause)
+        self._watch(clause)
+    
+    def _value (self, lit: int) -> Optional[bool]:
+        """
+        Returns True if the literal is forced true, False if forced false, or
+        None if its prop is not forced (see self.forced).
+        """
+        value = self.forced.get(abs(lit))
+        return None if value is None else value == (lit > 0)
+    
+    def _force (self, lit: int, pending: list[int]) -> None:
+        """
+        Forces the given literal, queueing it on pending for propagation, or
+        records a contradiction if its negation is already forced.
+        """
+        value = self._value(lit)
+        if value is None:
+            self.forced[abs(lit)] = lit > 0
+            if self.scopes:
+                self.trail.append(("forced", abs(lit)))
+            pending.append(lit)
+        elif not value:
+            self._contradict()
+    
+    def _contradict (self) -> None:
+        """
+        Records that propagation has derived a contradiction, after which
+        every clause is entailed and nothing more is propagated.
+        """
+        if not self.contradiction:
+            self.contradiction = True
+            if self.scopes:
+                self.trail.append(("contradiction", None))
+    
+    def _watch (self, clause: "MazeClause") -> None:
+        """
+        Starts watching a newly stored clause on two of its literals that are
+        not forced false (true ones first), propagating if it is already unit.
+        """
+        if self.contradiction:
+            return
+        pending: list[int] = list()
+        if len(clause) < 2:
+            if len(clause) == 0:
+                self._contradict()
+            else:
+                self._force(clause.lits[0], pending)
+        else:
+            # Sorts the true literals first and the false ones last
+            first, second = sorted(clause.lits, key = lambda lit: {True: 0, None: 1, False: 2}[self._value(lit)])[:2]
+            self.watched[clause] = (first, second)
+            self.watches.setdefault(first, []).append(clause)
+            self.watches.setdefault(second, []).append(clause)
+            if self._value(second) is False:
+                self._force(first, pending)
+        self._propagate(pending)
+    
+    def _propagate (self, pending: list[int]) -> None:
+        """
+        Unit propagation over the watched literals and counting propagation
+        over the constraints, from the newly forced literals in pending until
+        nothing more is forced (or a contradiction is found).
+        """
+        while pending and not self.contradiction:
+            lit = pending.pop()
+            false_lit = -lit
+            kept: list[MazeClause] = list()
+            for clause in self.watches.pop(false_lit, ()):
+                pair = self.watched.get(clause)
+                # Clauses since removed, or no longer watching here, are dropped
+                if pair is None or false_lit not in pair:
+                    continue
+                other = pair[1] if pair[0] == false_lit else pair[0]
+                if self._value(other) is not True:
+                    # Moves the watch to a literal not forced false, if any;
+                    # otherwise the clause is unit (or falsified) on other
+                    replacement = next((candidate for candidate in clause.lits if candidate != other
+                                        and candidate != false_lit and self._value(candidate) is not False), None)
+                    if replacement is not None:
+                        self.watched[clause] = (other, replacement)
+                        self.watches.setdefault(replacement, []).append(clause)
+                        continue
+                    self._force(other, pending)
+                kept.append(clause)
+            if kept:
+                self.watches.setdefault(false_lit, []).extend(kept)
+            for constraint in self.constraint_occurrences.get(abs(lit), ()):
+                forced = constraint.propagate(self.forced)
+                if forced is None:
+                    self._contradict()
+                    break
+                for other in forced:
+                    self._force(other, pending)
+    
+    def _link_props (self, props: list[int]) -> Optional[Hashable]:
+        """
+        Joins the given props (ids) into one component, merging the stored
+        clauses of the components being joined.
+        
+        Returns:
+            Optional[Hashable]:
+                The root of the resulting component, or None if props is empty
+        """
+        if len(props) == 0:
+            return None
+        root = self.prop_union.find(props[0])
+        for prop in props[1:]:
+            other = self.prop_union.find(prop)
+            if other == root:
+                continue
+            merged = self.prop_union.union(root, other)
+            absorbed = root if merged == other else other
+            # Merge the smaller component's clauses into the larger one's
+            kept, moved = self.components.get(merged, set()), self.components.pop(absorbed, set())
+            if len(kept) < len(moved):
+                kept, moved = moved, kept
+            kept.update(moved)
+            self.components[merged] = kept
+            if self._compiler is not None:
+                self._compiler.merge(merged, absorbed)
+            root = merged
+        return root
+    
+    def _remove_clause (self, clause: "MazeClause", entailed: bool = False) -> None:
+        """
+        Removes the given stored clause and its literals from the index. Its
+        component's BDD (see compiler) is compiled afresh on its next use,
+        unless the KB still entails the clause once the change in progress is
+        done (e.g., it is subsumed by the clause being told, or replaced by
+        its simplification), so that the BDD stays equivalent to the KB.
+        """
+        if self.scopes:
+            self.trail.append(("clause-", clause))
+        self.clauses.discard(clause)
+        self.watched.pop(clause, None)
+        for lit in clause.lits:
+            occurring = self.occurrences.get(lit)
+            if occurring is not None:
+                occurring.discard(clause)
+                if not occurring:
+                    del self.occurrences[lit]
+        if len(clause) > 0:
+            root = self.prop_union.find(abs(clause.lits[0]))
+            self.components.get(root, set()).discard(clause)
+            if self._compiler is not None and not entailed:
+                self._compiler.discard(root)
+    
+    def _add_constraint (self, constraint: "CardinalityConstraint") -> None:
+        """
+        Stores the given constraint and indexes its props.
+        """
+        if self.scopes:
+            self.trail.append(("constraint+", constraint))
+        self.constraints.add(constraint)
+        for prop_id in constraint.ids:
+            self.constraint_occurrences.setdefault(prop_id, []).append(constraint)
+        root = self._link_props(list(constraint.ids))
+        if self._compiler is not None:
+            self._compiler.add(root, constraint)
+        if not self.contradiction:
+            pending: list[int] = list()
+            forced = constraint.propagate(self.forced)
+            if forced is None:
+                self._contradict()
+            for lit in forced or ():
+                self._force(lit, pending)
+            self._propagate(pending)
+    
+    def _remove_constraint (self, constraint: "CardinalityConstraint", entailed: bool = False) -> None:
+        """
+        Removes the given stored constraint and its props from the index,
+        marking its component's BDD stale unless entailed (see _remove_clause).
+        """
+        if self.scopes:
+            self.trail.append(("constraint-", constraint))
+        self.constraints.discard(constraint)
+        for prop_id in constraint.ids:
+            self.constraint_occurrences[prop_id].remove(constraint)
+            if not self.constraint_occurrences[prop_id]:
+                del self.constraint_occurrences[prop_id]
+        if self._compiler is not None and not entailed:
+            self._compiler.discard(self.prop_union.find(constraint.ids[0]))
+    
+    def push (self) -> None:
+        """
+        Opens a scope: every change to the KB from here on (clauses and
+        constraints told, clauses removed by subsumption or simplify_self)
+        is logged, so that the matching pop can undo it in time proportional
+        to the changes, without ever copying the KB. Scopes nest. This is
+        meant for hypothetical facts, e.g., asking what else would follow if
+        a tile were a pit, which are told inside a scope and then popped.
+        
+        In the CDCL solver, the clauses told inside a scope are added under
+        an activation literal that is assumed by every solve until the scope
+        is popped, and retired for good afterwards (see CDCLSolver.add_clause).
+        """
+        self.scopes.append((len(self.trail), self.version))
+        self.cache.push()
+        if self.solver is not None:
+            self.activations.append(self.solver.new_activation())
+    
+    def pop (self) -> None:
+        """
+        Closes the innermost scope opened by push, undoing every change made
+        to the KB since, and forgetting the answers cached since (positive
+        answers from before the scope stay valid, since the KB is back to
+        what it was then). Components joined inside the scope stay joined,
+        which only makes them coarser (see get_component_clauses).
+        
+        Raises:
+            IndexError: if no scope is open
+        """
+        mark, _ = self.scopes.pop()
+        undo = self.trail[mark:]
+        del self.trail[mark:]
+        # The undoing is not itself logged in any outer scope
+        scopes, self.scopes = self.scopes, []
+        for operation, item in reversed(undo):
+            if operation == "clause+":
+                self._remove_clause(item)
+            elif operation == "clause-":
+                self._add_clause(item)
+            elif operation == "constraint+":
+                self._remove_constraint(item)
+            elif operation == "constraint-":
+                self._add_constraint(item)
+            elif operation == "forced":
+                del self.forced[item]
+            elif operation == "contradiction":
+                self.contradiction = False
+            else:
+                del self.simplified[item]
+        self.scopes = scopes
+        if self.solver is not None:
+            self.solver.deactivate(self.activations.pop())
+        self.cache.pop()
+        # Models no longer need to assign the props of the constraints restored
+        self.models.clear()
+        self.version += 1
+    
+    def get_component_clauses (self, props: Iterable[tuple]) -> set["MazeClause"]:
+        """
+        Returns the stored clauses in the connected components of the given
+        propositions (along with the clausal form of the cardinality constraints
+        there), i.e., every clause that could take part in a proof about them.
+        Clauses in other components share no propositions with these, so (the
+        KB being consistent) they can never affect the answer to a query over
+        the given propositions.
+        
+        Parameters:
+            props (Iterable[tuple]):
+                The propositions of interest, e.g., those of a query
+        
+        Returns:
+            set[MazeClause]:
+                The clauses of the components containing the given props
+        """
+        return set(self._get_component_clauses([SYMBOLS.ids[prop] for prop in props if prop in SYMBOLS]))
+    
+    def _get_component_clauses (self, prop_ids: Iterable[int]) -> Iterable["MazeClause"]:
+        """
+        As get_component_clauses, but given the propositions' ids, and without
+        copying any stored clauses: the components' own sets are chained (so
+        the result must be used up before the KB next changes).
+        """
+        if MazeClause([]) in self.clauses:
+            return self.clauses
+        roots = {self.prop_union.find(prop_id) for prop_id in prop_ids if prop_id in self.prop_union}
+        parts: list[Iterable[MazeClause]] = [self.components.get(root, ()) for root in roots]
+        for constraint in self.constraints:
+            if self.prop_union.find(constraint.ids[0]) in roots:
+                parts.append(constraint.to_clauses())
+        return itertools.chain.from_iterable(parts)
         
     @staticmethod    
     def negate(query: "MazeClause") -> set["MazeClause"]:
@@ -49,45 +528,441 @@ class MazeKnowledgeBase:
                 A set of clauses representing the negation of the query
         """
         negated_clauses = set()
-        for prop,truth_val in query.props.items():
-            negated_clauses.add(MazeClause([(prop, not truth_val)]))
+        for lit in query.lits:
+            negated_clauses.add(MazeClause.from_lits([-lit]))
         return negated_clauses
         
-    def ask (self, query: "MazeClause") -> bool:
+    def ask (self, query: "MazeClause", max_steps: Optional[int] = None, deadline: Optional[float] = None) -> Optional[bool]:
         """
         Given a MazeClause query, returns True if the KB entails the query, 
         False otherwise. Uses the proof by contradiction technique detailed
-        during the lectures.
+        during the lectures, i.e., checks that KB ^ ~query is unsatisfiable,
+        either by saturating with a given-clause resolution loop (see
+        GivenClauseProver, or MatrixProver, which vectorizes it with NumPy on
+        larger clause sets; statistics are left in self.prover.stats),
+        by a DPLL search, or by solving the persistent CDCL solver under the
+        assumption ~query, depending on self.backend. The resolution and DPLL
+        backends only load the clauses connected to the query's propositions
+        (see get_component_clauses).
+        
+        Answers are remembered in self.cache: positive answers for as long
+        as the KB only grows, negative ones until the next tell. If the KB
+        holds cardinality constraints, the query is first tried against the
+        literals implied by counting and unit propagation (see ask_many).
+        
+        If self.walk_flips is set, a query falsified by a model of the KB is
+        answered False without a proof, the model being either cached in
+        self.models or found by a short WalkSAT search (see find_countermodel).
+        Before either, if self.compiler is set, the query is answered from
+        the BDDs of its components, in time linear in their size, unless one
+        of them has outgrown the compiler's node cap.
+        
+        The search may be bounded by a step count and / or a wall-clock
+        deadline (see InferenceBudget), in which case the answer is None
+        ("unknown") if the bound is reached before the query is decided.
+        Unknown answers are never cached.
+        
+        If self.stats is enabled, an event is recorded for the query (see
+        InferenceStats).
         
         Parameters:
             query (MazeClause):
                 The query clause to determine if this is entailed by the KB
+            max_steps (Optional[int]):
+                The most inference steps to take before giving up
+            deadline (Optional[float]):
+                The time.monotonic() value at which to give up
         
         Returns:
-            bool:
-                True if the KB entails the query, False otherwise
+            Optional[bool]:
+                True if the KB entails the query, False if not, None if
+                the budget ran out before either could be shown
+        """
+        if self.constraints:
+            return self.ask_many([query], max_steps, deadline)[0]
+        result = self.cache.get(query, self.version)
+        if result is None:
+            budget = InferenceBudget(max_steps, deadline)
+            result = self._compiled_entails(query)
+            if result is None:
+                result = False if self.find_countermodel(query, budget) else self._entails(query, budget)
+            if result is not None:
+                self.cache.put(query, result, self.version)
+        elif self.stats.enabled:
+            self.stats.record(query, "cache", result)
+        return result
+    
+    def _entails (self, query: "MazeClause", budget: Optional["InferenceBudget"] = None) -> Optional[bool]:
+        """
+        Decides whether the KB entails the query with the current backend,
+        bypassing the cache (see ask); None if the budget runs out. Records
+        the backend's work in self.stats, if enabled.
         """
-        # [!] TODO: Implement the proof-by-contradiction knowledgebase
-        # query procedure here!
-        #combining query and KB
-        new: set[MazeClause] = set() 
+        start = time.perf_counter() if self.stats.enabled else 0.0
+        # (attempts, resolvents, peak clauses, rounds) for self.stats
+        counters: tuple[int, int, int, int]
+        if self.backend == "cdcl":
+            solver = self.get_solver()
+            solver.max_learned = self.max_derived
+            before = (solver.propagations, solver.num_learned, solver.decisions)
+            satisfiable = solver.solve(self.activations + [solver.lit(-lit) for lit in query.lits], budget)
+            if satisfiable:
+                self.models.add(solver.model)
+            counters = (solver.propagations - before[0], solver.num_learned - before[1], len(solver.clauses), solver.decisions - before[2])
+        else:
+            negated = MazeKnowledgeBase.negate(query)
+            relevant = self._get_component_clauses(abs(lit) for lit in query.lits)
+            if self.backend == "dpll":
+                dpll = DPLLSolver(itertools.chain(relevant, negated))
+                satisfiable = dpll.solve(budget)
+                counters = (dpll.propagations, 0, len(dpll.clauses), dpll.decisions)
+            else:
+                self.prover.max_clauses = self.max_derived
+                refuted = self.prover.refute(relevant, negated, budget)
+                satisfiable = None if refuted is None else not refuted
+                stats = self.prover.stats
+                counters = (stats["attempts"], stats["resolvents"], stats["peak"], stats["given"])
+        result = None if satisfiable is None else not satisfiable
+        if self.stats.enabled:
+            self.stats.record(query, self.backend, result, time.perf_counter() - start, *counters)
+        return result
             
-        clauses = deepcopy(self.clauses)
-        negated = MazeKnowledgeBase.negate(query)
-        clauses= clauses.union(negated)
-        #add negated query to KB
-
-        while True:            
-            for clause1 in clauses:
-                for clause2 in clauses:
-                    resolvents = MazeClause.resolve(clause1, clause2)
-                    if MazeClause([]) in resolvents:
-                        return True
-                    new = new.union(resolvents)
-
-            if new.issubset(clauses):
-                return False
-            clauses = clauses.union(new)
+    def ask_many (self, queries: Sequence["MazeClause"], max_steps: Optional[int] = None, deadline: Optional[float] = None) -> list[Optional[bool]]:
+        """
+        Answers a whole batch of queries, as if by calling ask on each, while
+        sharing the work that does not depend on the query: the literals
+        implied by unit propagation over the KB (kept up to date by tell, see
+        self.forced) settle any query containing an implied literal (entailed)
+        or made only of refuted literals (not entailed, the KB being
+        consistent). The KB is
+        then reduced by those literals, once, and the remaining queries are
+        asked of the (smaller, more finely partitioned) reduced KB, unless
+        the BDDs of self.compiler answer them first (see ask).
+        
+        A single budget (see ask) is shared by the whole batch, so once it
+        runs out every query still needing a search is answered None. If
+        self.stats is enabled, an event is recorded for every query.
+        
+        Parameters:
+            queries (Sequence[MazeClause]):
+                The query clauses to determine if these are entailed by the KB
+            max_steps (Optional[int]):
+                The most inference steps to take, over all queries
+            deadline (Optional[float]):
+                The time.monotonic() value at which to give up
+        
+        Returns:
+            list[Optional[bool]]:
+                For each query in order, True if the KB entails it, False if
+                not, or None if the budget ran out before it was decided
+        """
+        return self._ask_uncached(queries, self._get_cached(queries), max_steps, deadline)
+    
+    def _get_cached (self, queries: Sequence["MazeClause"]) -> list[Optional[bool]]:
+        """
+        Returns the cached answer to each query, or None if there is none
+        valid, recording an event in self.stats (if enabled) for each found.
+        """
+        results: list[Optional[bool]] = [self.cache.get(query, self.version) for query in queries]
+        if self.stats.enabled:
+            for query, result in zip(queries, results):
+                if result is not None:
+                    self.stats.record(query, "cache", result)
+        return results
+    
+    def _ask_uncached (self, queries: Sequence["MazeClause"], results: list[Optional[bool]],
+                       max_steps: Optional[int] = None, deadline: Optional[float] = None) -> list[Optional[bool]]:
+        """
+        As ask_many, given the answers found in the cache (see _get_cached):
+        answers the queries whose result is None, in place, and returns results.
+        """
+        if all(result is not None for result in results):
+            return results
+        
+        budget = InferenceBudget(max_steps, deadline)
+        implied = self._get_implied_ids()
+        residual: Optional[MazeKnowledgeBase] = None
+        for i, query in enumerate(queries):
+            if results[i] is not None:
+                continue
+            if implied is None or any(implied.get(abs(lit)) == (lit > 0) for lit in query.lits):
+                results[i] = True
+                if self.stats.enabled:
+                    self.stats.record(query, "implied", True)
+            elif all(abs(lit) in implied for lit in query.lits):
+                results[i] = False
+                if self.stats.enabled:
+                    self.stats.record(query, "implied", False)
+            elif self._compiler is not None and (compiled := self._compiled_entails(query)) is not None:
+                results[i] = compiled
+            elif budget.exhausted:
+                if self.stats.enabled:
+                    self.stats.record(query, "budget", None)
+                continue
+            elif self.find_countermodel(query, budget):
+                results[i] = False
+            elif self.backend == "cdcl":
+                results[i] = self._entails(query, budget)
+            else:
+                if residual is None:
+                    residual = self._new_like()
+                    residual.stats = self.stats
+                    for clause in MazeKnowledgeBase.reduce_clauses(self.clauses, implied):
+                        residual.tell(clause)
+                    for constraint in self.constraints:
+                        remaining = constraint.reduce(implied)
+                        if remaining is not None:
+                            residual.tell_exactly(remaining.props, remaining.k)
+                results[i] = residual._entails(MazeClause.from_lits(lit for lit in query.lits if abs(lit) not in implied), budget)
+            if results[i] is not None:
+                self.cache.put(query, bool(results[i]), self.version)
+        return results
+    
+    def _compiled_entails (self, query: "MazeClause") -> Optional[bool]:
+        """
+        Decides whether the KB entails the query from the BDDs of the query's
+        components (see compiler), recording the answer in self.stats if
+        enabled; None if there is no compiler or a component did not fit.
+        """
+        if self._compiler is None:
+            return None
+        start = time.perf_counter() if self.stats.enabled else 0.0
+        result = self._compiler.entails(self, query)
+        if result is not None and self.stats.enabled:
+            self.stats.record(query, "bdd", result, time.perf_counter() - start)
+        return result
+    
+    def _new_like (self) -> "MazeKnowledgeBase":
+        """
+        Returns an empty KB with this one's settings: its backend, cap on
+        derived clauses (max_derived) and WalkSAT flips (walk_flips).
+        """
+        kb = MazeKnowledgeBase(backend = self.backend)
+        kb.max_derived = self.max_derived
+        kb.walk_flips = self.walk_flips
+        return kb
+    
+    def find_countermodel (self, query: "MazeClause", budget: Optional["InferenceBudget"] = None) -> bool:
+        """
+        Tries to show that the KB does not entail the query by a model of the KB
+        that falsifies it: one already in self.models, or else one found by
+        WalkSAT within self.walk_flips flips, with the query's props held false.
+        WalkSAT only searches the query's components, starting from the latest
+        cached model (or over the whole KB, if none is cached), and the model
+        it finds is cached. Records an event in self.stats if successful.
+        
+        Parameters:
+            query (MazeClause):
+                The query clause that the KB may not entail
+            budget (Optional[InferenceBudget]):
+                Limits on the search, spent one step per flip
+        
+        Returns:
+            bool:
+                True if a model falsifying the query was found, so that the KB
+                does not entail it; False if none was found (always, if
+                walk_flips is None), which shows nothing
+        """
+        if self.walk_flips is None or query.is_valid():
+            return False
+        start = time.perf_counter() if self.stats.enabled else 0.0
+        flips = 0
+        model = self.models.falsifying(query)
+        if model is None and self.walk_flips > 0 and not (budget is not None and budget.exhausted):
+            fixed = {abs(lit): lit < 0 for lit in query.lits}
+            base = self.models.models[-1] if self.models else None
+            walk: WalkSAT
+            if base is None:
+                walk = WalkSAT(self.clauses, self.constraints, self.version)
+            else:
+                roots = {self.prop_union.find(prop_id) for prop_id in fixed if prop_id in self.prop_union}
+                walk = WalkSAT(itertools.chain.from_iterable(self.components.get(root, ()) for root in roots),
+                               [constraint for constraint in self.constraints if self.prop_union.find(constraint.ids[0]) in roots], self.version)
+            found = walk.find_model(base or {}, fixed, self.walk_flips, budget)
+            flips = walk.flips
+            if found is not None:
+                # The components searched are reassigned; the rest keep the base model's values
+                model = dict(base or {})
+                model.update(found)
+                self.models.add(model)
+        if model is not None and self.stats.enabled:
+            self.stats.record(query, "models", False, time.perf_counter() - start, rounds = flips)
+        return model is not None
+    
+    def get_implied_literals (self) -> Optional[dict[tuple, bool]]:
+        """
+        Returns the literals implied by unit propagation over the KB, i.e.,
+        those forced by the unit clauses and, transitively, by any clause that
+        all but one of the forced literals falsify, or by counting over any
+        cardinality constraint (see CardinalityConstraint.propagate). These
+        are maintained as clauses are told (see self.forced), so this only
+        converts them to props.
+        
+        Returns:
+            Optional[dict[tuple, bool]]:
+                The implied props mapped to their forced truth values, or None
+                if unit propagation alone derives a contradiction
+        """
+        implied = self._get_implied_ids()
+        if implied is None:
+            return None
+        return {SYMBOLS.prop_of(prop_id): truth_val for prop_id, truth_val in implied.items()}
+    
+    def _get_implied_ids (self) -> Optional[dict[int, bool]]:
+        """
+        As get_implied_literals, but with the implied props given by id (and
+        without copying self.forced, which must not be modified).
+        """
+        return None if self.contradiction else self.forced
+    
+    @staticmethod
+    def reduce_clauses (clauses: Iterable["MazeClause"], implied: dict[int, bool]) -> set["MazeClause"]:
+        """
+        Simplifies clauses by a set of known literals: clauses they satisfy are
+        dropped and the literals they falsify are removed from the rest.
+        
+        Parameters:
+            clauses (Iterable[MazeClause]):
+                The clauses being reduced
+            implied (dict[int, bool]):
+                Known prop ids (see SymbolTable) mapped to their truth values
+        
+        Returns:
+            set[MazeClause]:
+                The reduced clauses, mentioning none of the known props
+        """
+        reduced: set[MazeClause] = set()
+        for clause in clauses:
+            if any(implied.get(abs(lit)) == (lit > 0) for lit in clause.lits):
+                continue
+            reduced.add(MazeClause.from_lits(lit for lit in clause.lits if abs(lit) not in implied))
+        return reduced
+    
+    def get_solver (self) -> "CDCLSolver":
+        """
+        Returns the KB's incremental CDCL solver, first loading it with every
+        clause in the KB if it does not exist yet. The solver only ever gains
+        clauses: those later removed from the KB stay in it, being subsumed or
+        implied by what replaced them (or, once eliminated, only bearing on the
+        propositions forgotten; see eliminate).
+        
+        Returns:
+            CDCLSolver:
+                The solver holding (at least) every clause of this KB
+        """
+        if self.solver is None:
+            self.solver = CDCLSolver()
+            # The clauses from before any open scope (found by undoing the trail
+            # on copies) are added for good, and each scope's under its activation
+            clauses, constraints = set(self.clauses), set(self.constraints)
+            for operation, item in reversed(self.trail):
+                if operation in ("clause+", "clause-"):
+                    (clauses.discard if operation == "clause+" else clauses.add)(item)
+                elif operation in ("constraint+", "constraint-"):
+                    (constraints.discard if operation == "constraint+" else constraints.add)(item)
+            for clause in clauses:
+                self.solver.add_clause(clause)
+            for constraint in constraints:
+                for clause in constraint.to_clauses():
+                    self.solver.add_clause(clause)
+            bounds = [mark for mark, _ in self.scopes] + [len(self.trail)]
+            for i in range(len(self.scopes)):
+                activation = self.solver.new_activation()
+                self.activations.append(activation)
+                for operation, item in self.trail[bounds[i]:bounds[i + 1]]:
+                    if operation == "clause+":
+                        self.solver.add_clause(item, activation)
+                    elif operation == "constraint+":
+                        for clause in item.to_clauses():
+                            self.solver.add_clause(clause, activation)
+        return self.solver
+    
+    def save (self, path: str) -> None:
+        """
+        Checkpoints the KB's clauses, constraints, simplified props and
+        settings to a compact binary file (see KBSnapshot), from which load
+        restores an equivalent KB, e.g., in a worker restarted mid-game.
+        Everything told inside open scopes is saved as if told for good, and
+        what the KB can rebuild (its solver, cache and models) is not saved.
+        
+        Parameters:
+            path (str):
+                The file to write, replaced atomically if it exists
+        """
+        KBSnapshot.write(path, self)
+    
+    @staticmethod
+    def load (path: str, use_mmap: bool = True) -> "MazeKnowledgeBase":
+        """
+        Restores a KB checkpointed by save. The stored clauses are already
+        free of subsumption, so they are stored straight away rather than
+        told, and only propagated (see self.forced).
+        
+        Parameters:
+            path (str):
+                The file written by save
+            use_mmap (bool):
+                Whether to map the file, reading its arrays in place, rather
+                than reading it into memory first
+        
+        Returns:
+            MazeKnowledgeBase:
+                A KB holding what the saved one did
+        
+        Raises:
+            ValueError: if the file is not a snapshot that this version can read
+        """
+        with KBSnapshot.read(path, use_mmap) as snapshot:
+            return MazeKnowledgeBase.restore(snapshot)
+    
+    @staticmethod
+    def restore (snapshot: "KBSnapshot") -> "MazeKnowledgeBase":
+        """
+        Builds the KB held in a snapshot, read from a file by load or decoded
+        from bytes (see KBSnapshot.decode); see load.
+        """
+        kb = MazeKnowledgeBase(backend = snapshot.backend)
+        kb.walk_flips = snapshot.walk_flips
+        kb.max_derived = snapshot.max_derived
+        ids = snapshot.get_ids()
+        for clause in snapshot.get_clauses(ids):
+            kb._add_clause(clause)
+        for constraint in snapshot.get_constraints():
+            kb._add_constraint(constraint)
+        kb.simplified = snapshot.get_simplified(ids)
+        return kb
+    
+    def get_usage (self) -> dict[str, int]:
+        """
+        Reports the size of the clause database, as counts, so that its growth
+        can be checked against max_derived over a long game.
+        
+        Returns:
+            dict[str, int]:
+                - told:        clauses stored in the KB (never evicted)
+                - constraints: cardinality constraints stored in the KB
+                - learned:     learned clauses held by the CDCL solver
+                - solver:      every clause held by the CDCL solver
+                - deleted:     clauses the CDCL solver has deleted so far
+                - peak:        most clauses held during the last refutation
+                - evicted:     resolvents evicted during the last refutation
+                - cached:      answers held in the cache
+                - models:      models held in self.models
+                - compiled:    BDD nodes held by self.compiler, if any
+        """
+        solver = self.solver
+        return {
+            "told": len(self.clauses),
+            "constraints": len(self.constraints),
+            "learned": 0 if solver is None else len(solver.clause_activity),
+            "solver": 0 if solver is None else len(solver.clauses),
+            "deleted": 0 if solver is None else solver.num_deleted,
+            "peak": self.prover.stats["peak"],
+            "evicted": self.prover.stats["evicted"],
+            "cached": len(self.cache),
+            "models": len(self.models),
+            "compiled": 0 if self._compiler is None else self._compiler.get_nodes(),
+        }
             
     def __len__ (self) -> int:
         """
@@ -130,13 +1005,102 @@ class MazeKnowledgeBase:
             The KB can thus be condensed to:
             KB = {(P(1,1)) ^ (P(1,2))}
         
+        Simplification is incremental: only locations not simplified by before
+        (see self.simplified) are processed, and for each only the clauses and
+        constraints mentioning it are touched, found through self.occurrences
+        and self.constraint_occurrences. Each location's unit clause is told
+        (which removes every clause it satisfies, by subsumption), the opposite
+        literal is struck from the clauses containing it, and constraints over
+        it are replaced by their residuals (or by unit clauses, if the residual
+        forces every one of its props). The result is equivalent to the
+        KB before, so cached answers and the CDCL solver stay valid, and the
+        KB stays bounded by roughly one unit clause per known location.
+        
         Paramters:
             known_pits (set[tuple[int, int]]):
                 The known locations of pits in the maze
             known_safe (set[tuple[int, int]]):
                 The known locations of safe tiles (i.e., not containing pits) in the maze
         """
-        self.clauses = MazeKnowledgeBase.simplify_from_known_locs(self.clauses, known_pits, known_safe)
+        new_lits = [SYMBOLS.lit(("P", loc), True) for loc in known_pits] + [SYMBOLS.lit(("P", loc), False) for loc in known_safe]
+        for lit in new_lits:
+            prop_id = abs(lit)
+            if prop_id in self.simplified:
+                continue
+            self.simplified[prop_id] = lit > 0
+            if self.scopes:
+                self.trail.append(("simplified", prop_id))
+            self.tell(MazeClause.from_lits([lit]))
+            for clause in list(self.occurrences.get(-lit, ())):
+                self._remove_clause(clause, entailed = True)
+                self.tell(MazeClause.from_lits(other for other in clause.lits if other != -lit))
+            for constraint in list(self.constraint_occurrences.get(prop_id, ())):
+                self._remove_constraint(constraint, entailed = True)
+                remaining = constraint.reduce(self.simplified)
+                if remaining is None:
+                    if constraint.propagate(self.simplified) is None:
+                        self.tell(MazeClause([]))
+                elif remaining.k == 0 or remaining.k == len(remaining):
+                    # None or all of the rest are true, as plain unit clauses
+                    for rest in remaining.ids:
+                        self.tell(MazeClause.from_lits([rest if remaining.k > 0 else -rest]))
+                else:
+                    self.tell_exactly(remaining.props, remaining.k)
+    
+    def eliminate (self, keep: Iterable[tuple], max_growth: int = 0, max_pairs: int = 64) -> int:
+        """
+        Compacts the KB by Davis-Putnam variable elimination: each proposition
+        not kept (nor in a cardinality constraint) is forgotten by replacing the
+        clauses containing it with all of their non-valid resolvents upon it,
+        provided that this adds at most max_growth clauses to the KB. The KB
+        then entails exactly what it did about the propositions remaining, so
+        eliminating whatever no longer bears on any query keeps the KB in
+        proportion to what still matters, e.g., the agent's frontier.
+        
+        Propositions are tried fewest resolution pairs first, skipping any with
+        more than max_pairs, and resolvents are stored with subsumption (as by
+        tell). The CDCL solver keeps the clauses eliminated, which only entail
+        more about the propositions forgotten, but the cache is cleared, since
+        answers about those may no longer follow from the KB.
+        
+        Parameters:
+            keep (Iterable[tuple]):
+                The propositions that must not be eliminated, e.g., ("P", (1, 1))
+            max_growth (int):
+                The most clauses that eliminating one proposition may add
+            max_pairs (int):
+                The most (positive, negative) clause pairs resolved per proposition
+        
+        Returns:
+            int:
+                The number of propositions eliminated
+        """
+        if MazeClause([]) in self.clauses:
+            return 0
+        kept = {SYMBOLS.ids[prop] for prop in keep if prop in SYMBOLS}
+        candidates = {abs(lit) for lit in self.occurrences} - kept - self.constraint_occurrences.keys()
+        pairs = lambda prop_id: len(self.occurrences.get(prop_id, ())) * len(self.occurrences.get(-prop_id, ()))
+        eliminated = 0
+        for prop_id in sorted(candidates, key = pairs):
+            pos, neg = list(self.occurrences.get(prop_id, ())), list(self.occurrences.get(-prop_id, ()))
+            if len(pos) + len(neg) == 0 or len(pos) * len(neg) > max_pairs:
+                continue
+            resolvents = {resolvent for p in pos for n in neg for resolvent in MazeClause.resolve(p, n)}
+            if len(resolvents) > len(pos) + len(neg) + max_growth:
+                continue
+            for clause in pos + neg:
+                self._remove_clause(clause)
+            for resolvent in resolvents:
+                if resolvent in self.clauses or self.is_subsumed(resolvent):
+                    continue
+                for subsumed in self.get_subsumed(resolvent):
+                    self._remove_clause(subsumed)
+                self._add_clause(resolvent)
+            eliminated += 1
+        if eliminated > 0:
+            self.version += 1
+            self.cache.clear()
+        return eliminated
     
     @staticmethod
     def simplify_from_known_locs (clauses: set["MazeClause"], known_pits: set[tuple[int, int]], known_safe: set[tuple[int, int]]) -> set["MazeClause"]:
@@ -190,7 +1154,7 @@ class MazeKnowledgeBase:
                 continue
             if clause.get_prop(("P", loc)) == is_pit:
                 to_rem.add(clause)
-                break
+                continue
             to_add.update(MazeClause.resolve(clause, sani_clause))
             
         clauses = clauses | to_add
@@ -1,7 +1,21 @@
 from environment import *
 from maze_clause import *
 from maze_knowledge_base import *
+from maze_cardinality import *
+from maze_pit_probability import *
+from maze_linear_constraints import *
+from maze_symbols import *
+from maze_clause_matrix import *
+from maze_local_search import *
+from maze_parallel import *
+from maze_bdd import *
+from maze_snapshot import *
 from copy import deepcopy
+import itertools
+import os
+import tempfile
+import time
+import random
 import unittest
 
 class MazeKnowledgeTests(unittest.TestCase):
@@ -87,6 +101,605 @@ class MazeKnowledgeTests(unittest.TestCase):
         kb.tell(MazeClause([(("X", (0, 0)), False)]))
         self.assertTrue(kb.ask(MazeClause([(("Y", (0, 0)), True)])))
 
+    def test_mazekb_given_clause_stats(self) -> None:
+        kb = MazeKnowledgeBase()
+        kb.tell(MazeClause([(("X", (1, 1)), False), (("Y", (1, 1)), True)]))
+        kb.tell(MazeClause([(("Y", (1, 1)), False), (("Z", (1, 1)), True)]))
+        kb.tell(MazeClause([(("A", (2, 2)), True), (("B", (2, 2)), True)]))
+        kb.tell(MazeClause([(("X", (1, 1)), True)]))
+        self.assertTrue(kb.ask(MazeClause([(("Z", (1, 1)), True)])))
+        # The unrelated (A v B) clause never clashes with anything, so it is never resolved
+        self.assertGreater(kb.prover.stats["skipped"], 0)
+        self.assertGreater(kb.prover.stats["attempts"], 0)
+
+    @unittest.skipUnless(HAVE_NUMPY, "the matrix kernel requires NumPy")
+    def test_matrix_prover(self) -> None:
+        # The matrix kernel agrees with the pure-Python loop, clause set by clause set
+        rng = random.Random(3)
+        ids = [SYMBOLS.id_of(("M", (i, 0))) for i in range(5)]
+        prover, reference = MatrixProver(), GivenClauseProver()
+        for _ in range(20):
+            kb = [MazeClause.from_lits(rng.choice((1, -1)) * prop_id for prop_id in rng.sample(ids, rng.choice((2, 3)))) for _ in range(16)]
+            query = MazeClause.from_lits([rng.choice((1, -1)) * rng.choice(ids)])
+            self.assertEqual(reference.refute(kb, [query]), prover.refute(kb, [query]))
+        
+        # Resolvents are the sign of the sum of each singly-clashing row with the clause
+        X, Y, Z = ("X", (1, 1)), ("Y", (1, 1)), ("Z", (1, 1))
+        matrix = ClauseMatrix(SYMBOLS.id_of(prop) for prop in (X, Y, Z))
+        matrix.add_clauses([MazeClause([(X, True), (Y, True)]), MazeClause([(X, True), (Y, False)]),
+                            MazeClause([(X, True), (Z, True)]), MazeClause([(Z, True)])])
+        resolvents, partners = matrix.resolve_against(matrix.encode(MazeClause([(X, False), (Y, True)])))
+        self.assertEqual(2, partners)
+        self.assertEqual({MazeClause([(Y, True)]), MazeClause([(Y, True), (Z, True)])}, {matrix.decode(row) for row in resolvents})
+
+    def test_mazekb_dpll_backend(self) -> None:
+        kb = MazeKnowledgeBase(backend = "dpll")
+        kb.tell(MazeClause([(("X", (0, 0)), True), (("Z", (0, 0)), True), (("Y", (0, 0)), True)]))
+        kb.tell(MazeClause([(("Z", (0, 0)), False), (("W", (0, 0)), True), (("X", (0, 0)), True)]))
+        kb.tell(MazeClause([(("X", (0, 0)), False), (("W", (0, 0)), True)]))
+        kb.tell(MazeClause([(("W", (0, 0)), False)]))
+        kb.tell(MazeClause([(("X", (0, 0)), False)]))
+        self.assertTrue(kb.ask(MazeClause([(("Y", (0, 0)), True)])))
+        self.assertFalse(kb.ask(MazeClause([(("Z", (0, 0)), True)])))
+        
+        # Backends can be switched on an existing KB
+        kb.backend = "resolution"
+        self.assertTrue(kb.ask(MazeClause([(("Y", (0, 0)), True)])))
+        with self.assertRaises(ValueError):
+            kb.backend = "magic"
+
+    def test_mazekb_cdcl_incremental(self) -> None:
+        kb = MazeKnowledgeBase(backend = "cdcl")
+        kb.tell(MazeClause([(("R", (1, 1)), False), (("S", (1, 1)), True)]))
+        self.assertFalse(kb.ask(MazeClause([(("S", (1, 1)), True)])))
+        solver = kb.get_solver()
+        
+        # Later tells are added to the same solver rather than rebuilding it
+        kb.tell(MazeClause([(("R", (1, 1)), True)]))
+        self.assertTrue(kb.ask(MazeClause([(("S", (1, 1)), True)])))
+        self.assertFalse(kb.ask(MazeClause([(("S", (1, 1)), False)])))
+        self.assertIs(solver, kb.get_solver())
+        
+        # Copies of the KB carry an independent copy of the solver
+        kb2 = deepcopy(kb)
+        kb2.tell(MazeClause([(("T", (1, 1)), True)]))
+        self.assertTrue(kb2.ask(MazeClause([(("T", (1, 1)), True)])))
+        self.assertFalse(kb.ask(MazeClause([(("T", (1, 1)), True)])))
+
+    def test_mazekb_derived_cap(self) -> None:
+        # Capping the solver's learned clauses changes no answer, and never evicts a told clause
+        rng = random.Random(19)
+        props = [("G", (i, 0)) for i in range(14)]
+        capped, free = MazeKnowledgeBase(backend = "cdcl"), MazeKnowledgeBase(backend = "cdcl")
+        capped.max_derived = 2
+        for _ in range(52):
+            clause = MazeClause([(prop, rng.random() < 0.5) for prop in rng.sample(props, 3)])
+            capped.tell(clause)
+            free.tell(clause)
+        queries = [MazeClause([(prop, truth_val)]) for prop in props for truth_val in (True, False)]
+        self.assertEqual([free.ask(query) for query in queries], [capped.ask(query) for query in queries])
+        usage = capped.get_usage()
+        self.assertGreater(usage["deleted"], 0)
+        self.assertEqual(52, usage["told"])
+        self.assertLessEqual(usage["learned"], free.get_usage()["learned"])
+
+        # A refutation that saturates only after evicting resolvents is inconclusive
+        kb = [MazeClause([(prop, rng.random() < 0.5) for prop in rng.sample(props[:6], 3)]) for _ in range(12)]
+        query = [MazeClause([(props[0], False)])]
+        self.assertFalse(GivenClauseProver().refute(kb, query))
+        capped_prover = GivenClauseProver(max_clauses = 20)
+        self.assertIsNone(capped_prover.refute(kb, query))
+        self.assertGreater(capped_prover.stats["evicted"], 0)
+        self.assertLessEqual(capped_prover.stats["peak"], 20)
+        chain = [MazeClause([(props[i], False), (props[i + 1], True)]) for i in range(5)] + [MazeClause([(props[0], True)])]
+        self.assertTrue(GivenClauseProver(max_clauses = 16).refute(chain, [MazeClause([(props[5], False)])]))
+
+        # Batches asked of the reduced KB (see ask_many) are held to the same cap
+        for max_derived, expected in ((3, None), (None, True)):
+            kb2 = MazeKnowledgeBase()
+            kb2.max_derived = max_derived
+            kb2.tell(MazeClause([(props[0], True), (props[1], True)]))
+            kb2.tell(MazeClause([(props[0], False), (props[2], True)]))
+            kb2.tell(MazeClause([(props[1], False), (props[2], True)]))
+            kb2.tell_exactly(props[3:6], 1)
+            self.assertEqual([expected], kb2.ask_many([MazeClause([(props[2], True)])]))
+
+    def test_mazekb_local_search(self) -> None:
+        # WalkSAT satisfies clauses and "exactly k" constraints together, keeping fixed props
+        A, B, C, D = [SYMBOLS.id_of(("L", (i, 0))) for i in range(4)]
+        walk = WalkSAT([MazeClause.from_lits([A, B]), MazeClause.from_lits([-A, C])], [CardinalityConstraint([("L", (i, 0)) for i in range(4)], 2)])
+        model = walk.find_model({}, {A: True}, 1000)
+        self.assertIsNotNone(model)
+        assert model is not None
+        self.assertTrue(model[A] and model[C] and not model[B] and not model[D])
+        self.assertIsNone(WalkSAT([MazeClause.from_lits([A])]).find_model({}, {A: False}, 1000))
+
+        # Cached models are extended by what is told, or dropped if they contradict it
+        cache = ModelCache()
+        cache.add({A: True, B: False})
+        cache.add({A: False, B: False})
+        cache.tell(MazeClause.from_lits([-A, C]))
+        self.assertEqual([{A: True, B: False, C: True}, {A: False, B: False}], cache.models)
+        self.assertTrue(cache.disagree(A))
+        cache.tell(MazeClause.from_lits([B, -C]))
+        self.assertEqual([{A: False, B: False, C: False}], cache.models)
+
+        # Queries falsified by a model are answered without a proof, and the rest still proven
+        rng = random.Random(20)
+        symbols = [("P", (x, 1)) for x in range(5)]
+        for trial in range(30):
+            kb = MazeKnowledgeBase(backend = MazeKnowledgeBase.BACKENDS[trial % len(MazeKnowledgeBase.BACKENDS)])
+            kb.walk_flips = 50
+            kb.stats.enabled = True
+            raw = [[(rng.choice(symbols), rng.random() < 0.5) for _ in range(rng.randint(1, 3))] for _ in range(rng.randint(2, 6))]
+            for lits in raw:
+                kb.tell(MazeClause(lits))
+            models = [dict(zip(symbols, vals)) for vals in itertools.product([True, False], repeat=len(symbols))]
+            models = [m for m in models if all(any(m[p] == v for p, v in lits) for lits in raw)]
+            if not models:
+                continue
+            for prop in symbols:
+                for truth_val in (True, False):
+                    self.assertEqual(all(m[prop] == truth_val for m in models), kb.ask(MazeClause([(prop, truth_val)])))
+            self.assertGreater(kb.stats.by_source.get("models", 0), 0)
+
+    def test_mazekb_eliminate(self) -> None:
+        A, B, C = ("E", (0, 0)), ("E", (1, 0)), ("E", (2, 0))
+        kb = MazeKnowledgeBase()
+        kb.tell(MazeClause([(A, False), (B, True)]))
+        kb.tell(MazeClause([(B, False), (C, True)]))
+        kb.tell(MazeClause([(A, True)]))
+
+        # Forgetting A and B leaves what they implied about C, and can be undone
+        kb.push()
+        self.assertEqual(2, kb.eliminate([C]))
+        self.assertEqual({MazeClause([(C, True)])}, kb.clauses)
+        self.assertTrue(kb.ask(MazeClause([(C, True)])))
+        kb.pop()
+        self.assertEqual(3, len(kb))
+        
+        # Answers about the props forgotten are not served from the cache afterwards
+        query = MazeClause([(B, True)])
+        self.assertTrue(kb.ask(query))
+        kb.eliminate([C])
+        answer = kb.ask(query)
+        kb.cache.clear()
+        self.assertEqual(kb.ask(query), answer)
+        self.assertFalse(answer)
+
+        # Eliminations that would grow the KB are skipped
+        X = [("E", (x, 1)) for x in range(4)]
+        kb = MazeKnowledgeBase()
+        for i in range(3):
+            kb.tell(MazeClause([(X[0], True), (X[i + 1], True)]))
+        kb.tell(MazeClause([(X[0], False), (A, True)]))
+        kb.tell(MazeClause([(X[0], False), (C, True)]))
+        self.assertEqual(0, kb.eliminate(X[1:] + [A, C]))
+        self.assertEqual(1, kb.eliminate(X[1:] + [A, C], max_growth = 1))
+        self.assertEqual(6, len(kb))
+        self.assertTrue(kb.ask(MazeClause([(X[2], True), (C, True)])))
+
+    def test_mazekb_forced(self) -> None:
+        a, b, c, d, e = [("F", (x, 0)) for x in range(5)]
+        ids = {prop: SYMBOLS.id_of(prop) for prop in (a, b, c, d, e)}
+        kb = MazeKnowledgeBase()
+        kb.tell(MazeClause([(a, False), (b, True)]))
+        kb.tell(MazeClause([(b, False), (c, True), (d, True)]))
+        self.assertEqual({}, kb.forced)
+
+        # Telling propagates through the clauses and constraints, and pop undoes it
+        kb.push()
+        kb.tell(MazeClause([(a, True)]))
+        self.assertEqual({ids[a]: True, ids[b]: True}, kb.forced)
+        kb.tell(MazeClause([(c, False)]))
+        kb.tell_exactly([d, e], 1)
+        self.assertEqual({a: True, b: True, c: False, d: True, e: False}, kb.get_implied_literals())
+        kb.tell(MazeClause([(e, True), (b, False)]))
+        self.assertTrue(kb.contradiction)
+        self.assertIsNone(kb.get_implied_literals())
+        kb.pop()
+        self.assertEqual({}, kb.forced)
+        self.assertFalse(kb.contradiction)
+
+        # Everything forced is entailed
+        rng = random.Random(22)
+        symbols = [("P", (x, 2)) for x in range(5)]
+        for _ in range(40):
+            kb = MazeKnowledgeBase()
+            raw = [[(rng.choice(symbols), rng.random() < 0.5) for _ in range(rng.randint(1, 2))] for _ in range(rng.randint(2, 8))]
+            for lits in raw:
+                kb.tell(MazeClause(lits))
+            models = [dict(zip(symbols, vals)) for vals in itertools.product([True, False], repeat=len(symbols))]
+            models = [m for m in models if all(any(m[p] == v for p, v in lits) for lits in raw)]
+            implied = kb.get_implied_literals()
+            if implied is None:
+                self.assertEqual([], models)
+                continue
+            for prop, truth_val in implied.items():
+                self.assertTrue(all(m[prop] == truth_val for m in models))
+
+    def test_mazekb_compiler(self) -> None:
+        a, b, c, d, e = [("B", (x, 0)) for x in range(5)]
+        kb = MazeKnowledgeBase()
+        kb.tell(MazeClause([(a, False), (b, True), (c, True)]))
+        kb.tell_exactly([b, c, d], 1)
+        kb.compiler = KnowledgeCompiler()
+        kb.stats.enabled = True
+        self.assertFalse(kb.ask(MazeClause([(b, True), (c, True)])))
+        self.assertEqual({"bdd": 1}, kb.stats.by_source)
+        
+        # Tells are conjoined into the compiled diagram, which subsumption keeps
+        kb.tell(MazeClause([(a, True)]))
+        kb.tell(MazeClause([(a, True), (e, True)]))
+        self.assertTrue(kb.ask(MazeClause([(b, True), (c, True)])))
+        self.assertTrue(kb.ask(MazeClause([(d, False)])))
+        self.assertEqual(1, kb.compiler.stats["compiles"])
+        self.assertGreater(kb.get_usage()["compiled"], 0)
+        
+        # Forgetting a prop recompiles its component, and pop undoes what it told
+        kb.push()
+        kb.tell(MazeClause([(b, True)]))
+        self.assertTrue(kb.ask(MazeClause([(c, False)])))
+        kb.pop()
+        self.assertFalse(kb.ask(MazeClause([(c, False)])))
+        self.assertEqual(2, kb.compiler.stats["compiles"])
+        
+        # Components over the node cap are left to the backend
+        kb.compiler = KnowledgeCompiler(max_nodes = 4)
+        self.assertTrue(kb.ask(MazeClause([(b, True), (c, True), (e, True)])))
+        self.assertEqual(1, kb.compiler.stats["overflows"])
+        
+        # Weighted model counts give the same pit probabilities as enumeration
+        rng = random.Random(24)
+        locs = [(x, 24) for x in range(9)]
+        for _ in range(10):
+            kb = MazeKnowledgeBase()
+            kb.compiler = KnowledgeCompiler()
+            for _ in range(3):
+                near = rng.sample(locs, 3)
+                kb.tell_exactly([("P", loc) for loc in near], rng.randint(0, 2))
+            expected = PitProbability().get_probabilities(kb.constraints, locs, set(), set())
+            counted = kb.compiler.marginals(kb, [SYMBOLS.id_of(("P", loc)) for loc in locs], lambda prop_id: PitProbability.DEFAULT_DENSITY)
+            for loc in locs:
+                if SYMBOLS.id_of(("P", loc)) in counted:
+                    self.assertAlmostEqual(expected[loc], counted[SYMBOLS.id_of(("P", loc))])
+
+    def test_mazekb_snapshot(self) -> None:
+        a, b, c, d, e = [("S", (x, 0)) for x in range(5)]
+        kb = MazeKnowledgeBase(backend = "cdcl")
+        kb.walk_flips, kb.max_derived = 50, None
+        kb.tell(MazeClause([(a, False), (b, True), (c, True)]))
+        kb.tell_exactly([c, d, e], 2)
+        kb.tell(MazeClause([(("P", (5, 5)), True)]))
+        kb.simplify_self({(5, 5)}, set())
+        kb.push()
+        kb.tell(MazeClause([(a, True)]))
+        queries = [MazeClause([(prop, truth_val)]) for prop in (a, b, c, d, e) for truth_val in (True, False)]
+        
+        # Either way of loading restores the clauses, constraints and settings
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "kb.mzkb")
+            kb.save(path)
+            for use_mmap in (True, False):
+                loaded = MazeKnowledgeBase.load(path, use_mmap)
+                self.assertEqual(kb.clauses, loaded.clauses)
+                self.assertEqual(kb.constraints, loaded.constraints)
+                self.assertEqual(kb.simplified, loaded.simplified)
+                self.assertEqual(kb.forced, loaded.forced)
+                self.assertEqual(("cdcl", 50, None), (loaded.backend, loaded.walk_flips, loaded.max_derived))
+                self.assertEqual(kb.ask_many(queries), loaded.ask_many(queries))
+                
+                # The loaded KB goes on as usual
+                loaded.tell_exactly([b, c, d], 1)
+                self.assertTrue(loaded.ask(MazeClause([(b, False)])))
+            
+            with open(path, "wb") as file:
+                file.write(b"not a snapshot")
+            with self.assertRaises(ValueError):
+                MazeKnowledgeBase.load(path)
+
+    def test_parallel_asker(self) -> None:
+        kb = MazeKnowledgeBase(backend = "cdcl")
+        a, b, c, d = [("P", (x, 3)) for x in range(4)]
+        kb.tell_exactly([a, b, c], 1)
+        kb.tell(MazeClause([(a, False), (d, True)]))
+        kb.tell(MazeClause([(c, False)]))
+        queries = [MazeClause([(prop, truth_val)]) for prop in (a, b, c, d) for truth_val in (True, False)]
+        expected = deepcopy(kb).ask_many(queries)
+        
+        # Snapshots hold only the KB's own props, not every prop interned so far
+        SYMBOLS.id_of(("P", (9, 9)))
+        with KBSnapshot.decode(ParallelAsker.snapshot(kb)) as snapshot:
+            self.assertEqual({a, b, c, d}, set(snapshot.props))
+        
+        # Small KBs are answered serially, without starting the pool
+        asker = ParallelAsker(2)
+        self.assertEqual(expected, asker.ask_many(deepcopy(kb), queries))
+        self.assertIsNone(asker.pool)
+        
+        # Workers rebuild the KB from its snapshot and agree with it, their answers being
+        # cached, and their events recorded; each query is looked up in the cache once
+        asker = ParallelAsker(2, min_clauses = 0)
+        try:
+            kb.stats = InferenceStats(enabled = True)
+            self.assertEqual(expected, asker.ask_many(kb, queries))
+            self.assertEqual((0, len(queries)), (kb.cache.hits, kb.cache.misses))
+            self.assertEqual(len(queries), kb.stats.totals["queries"])
+            self.assertNotIn("cache", kb.stats.by_source)
+            self.assertEqual(expected, [kb.cache.get(query, kb.version) for query in queries])
+            
+            # The snapshot is only taken again once the KB changes
+            kb.cache.clear()
+            self.assertEqual(expected, asker.ask_many(kb, queries))
+            self.assertEqual(1, asker.snapshots)
+            kb.tell(MazeClause([(b, False)]))
+            self.assertEqual([False, True], asker.ask_many(kb, queries[2:4]))
+            self.assertEqual(2, asker.snapshots)
+        finally:
+            asker.close()
+
+    def test_mazekb_entailment_cache(self) -> None:
+        kb = MazeKnowledgeBase()
+        kb.tell(MazeClause([(("R", (1, 1)), False), (("S", (1, 1)), True)]))
+        wet = MazeClause([(("S", (1, 1)), True)])
+        self.assertFalse(kb.ask(wet))
+        self.assertFalse(kb.ask(wet))
+        self.assertEqual((1, 1), (kb.cache.hits, kb.cache.misses))
+        
+        # Telling something new invalidates the negative answer...
+        kb.tell(MazeClause([(("R", (1, 1)), True)]))
+        self.assertTrue(kb.ask(wet))
+        self.assertEqual((1, 2), (kb.cache.hits, kb.cache.misses))
+        
+        # ...but positive answers survive later tells
+        kb.tell(MazeClause([(("T", (1, 1)), True)]))
+        self.assertTrue(kb.ask(wet))
+        self.assertEqual((2, 2), (kb.cache.hits, kb.cache.misses))
+        
+        # The cache is bounded, evicting the least recently used answer
+        kb.cache.maxsize = 2
+        kb.ask(MazeClause([(("T", (1, 1)), True)]))
+        kb.ask(MazeClause([(("R", (1, 1)), True)]))
+        self.assertEqual(2, len(kb.cache))
+        self.assertNotIn(wet, kb.cache.entries)
+
+    def test_mazekb_budget(self) -> None:
+        for backend in MazeKnowledgeBase.BACKENDS:
+            kb = MazeKnowledgeBase(backend = backend)
+            kb.tell(MazeClause([(("R", (1, 1)), False), (("S", (1, 1)), True)]))
+            kb.tell(MazeClause([(("R", (1, 1)), True)]))
+            wet = MazeClause([(("S", (1, 1)), True)])
+
+            # Out of steps or out of time, the answer is unknown and not cached...
+            self.assertIsNone(kb.ask(wet, max_steps = 0))
+            self.assertIsNone(kb.ask(wet, deadline = time.monotonic() - 1))
+            self.assertEqual(0, len(kb.cache))
+
+            # ...while a roomy budget gives the usual answers
+            self.assertTrue(kb.ask(wet, max_steps = 1000))
+            self.assertEqual([True, False], kb.ask_many([wet, MazeClause([(("T", (1, 1)), True)])], deadline = time.monotonic() + 5))
+
+    def test_mazekb_simplify_self(self) -> None:
+        kb = MazeKnowledgeBase(backend = "cdcl")
+        kb.tell(MazeClause([(("P", (1, 1)), True), (("P", (2, 1)), False)]))
+        kb.tell(MazeClause([(("P", (1, 1)), False), (("P", (1, 2)), True)]))
+        kb.tell_exactly([("P", (1, 1)), ("P", (3, 1)), ("P", (3, 2))], 2)
+        kb.simplify_self({(1, 1)}, set())
+        self.assertEqual({MazeClause([(("P", (1, 1)), True)]), MazeClause([(("P", (1, 2)), True)])}, kb.clauses)
+        self.assertEqual({CardinalityConstraint([("P", (3, 1)), ("P", (3, 2))], 1)}, kb.constraints)
+        self.assertFalse(kb.ask(MazeClause([(("P", (3, 1)), True)])))
+        
+        # Only newly known locations are processed on later calls
+        kb.simplify_self({(1, 1)}, {(3, 1)})
+        self.assertEqual({SYMBOLS.id_of(("P", (1, 1))): True, SYMBOLS.id_of(("P", (3, 1))): False}, kb.simplified)
+        self.assertEqual(set(), kb.constraints)
+        self.assertIn(MazeClause([(("P", (3, 2)), True)]), kb.clauses)
+        self.assertTrue(kb.ask(MazeClause([(("P", (3, 2)), True)])))
+
+    def test_mazekb_push_pop(self) -> None:
+        A, B, C, D = ("P", (1, 1)), ("P", (1, 2)), ("P", (2, 1)), ("P", (2, 2))
+        for backend in MazeKnowledgeBase.BACKENDS:
+            for solver_first in (False, True):
+                kb = MazeKnowledgeBase(backend = backend)
+                kb.tell(MazeClause([(A, True), (B, True)]))
+                kb.tell(MazeClause([(B, False), (C, True)]))
+                kb.tell_exactly([C, D], 1)
+                if solver_first:
+                    # Otherwise the CDCL solver is first built inside the scope
+                    kb.get_solver()
+                    self.assertFalse(kb.ask(MazeClause([(C, True)])))
+                clauses, constraints = set(kb.clauses), set(kb.constraints)
+                
+                # Hypothetically, if A is safe then B is a pit, so C is one and D is safe
+                kb.push()
+                kb.tell(MazeClause([(A, False)]))
+                self.assertTrue(kb.ask(MazeClause([(C, True)])))
+                kb.push()
+                kb.tell(MazeClause([(D, True)]))
+                self.assertTrue(kb.ask(MazeClause([(A, True)])))
+                kb.pop()
+                self.assertTrue(kb.ask(MazeClause([(D, False)])))
+                kb.pop()
+                
+                # Everything told, removed by subsumption, or cached inside is undone
+                self.assertEqual(clauses, kb.clauses)
+                self.assertEqual(constraints, kb.constraints)
+                self.assertFalse(kb.ask(MazeClause([(C, True)])))
+                self.assertFalse(kb.ask(MazeClause([(D, False)])))
+                kb.push()
+                kb.simplify_self({(1, 2)}, set())
+                self.assertTrue(kb.ask(MazeClause([(D, False)])))
+                kb.pop()
+                self.assertEqual(clauses, kb.clauses)
+                self.assertEqual(dict(), kb.simplified)
+                self.assertTrue(kb.ask(MazeClause([(A, True), (B, True)])))
+
+    def test_mazekb_inference_stats(self) -> None:
+        for backend in MazeKnowledgeBase.BACKENDS:
+            kb = MazeKnowledgeBase(backend = backend)
+            kb.tell(MazeClause([(("R", (1, 1)), False), (("S", (1, 1)), True)]))
+            kb.tell(MazeClause([(("R", (1, 1)), True)]))
+            wet = MazeClause([(("S", (1, 1)), True)])
+
+            # Nothing is recorded until enabled
+            kb.ask(wet)
+            self.assertEqual(0, kb.stats.totals["queries"])
+
+            events: list[dict] = list()
+            kb.stats.add_listener(events.append)
+            kb.cache.clear()
+            kb.ask(wet)
+            kb.ask(wet)
+            self.assertEqual([backend, "cache"], [event["source"] for event in events])
+            self.assertTrue(events[0]["result"])
+            if backend == "resolution":
+                self.assertEqual(kb.prover.stats["attempts"], events[0]["attempts"])
+                self.assertGreater(events[0]["rounds"], 0)
+                self.assertGreater(events[0]["peak_clauses"], 0)
+            self.assertEqual(2, kb.stats.totals["queries"])
+            self.assertEqual(events[0]["attempts"], kb.stats.totals["attempts"])
+            self.assertIn("2 queries", str(kb.stats))
+
+    def test_mazekb_subsumption(self) -> None:
+        kb = MazeKnowledgeBase()
+        kb.tell(MazeClause([(("P", (1, 1)), True), (("P", (2, 1)), True), (("P", (3, 1)), True)]))
+        kb.tell(MazeClause([(("P", (1, 1)), True), (("P", (2, 2)), False)]))
+        self.assertEqual(2, len(kb))
+        
+        # Backward: the unit removes both stored clauses that contain it
+        kb.tell(MazeClause([(("P", (1, 1)), True)]))
+        self.assertEqual({MazeClause([(("P", (1, 1)), True)])}, kb.clauses)
+        
+        # Forward: clauses subsumed by the unit (or valid) are never stored
+        kb.tell(MazeClause([(("P", (1, 1)), True), (("P", (4, 4)), False)]))
+        kb.tell(MazeClause([(("P", (4, 4)), True), (("P", (4, 4)), False)]))
+        self.assertEqual(1, len(kb))
+        self.assertEqual({("P", (1, 1))}, {SYMBOLS.prop_of(abs(lit)) for lit in kb.occurrences})
+        self.assertTrue(kb.ask(MazeClause([(("P", (1, 1)), True), (("P", (2, 1)), True)])))
+
+    def test_mazekb_components(self) -> None:
+        kb = MazeKnowledgeBase()
+        near = [MazeClause([(("P", (1, 1)), True), (("P", (1, 2)), True)]),
+                MazeClause([(("P", (1, 2)), False), (("P", (2, 2)), True)])]
+        far = [MazeClause([(("P", (9, 9)), True), (("P", (8, 9)), True)]),
+               MazeClause([(("P", (8, 9)), False)])]
+        for clause in near + far:
+            kb.tell(clause)
+        self.assertEqual(set(near), kb.get_component_clauses([("P", (1, 1))]))
+        self.assertEqual(set(far), kb.get_component_clauses([("P", (9, 9))]))
+        self.assertEqual(set(), kb.get_component_clauses([("P", (5, 5))]))
+        self.assertTrue(kb.ask(MazeClause([(("P", (9, 9)), True)])))
+        
+        # A clause bridging the two components joins them
+        kb.tell(MazeClause([(("P", (2, 2)), False), (("P", (9, 9)), False)]))
+        self.assertEqual(5, len(kb.get_component_clauses([("P", (1, 1))])))
+        self.assertTrue(kb.ask(MazeClause([(("P", (2, 2)), False)])))
+
+    def test_mazekb_ask_many(self) -> None:
+        kb = MazeKnowledgeBase()
+        kb.tell(MazeClause([(("P", (1, 1)), False)]))
+        kb.tell(MazeClause([(("P", (1, 1)), True), (("P", (1, 2)), True)]))
+        kb.tell(MazeClause([(("P", (1, 2)), False), (("P", (2, 2)), True), (("P", (3, 3)), True)]))
+        kb.tell(MazeClause([(("P", (2, 2)), False), (("P", (3, 3)), False)]))
+        self.assertEqual({("P", (1, 1)): False, ("P", (1, 2)): True}, kb.get_implied_literals())
+        
+        queries = [MazeClause([(("P", loc), truth_val)]) for loc in [(1, 1), (1, 2), (2, 2), (3, 3), (4, 4)] for truth_val in (True, False)]
+        queries.append(MazeClause([(("P", (2, 2)), True), (("P", (3, 3)), True)]))
+        expected = [deepcopy(kb).ask(query) for query in queries]
+        self.assertEqual(expected, kb.ask_many(queries))
+        self.assertEqual([False, True, True, False], expected[:4])
+        self.assertTrue(expected[-1])
+        
+        # Every answer lands in the cache
+        self.assertEqual(expected, [kb.cache.get(query, kb.version) for query in queries])
+
+    def test_mazekb_cardinality(self) -> None:
+        for backend in MazeKnowledgeBase.BACKENDS:
+            kb = MazeKnowledgeBase(backend = backend)
+            a, b, c = ("P", (1, 0)), ("P", (2, 1)), ("P", (1, 2))
+            kb.tell_exactly([a, b, c], 2)
+            self.assertEqual(0, len(kb))
+            self.assertFalse(kb.ask(MazeClause([(a, True)])))
+            self.assertTrue(kb.ask(MazeClause([(a, True), (b, True)])))
+            
+            # Counting: once one neighbor is known safe, the other two must be pits
+            kb.tell(MazeClause([(c, False)]))
+            self.assertEqual({a: True, b: True, c: False}, kb.get_implied_literals())
+            self.assertTrue(kb.ask(MazeClause([(a, True)])))
+            
+            # Constraints interact with ordinary clauses through the backends
+            d, e = ("P", (5, 5)), ("P", (6, 5))
+            kb.tell_exactly([d, e], 1)
+            kb.tell(MazeClause([(d, False), (a, False)]))
+            self.assertTrue(kb.ask(MazeClause([(e, True)])))
+
+    def test_cardinality_encoding(self) -> None:
+        # The clausal forms of the constraints admit exactly the right assignments
+        for n in range(1, 8):
+            props = [("P", (i, 0)) for i in range(n)]
+            for k in range(0, n + 2):
+                kb = MazeKnowledgeBase(backend = "cdcl")
+                for clause in CardinalityConstraint(props, k, "#t").to_clauses():
+                    kb.tell(clause)
+                for vals in itertools.product([True, False], repeat = n):
+                    consistent = not kb.ask(MazeClause([(prop, not val) for prop, val in zip(props, vals)]))
+                    self.assertEqual(sum(vals) == k, consistent)
+
+    def test_pit_probability(self) -> None:
+        engine = PitProbability(density = 0.2)
+        a, b, c, d = ("P", (1, 1)), ("P", (2, 1)), ("P", (3, 1)), ("P", (5, 5))
+        # One pit between a and b, and one between b and c: either b alone is a
+        # pit (odds 0.25) or both a and c are (odds 0.25^2), so P(b) = 0.8
+        constraints = [CardinalityConstraint([a, b], 1), CardinalityConstraint([b, c], 1)]
+        chance = engine.get_probabilities(constraints, [(1, 1), (2, 1), (3, 1), (5, 5), (4, 4)], {(5, 5)}, set())
+        self.assertAlmostEqual(0.8, chance[(2, 1)])
+        self.assertAlmostEqual(0.2, chance[(1, 1)])
+        self.assertAlmostEqual(0.2, chance[(3, 1)])
+        self.assertEqual(1.0, chance[(5, 5)])
+        self.assertEqual(0.2, chance[(4, 4)])
+        
+        # Known tiles reduce the constraints, and unchanged components are memoized
+        chance = engine.get_probabilities(constraints + [CardinalityConstraint([d, ("P", (6, 5))], 1)], [(1, 1), (6, 5)], {(5, 5)}, {(2, 1)})
+        self.assertEqual((1.0, 0.0), (chance[(1, 1)], chance[(6, 5)]))
+        engine.get_probabilities(constraints, [(1, 1)], {(5, 5)}, set())
+        self.assertEqual(1, engine.hits)
+
+    def test_warning_equations(self) -> None:
+        # The 1-2-1 pattern: a + b = 1, a + b + c = 2, b + c + d = 1 settle every tile
+        equations = WarningEquations()
+        equations.add_equation([(0, 0), (1, 0)], 1)
+        equations.add_equation([(0, 0), (1, 0), (2, 0)], 2)
+        self.assertEqual({(2, 0): True}, equations.pop_deductions())
+        equations.add_equation([(1, 0), (2, 0), (3, 0)], 1)
+        self.assertEqual({(0, 0): True, (1, 0): False, (3, 0): False}, equations.pop_deductions())
+        
+        # Known tiles are substituted in; what is told is not reported back
+        equations.add_equation([(4, 0), (5, 0), (6, 0)], 1)
+        equations.set_known((4, 0), False)
+        self.assertEqual({}, equations.pop_deductions())
+        equations.set_known((5, 0), False)
+        self.assertEqual({(6, 0): True}, equations.pop_deductions())
+        with self.assertRaises(ValueError):
+            equations.add_equation([(6, 0), (3, 0)], 0)
+
+    def test_mazekb_matches_truth_tables(self) -> None:
+        # Entailment answers agree with brute-force model checking on random KBs
+        rng = random.Random(3300)
+        symbols = [("P", (x, 0)) for x in range(5)]
+        for trial in range(80):
+            kb = MazeKnowledgeBase(backend = MazeKnowledgeBase.BACKENDS[trial % len(MazeKnowledgeBase.BACKENDS)])
+            raw = [[(rng.choice(symbols), rng.random() < 0.5) for _ in range(rng.randint(1, 3))] for _ in range(rng.randint(2, 7))]
+            for lits in raw:
+                kb.tell(MazeClause(lits))
+            models = [dict(zip(symbols, vals)) for vals in itertools.product([True, False], repeat=len(symbols))]
+            models = [m for m in models if all(any(m[p] == v for p, v in lits) for lits in raw)]
+            if not models:
+                continue
+            queries = [MazeClause([(prop, truth_val)]) for prop in symbols for truth_val in (True, False)]
+            expected = [all(m[next(iter(query.props))] == query.get_prop(next(iter(query.props))) for m in models) for query in queries]
+            self.assertEqual(expected, deepcopy(kb).ask_many(queries))
+            self.assertEqual(expected, [kb.ask(query) for query in queries])
+
     # MazeInference Tests
     # -----------------------------------------------------------------------------------------
 
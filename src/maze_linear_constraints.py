@@ -0,0 +1,173 @@
+from fractions import Fraction
+from typing import *
+
+class WarningEquations:
+    '''
+    Linear-algebra fast path over the equations given by warning tiles:
+    a "2" tile says that the pit indicators (0 or 1) of its unexplored
+    neighbors sum to 2. The equations are kept as a sparse system in
+    reduced row echelon form, with exact Fraction coefficients, which is
+    updated incrementally as equations are added and tiles become known.
+    After every change, bound propagation over each row (a 0/1 variable
+    whose value would push the row's sum out of reach is fixed to the
+    other value) settles whatever tiles it can, and those are substituted
+    back in until nothing changes.
+
+    This is sound but incomplete, so a tile it cannot settle may still be
+    decided by a MazeKnowledgeBase; tiles it does settle need no query.
+    '''
+
+    def __init__ (self) -> None:
+        """
+        Initializes an empty system of equations with no known tiles.
+        """
+        # Rows keyed by their pivot location: (coefficients, right-hand side),
+        # where the coefficients include the pivot's (always 1)
+        self.rows: dict[tuple[int, int], tuple[dict[tuple[int, int], Fraction], Fraction]] = dict()
+        # Maps each location to the pivots of the rows it appears in
+        self.occurs: dict[tuple[int, int], set[tuple[int, int]]] = dict()
+        # Locations known to be pits (True) or safe (False)
+        self.known: dict[tuple[int, int], bool] = dict()
+        # Locations settled by the equations, but not yet collected (see pop_deductions)
+        self.deduced: dict[tuple[int, int], bool] = dict()
+
+    def add_equation (self, locs: Iterable[tuple[int, int]], count: int) -> None:
+        """
+        Adds the equation that exactly count of the given locations are pits,
+        and propagates its consequences.
+
+        Parameters:
+            locs (Iterable[tuple[int, int]]):
+                The locations constrained, e.g., a warning tile's neighbors
+            count (int):
+                The number of them that are pits
+
+        Raises:
+            ValueError: if the equation contradicts what is already known
+        """
+        coeffs: dict[tuple[int, int], Fraction] = dict()
+        rhs = Fraction(count)
+        for loc in set(locs):
+            if loc in self.known:
+                rhs -= int(self.known[loc])
+            else:
+                coeffs[loc] = Fraction(1)
+        self._propagate(self._insert(coeffs, rhs))
+
+    def set_known (self, loc: tuple[int, int], is_pit: bool) -> None:
+        """
+        Records that a location is known to be a pit or safe (e.g., because
+        the agent stepped there or the KB proved it), and propagates.
+
+        Raises:
+            ValueError: if this contradicts what is already known
+        """
+        self._propagate([(loc, is_pit)])
+        self.deduced.pop(loc, None)
+
+    def pop_deductions (self) -> dict[tuple[int, int], bool]:
+        """
+        Returns the locations settled by the equations since the last call,
+        mapped to True for pits and False for safe tiles.
+        """
+        deduced = self.deduced
+        self.deduced = dict()
+        return deduced
+
+    def _insert (self, coeffs: dict[tuple[int, int], Fraction], rhs: Fraction) -> list[tuple[tuple[int, int], bool]]:
+        """
+        Reduces an equation (over unknown locations) by the existing rows and,
+        if anything is left, adds it as a new row, eliminating its pivot from
+        the other rows.
+
+        Returns:
+            list[tuple[tuple[int, int], bool]]:
+                The assignments forced by bounds on the rows that changed
+        """
+        for loc in [loc for loc in coeffs if loc in self.rows]:
+            factor = coeffs[loc]
+            pivot_coeffs, pivot_rhs = self.rows[loc]
+            for other, coeff in pivot_coeffs.items():
+                value = coeffs.get(other, 0) - factor * coeff
+                if value == 0:
+                    coeffs.pop(other, None)
+                else:
+                    coeffs[other] = value
+            rhs -= factor * pivot_rhs
+        if not coeffs:
+            if rhs != 0:
+                raise ValueError("Warning equations are inconsistent")
+            return []
+
+        pivot = min(coeffs)
+        scale = coeffs[pivot]
+        coeffs = {loc: coeff / scale for loc, coeff in coeffs.items()}
+        rhs /= scale
+        forced: list[tuple[tuple[int, int], bool]] = list()
+        for other in list(self.occurs.get(pivot, ())):
+            other_coeffs, other_rhs = self.rows[other]
+            factor = other_coeffs[pivot]
+            for loc, coeff in coeffs.items():
+                value = other_coeffs.get(loc, 0) - factor * coeff
+                if value == 0:
+                    if loc in other_coeffs:
+                        del other_coeffs[loc]
+                        self.occurs[loc].discard(other)
+                else:
+                    if loc not in other_coeffs:
+                        self.occurs.setdefault(loc, set()).add(other)
+                    other_coeffs[loc] = value
+            self.rows[other] = (other_coeffs, other_rhs - factor * rhs)
+            forced += self._bounds(other)
+        self.rows[pivot] = (coeffs, rhs)
+        for loc in coeffs:
+            if loc != pivot:
+                self.occurs.setdefault(loc, set()).add(pivot)
+        return forced + self._bounds(pivot)
+
+    def _bounds (self, pivot: tuple[int, int]) -> list[tuple[tuple[int, int], bool]]:
+        """
+        Bound propagation on one row: returns each location that cannot take
+        one of the values 0 / 1 without putting the row's right-hand side out
+        of reach of the rest of the row, paired with the value it must take.
+        """
+        coeffs, rhs = self.rows[pivot]
+        low = sum(coeff for coeff in coeffs.values() if coeff < 0)
+        high = sum(coeff for coeff in coeffs.values() if coeff > 0)
+        forced: list[tuple[tuple[int, int], bool]] = list()
+        for loc, coeff in coeffs.items():
+            # The range of the rest of the row, without this location
+            rest_low = low - coeff if coeff < 0 else low
+            rest_high = high - coeff if coeff > 0 else high
+            if not rest_low + coeff <= rhs <= rest_high + coeff:
+                forced.append((loc, False))
+            elif not rest_low <= rhs <= rest_high:
+                forced.append((loc, True))
+        return forced
+
+    def _propagate (self, pending: list[tuple[tuple[int, int], bool]]) -> None:
+        """
+        Assigns each pending location, substituting it into the rows, and
+        keeps going with whatever that forces until nothing changes.
+        """
+        while pending:
+            loc, is_pit = pending.pop()
+            if loc in self.known:
+                if self.known[loc] != is_pit:
+                    raise ValueError("Warning equations are inconsistent")
+                continue
+            self.known[loc] = is_pit
+            self.deduced[loc] = is_pit
+            value = int(is_pit)
+
+            for other in self.occurs.pop(loc, set()):
+                other_coeffs, other_rhs = self.rows[other]
+                coeff = other_coeffs.pop(loc)
+                self.rows[other] = (other_coeffs, other_rhs - coeff * value)
+                pending += self._bounds(other)
+            if loc in self.rows:
+                coeffs, rhs = self.rows.pop(loc)
+                del coeffs[loc]
+                for other in coeffs:
+                    self.occurs[other].discard(loc)
+                pending += self._insert(coeffs, rhs - value)
@@ -0,0 +1,218 @@
+import random
+from typing import *
+from maze_clause import MazeClause
+from maze_cardinality import CardinalityConstraint
+from maze_budget import InferenceBudget
+
+class WalkSAT:
+    '''
+    WalkSAT local search for a model of a set of clauses and "exactly k"
+    constraints (the latter counted directly, without their CNF). Starting
+    from a full assignment, it repeatedly picks a violated item at random and
+    flips one of the propositions that could repair it: one that breaks no
+    satisfied item if there is any, else a random one with probability
+    NOISE, else the one that breaks the fewest.
+
+    Local search is incomplete: it finds models quickly when they are
+    plentiful but can never show that there are none, so MazeKnowledgeBase
+    only uses it to show that a query is not entailed (see ModelCache).
+    Props are the ids of SYMBOLS (see SymbolTable); models map them to bools.
+    '''
+
+    # Probability of a random (rather than greedy) flip when every flip breaks something
+    NOISE = 0.5
+
+    def __init__ (self, clauses: Iterable["MazeClause"], constraints: Iterable["CardinalityConstraint"] = (), seed: int = 0) -> None:
+        """
+        Indexes the given clauses and constraints for search.
+
+        Parameters:
+            clauses (Iterable[MazeClause]):
+                The clauses to satisfy; valid clauses are ignored
+            constraints (Iterable[CardinalityConstraint]):
+                The "exactly k" constraints to satisfy
+            seed (int):
+                Seed of the search's random choices
+        """
+        # Each item is (literals, None) for a clause, or (prop ids, k) for a constraint
+        self.items: list[tuple[tuple[int, ...], Optional[int]]] = [(clause.lits, None) for clause in clauses if not clause.is_valid()]
+        self.items += [(constraint.ids, constraint.k) for constraint in constraints]
+        # Maps each prop id to the indexes of the items it appears in
+        self.occurrences: dict[int, list[int]] = dict()
+        for i, (lits, _) in enumerate(self.items):
+            for lit in lits:
+                self.occurrences.setdefault(abs(lit), []).append(i)
+        self.rng: random.Random = random.Random(seed)
+        self.flips: int = 0
+
+    def _satisfied (self, i: int, model: dict[int, bool]) -> bool:
+        """
+        Returns whether the item at index i holds under the (full) model.
+        """
+        lits, k = self.items[i]
+        if k is None:
+            return any(model[abs(lit)] == (lit > 0) for lit in lits)
+        return sum(1 for prop_id in lits if model[prop_id]) == k
+
+    def _breaks (self, prop_id: int, model: dict[int, bool]) -> int:
+        """
+        Returns the number of items now satisfied that flipping prop_id would violate.
+        """
+        held = [i for i in self.occurrences.get(prop_id, ()) if self._satisfied(i, model)]
+        model[prop_id] = not model[prop_id]
+        broken = sum(1 for i in held if not self._satisfied(i, model))
+        model[prop_id] = not model[prop_id]
+        return broken
+
+    def find_model (self, start: dict[int, bool], fixed: dict[int, bool], max_flips: int, budget: Optional["InferenceBudget"] = None) -> Optional[dict[int, bool]]:
+        """
+        Searches for a model, starting from the given (partial) assignment.
+
+        Parameters:
+            start (dict[int, bool]):
+                Initial values of props; those missing are drawn at random
+            fixed (dict[int, bool]):
+                Props that must keep the given values (they are never flipped)
+            max_flips (int):
+                The most flips to make before giving up
+            budget (Optional[InferenceBudget]):
+                Limits on the search, spent one step per flip
+
+        Returns:
+            Optional[dict[int, bool]]:
+                A model of every item (over the props of the items and of
+                fixed), or None if none was found within the flips allowed
+        """
+        model = {prop_id: start[prop_id] if prop_id in start else self.rng.random() < 0.5 for prop_id in self.occurrences}
+        model.update(fixed)
+        # The violated items, as a list (for random choice) and their positions in it
+        violated: list[int] = list()
+        position: dict[int, int] = dict()
+        for i in range(len(self.items)):
+            if not self._satisfied(i, model):
+                position[i] = len(violated)
+                violated.append(i)
+
+        for _ in range(max_flips):
+            if not violated:
+                return model
+            if budget is not None and not budget.spend():
+                return None
+            lits, k = self.items[self.rng.choice(violated)]
+            if k is None:
+                candidates = [abs(lit) for lit in lits if abs(lit) not in fixed]
+            else:
+                # Too many true props (flip one off) or too few (flip one on)
+                too_many = sum(1 for prop_id in lits if model[prop_id]) > k
+                candidates = [prop_id for prop_id in lits if model[prop_id] == too_many and prop_id not in fixed]
+            if not candidates:
+                return None
+            breaks = {prop_id: self._breaks(prop_id, model) for prop_id in candidates}
+            best = min(candidates, key = breaks.__getitem__)
+            if breaks[best] > 0 and self.rng.random() < WalkSAT.NOISE:
+                best = self.rng.choice(candidates)
+
+            model[best] = not model[best]
+            self.flips += 1
+            for i in self.occurrences[best]:
+                if self._satisfied(i, model):
+                    if i in position:
+                        # Swap-remove from the violated list
+                        last = violated.pop()
+                        if last != i:
+                            violated[position[i]] = last
+                            position[last] = position[i]
+                        del position[i]
+                elif i not in position:
+                    position[i] = len(violated)
+                    violated.append(i)
+        return model if not violated else None
+
+class ModelCache:
+    '''
+    A few models of a MazeKnowledgeBase, kept up to date as clauses and
+    constraints are told. Each model is a partial assignment (of prop ids to
+    bools) under which every stored clause has a true literal and every
+    stored constraint has all of its props assigned, exactly k of them true,
+    so that any completion of it is a model of the KB. A told clause or
+    constraint that a model does not satisfy is satisfied by assigning its
+    unassigned props where possible, and otherwise drops the model.
+
+    A query falsified by any cached model is not entailed by the KB, which
+    settles most undetermined frontier tiles without a proof.
+    '''
+
+    def __init__ (self, maxsize: int = 8) -> None:
+        """
+        Initializes an empty cache of at most maxsize models (oldest dropped first).
+        """
+        self.maxsize: int = maxsize
+        self.models: list[dict[int, bool]] = list()
+
+    def add (self, model: dict[int, bool]) -> None:
+        """
+        Caches a model, which must satisfy the KB as described for the class.
+        """
+        self.models.append(model)
+        if len(self.models) > self.maxsize:
+            del self.models[0]
+
+    def tell (self, clause: "MazeClause") -> None:
+        """
+        Updates the models for a clause newly told to the KB.
+        """
+        kept: list[dict[int, bool]] = list()
+        for model in self.models:
+            if clause.is_valid() or any(model.get(abs(lit)) == (lit > 0) for lit in clause.lits):
+                kept.append(model)
+                continue
+            for lit in clause.lits:
+                if abs(lit) not in model:
+                    model[abs(lit)] = lit > 0
+                    kept.append(model)
+                    break
+        self.models = kept
+
+    def tell_exactly (self, constraint: "CardinalityConstraint") -> None:
+        """
+        Updates the models for a constraint newly told to the KB.
+        """
+        kept: list[dict[int, bool]] = list()
+        for model in self.models:
+            true = sum(1 for prop_id in constraint.ids if model.get(prop_id) is True)
+            free = [prop_id for prop_id in constraint.ids if prop_id not in model]
+            if true <= constraint.k <= true + len(free):
+                for j, prop_id in enumerate(free):
+                    model[prop_id] = j < constraint.k - true
+                kept.append(model)
+        self.models = kept
+
+    def falsifying (self, query: "MazeClause") -> Optional[dict[int, bool]]:
+        """
+        Returns a cached model under which every literal of the (non-valid)
+        query is false, i.e., a proof that the KB does not entail it, if any.
+        """
+        for model in reversed(self.models):
+            if all(model.get(abs(lit)) == (lit < 0) for lit in query.lits):
+                return model
+        return None
+
+    def disagree (self, prop_id: int) -> bool:
+        """
+        Returns whether the cached models include one where the given prop is
+        true and one where it is false, so that neither is entailed.
+        """
+        values = {model.get(prop_id) for model in self.models}
+        return True in values and False in values
+
+    def clear (self) -> None:
+        """
+        Forgets every cached model.
+        """
+        self.models.clear()
+
+    def __len__ (self) -> int:
+        """
+        Returns the number of models cached.
+        """
+        return len(self.models)
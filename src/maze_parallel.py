@@ -0,0 +1,194 @@
+import os
+import weakref
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+from maze_clause import MazeClause
+from maze_symbols import SYMBOLS
+from maze_knowledge_base import MazeKnowledgeBase
+from maze_snapshot import KBSnapshot
+from maze_inference_stats import InferenceStats
+
+# The snapshot last loaded by this (worker) process: its token and the KB
+# restored from it
+_loaded: Optional[tuple[tuple, "MazeKnowledgeBase"]] = None
+
+def _load (token: tuple, snapshot: bytes) -> "MazeKnowledgeBase":
+    """
+    Returns the KB held in the given snapshot (see ParallelAsker.snapshot),
+    restoring it only if this worker has not loaded that snapshot yet.
+    """
+    global _loaded
+    if _loaded is None or _loaded[0] != token:
+        _loaded = (token, MazeKnowledgeBase.restore(KBSnapshot.decode(snapshot)))
+    return _loaded[1]
+
+def _ask_chunk (token: tuple, snapshot: bytes, queries: list[list[tuple[tuple, bool]]], max_steps: Optional[int],
+                deadline: Optional[float], record: bool) -> tuple[list[Optional[bool]], list[dict[str, Any]]]:
+    """
+    Worker task: answers a chunk of queries (given by their literals, as
+    (prop, truth_val) pairs) against the snapshot's KB, as by ask_many,
+    along with the InferenceStats events of answering them, if record.
+    """
+    kb = _load(token, snapshot)
+    events: list[dict[str, Any]] = list()
+    kb.stats = InferenceStats()
+    if record:
+        kb.stats.add_listener(events.append)
+    return kb.ask_many([MazeClause(literals) for literals in queries], max_steps, deadline), events
+
+class ParallelAsker:
+    '''
+    Answers batches of queries of a MazeKnowledgeBase on a persistent pool of
+    worker processes, for when one core cannot keep up with the frontier.
+    Each batch sends one compact snapshot of the KB (see snapshot) along with
+    one chunk of the queries to each worker, which rebuilds the KB once per
+    snapshot and answers its chunk with ask_many. A new snapshot is only
+    taken once the KB has changed (see get_snapshot), so the batches of one
+    tick share a snapshot and its rebuilt KBs. The pool lives here rather
+    than on the KB, which stays picklable and deep-copyable, and is started
+    on first use and shut down by close (or once this asker is collected).
+
+    Starting processes and shipping a snapshot cost milliseconds, far more
+    than a small KB takes to answer everything, so batches over KBs of fewer
+    than min_clauses clauses and constraints (or with too few queries to go
+    around) are answered serially, by the KB itself.
+    '''
+
+    # Fewest clauses and constraints in the KB for which the pool is used
+    MIN_CLAUSES = 500
+
+    def __init__ (self, workers: Optional[int] = None, min_clauses: int = MIN_CLAUSES) -> None:
+        """
+        Initializes an asker whose pool (started on first use) has the given
+        number of worker processes, by default one per core.
+        """
+        self.workers: int = workers if workers is not None else os.cpu_count() or 1
+        self.min_clauses: int = min_clauses
+        self.pool: Optional[ProcessPoolExecutor] = None
+        # Tags each snapshot, so that workers know when to rebuild their KB
+        self.session: str = "%x-%x" % (os.getpid(), random.getrandbits(32))
+        self.snapshots: int = 0
+        # The last snapshot taken: the KB it was taken of, its version and
+        # settings then, the snapshot's token, and the snapshot itself, which
+        # is sent again (and not rebuilt by the workers) until the KB changes
+        self.last: Optional[tuple[weakref.ref[MazeKnowledgeBase], tuple, tuple, bytes]] = None
+        self._finalizer: Optional[weakref.finalize] = None
+
+    @staticmethod
+    def snapshot (kb: "MazeKnowledgeBase") -> bytes:
+        """
+        Serializes what a worker needs to answer queries as the given KB would,
+        in the binary format of KBSnapshot: the props that the KB mentions (and
+        no others), renumbered to dense local ids that workers translate to
+        their own, its clauses and constraints as packed arrays, and its settings.
+        """
+        return KBSnapshot.encode(kb)
+
+    def ask_many (self, kb: "MazeKnowledgeBase", queries: Sequence["MazeClause"], max_steps: Optional[int] = None, deadline: Optional[float] = None) -> list[Optional[bool]]:
+        """
+        Answers the queries as kb.ask_many would, spreading those not already
+        cached over the pool (or serially, see the class docstring); answers
+        are cached in the KB. Each worker has its own budget of max_steps.
+        If kb.stats is enabled, the events of the workers are recorded in it,
+        as are those of the queries answered from the cache.
+
+        Parameters:
+            kb (MazeKnowledgeBase):
+                The KB being asked, which is not modified (besides its cache)
+            queries (Sequence[MazeClause]):
+                The query clauses to determine if these are entailed by the KB
+            max_steps (Optional[int]):
+                The most inference steps that each worker may take
+            deadline (Optional[float]):
+                The time.monotonic() value at which to give up
+
+        Returns:
+            list[Optional[bool]]:
+                For each query in order, True if the KB entails it, False if
+                not, or None if it was not decided in time
+        """
+        results = kb._get_cached(queries)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if self.workers <= 1 or len(pending) < 2 or len(kb.clauses) + len(kb.constraints) < self.min_clauses:
+            return kb._ask_uncached(queries, results, max_steps, deadline)
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers = self.workers)
+            self._finalizer = weakref.finalize(self, self.pool.shutdown, wait = False)
+        token, snapshot = self.get_snapshot(kb)
+        # One contiguous chunk per worker, so that each worker loads the snapshot once
+        size = -(-len(pending) // self.workers)
+        chunks = [pending[start:start + size] for start in range(0, len(pending), size)]
+        futures = [self.pool.submit(_ask_chunk, token, snapshot, [[SYMBOLS.literal_of(lit) for lit in queries[i].lits] for i in chunk], max_steps, deadline,
+                                   kb.stats.enabled) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            answers, events = future.result()
+            for event in events:
+                kb.stats.record(event["query"], event["source"], event["result"], event["seconds"],
+                                event["attempts"], event["resolvents"], event["peak_clauses"], event["rounds"])
+            for i, answer in zip(chunk, answers):
+                results[i] = answer
+                if answer is not None:
+                    kb.cache.put(queries[i], answer, kb.version)
+        return results
+
+    def get_snapshot (self, kb: "MazeKnowledgeBase") -> tuple[tuple, bytes]:
+        """
+        Returns the token and snapshot of the given KB as it is now, taking a
+        new snapshot only if the KB, its version or its settings have changed
+        since the last one. Tokens are (session, id(kb), version, serial):
+        the serial tells apart KBs that reuse a collected KB's id.
+        """
+        state = (kb.version, kb.backend, kb.walk_flips, kb.max_derived)
+        if self.last is not None and self.last[0]() is kb and self.last[1] == state:
+            return self.last[2], self.last[3]
+        self.snapshots += 1
+        token = (self.session, id(kb), kb.version, self.snapshots)
+        snapshot = ParallelAsker.snapshot(kb)
+        self.last = (weakref.ref(kb), state, token, snapshot)
+        return token, snapshot
+
+    def close (self) -> None:
+        """
+        Shuts the pool down; it is restarted if the asker is used again.
+        """
+        if self.pool is not None and self._finalizer is not None:
+            self._finalizer.detach()
+            self.pool.shutdown()
+        self.pool = None
+        self._finalizer = None
+
+def _benchmark (width: int, height: int, workers: int, seed: int = 0) -> None:
+    """
+    Times one batch of pit / not-pit queries over every tile of a random
+    grid of warning constraints, serially and on the pool (twice: the first
+    batch includes starting the workers).
+    """
+    rng = random.Random(seed)
+    kb = MazeKnowledgeBase(backend = "cdcl")
+    pits = {(x, y) for x in range(width) for y in range(height) if rng.random() < 0.2}
+    for x in range(0, width, 2):
+        for y in range(0, height, 2):
+            near = [(x + dx, y + dy) for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)) if 0 <= x + dx < width and 0 <= y + dy < height]
+            kb.tell_exactly([("P", loc) for loc in near], sum(1 for loc in near if loc in pits))
+    queries = [MazeClause([(("P", (x, y)), truth_val)]) for x in range(width) for y in range(height) if (x + y) % 2 for truth_val in (True, False)]
+    asker = ParallelAsker(workers, min_clauses = 0)
+    runs: list[tuple[str, Callable[[], list[Optional[bool]]]]] = [
+        ("serial", lambda: kb.ask_many(queries)),
+        ("pool (cold)", lambda: asker.ask_many(kb, queries)),
+        ("pool (warm)", lambda: asker.ask_many(kb, queries)),
+    ]
+    for label, ask in runs:
+        kb.cache.clear()
+        start = time.perf_counter()
+        answers = ask()
+        print("  %-12s %6.3fs, %d decided" % (label, time.perf_counter() - start, sum(1 for answer in answers if answer is not None)))
+    asker.close()
+    print("  (%d queries)" % len(queries))
+
+if __name__ == "__main__":
+    for width, height in ((12, 12), (30, 30)):
+        print("%dx%d grid, %d workers:" % (width, height, os.cpu_count() or 1))
+        _benchmark(width, height, os.cpu_count() or 1)
@@ -0,0 +1,176 @@
+from typing import *
+from maze_cardinality import CardinalityConstraint
+from maze_union_find import PropositionUnionFind
+from maze_symbols import SYMBOLS
+
+class PitProbability:
+    '''
+    Minesweeper-style probability engine: given the "exactly k of these
+    are pits" constraints told by warning tiles, computes for each tile
+    the probability that it holds a pit, over every pit assignment that
+    is consistent with the constraints.
+
+    Constraints sharing a tile are grouped into independent components,
+    which are enumerated separately (so the work grows with the largest
+    component rather than the whole frontier) by a memoized search over
+    the component's tiles. Each assignment is weighted by the prior pit
+    density, i.e., an assignment with m pits among n tiles has weight
+    density^m * (1 - density)^(n - m). The marginals of each component
+    are remembered, so a component unchanged since the last call is not
+    enumerated again.
+    '''
+
+    # Prior probability that an unconstrained tile holds a pit
+    DEFAULT_DENSITY = 0.2
+    # Number of component results remembered before the memo is reset
+    MAX_MEMO = 1024
+
+    def __init__ (self, density: float = DEFAULT_DENSITY) -> None:
+        """
+        Initializes an engine with the given prior pit density.
+
+        Parameters:
+            density (float):
+                The prior probability that any one tile holds a pit, strictly
+                between 0 and 1
+        """
+        self.density: float = density
+        # Maps each component, as a frozenset of (frozenset(props), k), to
+        # the pit probability of each of its props
+        self.memo: dict[frozenset, dict[tuple, float]] = dict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get_probabilities (self, constraints: Iterable["CardinalityConstraint"], locs: Iterable[tuple[int, int]],
+                           known_pits: set[tuple[int, int]], known_safe: set[tuple[int, int]]) -> dict[tuple[int, int], float]:
+        """
+        Returns the probability that each of the given locations holds a pit.
+
+        Parameters:
+            constraints (Iterable[CardinalityConstraint]):
+                Exactly-k constraints over pit propositions ("P", loc), e.g.,
+                a MazeKnowledgeBase's constraints
+            locs (Iterable[tuple[int, int]]):
+                The maze locations in question, e.g., the frontier
+            known_pits (set[tuple[int, int]]):
+                Locations known to be pits
+            known_safe (set[tuple[int, int]]):
+                Locations known to be safe
+
+        Returns:
+            dict[tuple[int, int], float]:
+                Each location mapped to its probability of holding a pit: 1 or 0
+                if known, its marginal if constrained, or else the prior density
+        """
+        known: dict[int, bool] = {SYMBOLS.id_of(("P", loc)): True for loc in known_pits}
+        known.update({SYMBOLS.id_of(("P", loc)): False for loc in known_safe})
+
+        union = PropositionUnionFind()
+        residuals: list[CardinalityConstraint] = list()
+        for constraint in constraints:
+            residual = constraint.reduce(known)
+            if residual is None:
+                continue
+            residuals.append(residual)
+            for prop in residual.props:
+                union.union(residual.props[0], prop)
+        components: dict[Hashable, list[CardinalityConstraint]] = dict()
+        for residual in residuals:
+            components.setdefault(union.find(residual.props[0]), []).append(residual)
+
+        marginals: dict[tuple, float] = dict()
+        for component in components.values():
+            marginals.update(self.get_component_probabilities(component))
+
+        probabilities: dict[tuple[int, int], float] = dict()
+        for loc in locs:
+            prop = ("P", loc)
+            prop_id = SYMBOLS.id_of(prop)
+            if prop_id in known:
+                probabilities[loc] = 1.0 if known[prop_id] else 0.0
+            else:
+                probabilities[loc] = marginals.get(prop, self.density)
+        return probabilities
+
+    def get_component_probabilities (self, constraints: list["CardinalityConstraint"]) -> dict[tuple, float]:
+        """
+        Returns the pit probability of every prop of one connected component
+        of constraints, from the memo if the component was seen before.
+        """
+        key = frozenset((frozenset(constraint.props), constraint.k) for constraint in constraints)
+        cached = self.memo.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        if len(self.memo) >= PitProbability.MAX_MEMO:
+            self.memo.clear()
+        result = self._enumerate(constraints)
+        self.memo[key] = result
+        return result
+
+    def _enumerate (self, constraints: list["CardinalityConstraint"]) -> dict[tuple, float]:
+        """
+        Computes the weighted fraction of the consistent assignments of a
+        component in which each of its props is a pit. Props are decided in
+        order, and the search is memoized on (next prop, pits still needed by
+        each constraint), which is all that the rest of the search depends on.
+        A component with no consistent assignment gets the prior density.
+        """
+        props = sorted({prop for constraint in constraints for prop in constraint.props}, key = str)
+        n = len(props)
+        position = {prop: i for i, prop in enumerate(props)}
+        # members[i] lists the constraints containing the i-th prop, and
+        # remaining[c][i] is how many props of constraint c come at or after i
+        members: list[list[int]] = [[] for _ in range(n)]
+        remaining: list[list[int]] = list()
+        for c, constraint in enumerate(constraints):
+            counts = [0] * (n + 1)
+            for prop in constraint.props:
+                members[position[prop]].append(c)
+                counts[position[prop]] += 1
+            for i in range(n - 1, -1, -1):
+                counts[i] += counts[i + 1]
+            remaining.append(counts)
+        odds = self.density / (1 - self.density)
+        memo: dict[tuple[int, tuple[int, ...]], tuple[float, list[float]]] = dict()
+
+        def count (i: int, needs: tuple[int, ...]) -> tuple[float, list[float]]:
+            """
+            Returns the total weight of the assignments to props i.. meeting
+            the needs, and the weight of those in which each such prop is a pit.
+            """
+            if i == n:
+                return (1.0 if not any(needs) else 0.0), []
+            key = (i, needs)
+            if key in memo:
+                return memo[key]
+            total = 0.0
+            pits = [0.0] * (n - i)
+            for is_pit in (False, True):
+                after = list(needs)
+                feasible = True
+                for c in members[i]:
+                    if is_pit:
+                        after[c] -= 1
+                    if after[c] < 0 or after[c] > remaining[c][i + 1]:
+                        feasible = False
+                        break
+                if not feasible:
+                    continue
+                weight, sub_pits = count(i + 1, tuple(after))
+                if weight == 0:
+                    continue
+                factor = odds if is_pit else 1.0
+                total += factor * weight
+                if is_pit:
+                    pits[0] += factor * weight
+                for j, sub in enumerate(sub_pits):
+                    pits[j + 1] += factor * sub
+            memo[key] = (total, pits)
+            return memo[key]
+
+        total, pits = count(0, tuple(constraint.k for constraint in constraints))
+        if total == 0:
+            return {prop: self.density for prop in props}
+        return {prop: pits[i] / total for i, prop in enumerate(props)}
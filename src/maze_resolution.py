@@ -0,0 +1,152 @@
+import heapq
+from typing import *
+from maze_clause import MazeClause
+from maze_budget import InferenceBudget
+
+class GivenClauseProver:
+    '''
+    Resolution-refutation engine for MazeKnowledgeBase queries that uses
+    a given-clause (set-of-support) loop in place of repeatedly resolving
+    every pair of clauses. The KB's clauses are never resolved against one
+    another: only the negated query and the resolvents descending from it
+    are selected as the "given" clause, each exactly once, and each is only
+    resolved against the already-processed clauses that contain the
+    complement of one of its literals, as looked up through a literal index.
+
+    After every call to refute, the stats attribute records how much work
+    the refutation took and how much the literal index saved.
+
+    The clauses held during a refutation may be capped (see max_clauses),
+    in which case the waiting resolvents that are least likely to be of use
+    -- the longest, and among those the most recently derived -- are
+    evicted to stay under the cap. The original clauses and the set of
+    support are never evicted. A refutation that saturates after evicting
+    anything is inconclusive.
+    '''
+
+    def __init__ (self, max_clauses: Optional[int] = None) -> None:
+        """
+        Initializes a new GivenClauseProver with zeroed statistics.
+
+        Parameters:
+            max_clauses (Optional[int]):
+                The most clauses (processed plus waiting) held at once during
+                a refutation, or None for no limit
+
+        The stats dictionary has the keys:
+          - given:      number of clauses selected as the given clause
+          - attempts:   number of clause pairs actually passed to resolve
+          - skipped:    number of clause pairs never resolved because the
+                        literal index showed that they could not clash
+          - resolvents: number of new, non-valid clauses derived
+          - peak:       largest number of clauses held at once (processed
+                        plus waiting in the set of support)
+          - evicted:    number of waiting resolvents evicted by the cap
+        """
+        self.max_clauses: Optional[int] = max_clauses
+        self.stats: dict[str, int] = {"given": 0, "attempts": 0, "skipped": 0, "resolvents": 0, "peak": 0, "evicted": 0}
+
+    def refute (self, clauses: Iterable["MazeClause"], support: Iterable["MazeClause"], budget: Optional["InferenceBudget"] = None) -> Optional[bool]:
+        """
+        Determines whether or not the empty clause can be derived by resolution
+        from the given clauses together with the set of support (typically,
+        the negated query).
+
+        Every resolution step involves at least one clause from the set of
+        support, which is refutation-complete so long as the clauses alone are
+        consistent -- the same assumption made by MazeKnowledgeBase.tell -- so
+        the answer is the same as saturating the whole set of clauses.
+
+        Parameters:
+            clauses (Iterable[MazeClause]):
+                The clauses of the knowledge base being queried
+            support (Iterable[MazeClause]):
+                The set of support, e.g., the clauses of a negated query
+            budget (Optional[InferenceBudget]):
+                Limits on the search, spent one step per resolution attempt
+
+        Returns:
+            Optional[bool]:
+                True if the empty clause was derived, False if the clauses
+                were saturated without finding a contradiction, or None if
+                the budget ran out first (or if they were only saturated
+                after clauses were evicted, see max_clauses)
+        """
+        self.stats = {"given": 0, "attempts": 0, "skipped": 0, "resolvents": 0, "peak": 0, "evicted": 0}
+        # Maps each literal (see SymbolTable) to the processed clauses containing it
+        index: dict[int, list[MazeClause]] = dict()
+        seen: set[MazeClause] = set()
+        processed = 0
+        for clause in clauses:
+            if clause in seen:
+                continue
+            seen.add(clause)
+            for lit in clause.lits:
+                index.setdefault(lit, []).append(clause)
+            processed += 1
+
+        # Unprocessed clauses of the set of support, shortest first (unit preference)
+        sos: list[tuple[int, int, MazeClause]] = []
+        for clause in support:
+            if clause not in seen:
+                seen.add(clause)
+                heapq.heappush(sos, (len(clause), len(seen), clause))
+
+        protected = len(seen)
+        while sos:
+            sos = self._evict(sos, processed, protected)
+            if not sos:
+                break
+            self.stats["peak"] = max(self.stats["peak"], processed + len(sos))
+            given = heapq.heappop(sos)[2]
+            self.stats["given"] += 1
+
+            # Collect (in order, without repeats) the processed clauses that contain
+            # the complement of at least one of the given clause's literals
+            partners: dict[int, MazeClause] = dict()
+            for lit in given.lits:
+                for other in index.get(-lit, ()):
+                    partners[id(other)] = other
+            self.stats["attempts"] += len(partners)
+            self.stats["skipped"] += processed - len(partners)
+
+            for other in partners.values():
+                if budget is not None and not budget.spend():
+                    return None
+                for resolvent in MazeClause.resolve(given, other):
+                    if resolvent.is_empty():
+                        return True
+                    if resolvent not in seen:
+                        seen.add(resolvent)
+                        heapq.heappush(sos, (len(resolvent), len(seen), resolvent))
+                        self.stats["resolvents"] += 1
+
+            for lit in given.lits:
+                index.setdefault(lit, []).append(given)
+            processed += 1
+
+        return None if self.stats["evicted"] > 0 else False
+
+    def _evict (self, sos: list[tuple[int, int, Any]], processed: int, protected: int) -> list[tuple[int, int, Any]]:
+        """
+        Trims the set of support (a heap of (size, order, clause) entries) so
+        that at most max_clauses clauses are held, evicting the longest and
+        then the youngest resolvents first. The entries whose order is within
+        the first protected clauses seen (the originals and the support) are
+        never evicted, so once the processed clauses alone fill the cap, only
+        those are kept, even though the cap is then exceeded. Evicted clauses
+        stay seen, so they are not derived again.
+
+        Returns:
+            list[tuple[int, int, Any]]:
+                The trimmed heap (the same list, if nothing was evicted)
+        """
+        if self.max_clauses is None or processed + len(sos) <= self.max_clauses:
+            return sos
+        keep = max(self.max_clauses - processed, 0)
+        kept = [entry for entry in sos if entry[1] <= protected]
+        derived = heapq.nsmallest(max(keep - len(kept), 0), (entry for entry in sos if entry[1] > protected))
+        self.stats["evicted"] += len(sos) - len(kept) - len(derived)
+        kept += derived
+        heapq.heapify(kept)
+        return kept
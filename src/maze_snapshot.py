@@ -0,0 +1,258 @@
+import os
+import sys
+import mmap
+import time
+import random
+import marshal
+import struct
+from array import array
+from typing import *
+from maze_clause import MazeClause
+from maze_cardinality import CardinalityConstraint
+from maze_symbols import SYMBOLS
+
+if TYPE_CHECKING:
+    from maze_knowledge_base import MazeKnowledgeBase
+
+class KBSnapshot:
+    '''
+    Compact binary image of the contents of a MazeKnowledgeBase (see
+    MazeKnowledgeBase.save and load), for checkpointing a long game and
+    restarting from it. A snapshot file holds, after a fixed header:
+      - the proposition table: the props that the KB mentions, marshalled
+        as one tuple (of strs, ints and tuples only, so that no code runs
+        on load), each prop's local id being its position in it plus one
+      - the clauses, as packed little-endian int32 arrays of local literals
+        (signed local ids), with an array of offsets marking where each
+        clause starts, so that clause i is lits[offsets[i]:offsets[i + 1]]
+      - the constraints, likewise as offsets and ids, plus an array of k
+      - the literals the KB has been simplified by (see simplify_self)
+    Each array starts on a 4-byte boundary. Local ids keep the file
+    independent of the process's SymbolTable: on load, each prop is
+    interned again, and literals are translated through the table.
+
+    A snapshot read with use_mmap maps the file rather than reading it, and
+    its arrays are memoryviews of the mapping, so nothing is copied until
+    the clauses are built; it must then be closed (or used as a context
+    manager) once done with. The same image can be made and read in memory
+    (see encode and decode), e.g., to ship a KB to another process.
+    '''
+
+    MAGIC = b"MZKB"
+    VERSION = 1
+    # Magic, version, backend index, walk_flips and max_derived (-1 for
+    # None), then the byte size of the prop table and the length of each array
+    HEADER = struct.Struct("<4s4i7i")
+    # Names of the int32 arrays, in file order
+    ARRAYS = ("clause_offsets", "clause_lits", "constraint_offsets", "constraint_ids", "constraint_ks", "simplified")
+
+    def __init__ (self, props: tuple, settings: tuple[str, Optional[int], Optional[int]], arrays: dict[str, Sequence[int]],
+                  mapping: Optional[mmap.mmap] = None, view: Optional[memoryview] = None) -> None:
+        """
+        Wraps the decoded parts of a snapshot, along with the mapping of the
+        file and the view of it that the arrays are slices of, if mapped; see read.
+        """
+        self.props: tuple = props
+        self.backend, self.walk_flips, self.max_derived = settings
+        self.arrays: dict[str, Sequence[int]] = arrays
+        self.mapping: Optional[mmap.mmap] = mapping
+        self.view: Optional[memoryview] = view
+
+    @staticmethod
+    def write (path: str, kb: "MazeKnowledgeBase") -> int:
+        """
+        Writes a snapshot of the given KB's clauses, constraints and settings
+        to path, atomically: the file is written next to it and then renamed
+        over it, so that a crash mid-write leaves the previous snapshot.
+
+        Returns:
+            int:
+                The size of the file written, in bytes
+        """
+        data = KBSnapshot.encode(kb)
+        partial = path + ".partial"
+        with open(partial, "wb") as file:
+            file.write(data)
+        os.replace(partial, path)
+        return len(data)
+
+    @staticmethod
+    def encode (kb: "MazeKnowledgeBase") -> bytes:
+        """
+        Returns the snapshot of the given KB as bytes, e.g., to send it to
+        another process (see ParallelAsker), where decode reads it back.
+        """
+        local: dict[int, int] = dict()
+        props: list[tuple] = list()
+
+        def local_lit (lit: int) -> int:
+            prop_id = abs(lit)
+            local_id = local.get(prop_id)
+            if local_id is None:
+                local_id = local[prop_id] = len(props) + 1
+                props.append(SYMBOLS.props[prop_id])
+            return local_id if lit > 0 else -local_id
+
+        arrays = {name: array("i") for name in KBSnapshot.ARRAYS}
+        arrays["clause_offsets"].append(0)
+        for clause in kb.clauses:
+            arrays["clause_lits"].extend(map(local_lit, clause.lits))
+            arrays["clause_offsets"].append(len(arrays["clause_lits"]))
+        arrays["constraint_offsets"].append(0)
+        for constraint in kb.constraints:
+            arrays["constraint_ids"].extend(map(local_lit, constraint.ids))
+            arrays["constraint_offsets"].append(len(arrays["constraint_ids"]))
+            arrays["constraint_ks"].append(constraint.k)
+        arrays["simplified"].extend(local_lit(prop_id if truth_val else -prop_id) for prop_id, truth_val in kb.simplified.items())
+        if sys.byteorder != "little":
+            for values in arrays.values():
+                values.byteswap()
+
+        table = marshal.dumps(tuple(props))
+        table += bytes(-len(table) % 4)
+        header = KBSnapshot.HEADER.pack(KBSnapshot.MAGIC, KBSnapshot.VERSION, type(kb).BACKENDS.index(kb.backend),
+                                        -1 if kb.walk_flips is None else kb.walk_flips, -1 if kb.max_derived is None else kb.max_derived,
+                                        len(table), *(len(arrays[name]) for name in KBSnapshot.ARRAYS))
+        return b"".join([header, table] + [arrays[name].tobytes() for name in KBSnapshot.ARRAYS])
+
+    @staticmethod
+    def read (path: str, use_mmap: bool = True) -> "KBSnapshot":
+        """
+        Reads the snapshot at path, mapping the file if use_mmap (and the
+        platform's byte order allows using its arrays in place).
+
+        Raises:
+            ValueError: if the file is not a whole snapshot of this version
+        """
+        with open(path, "rb") as file:
+            if use_mmap and sys.byteorder == "little" and os.fstat(file.fileno()).st_size > 0:
+                mapping: Optional[mmap.mmap] = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+                data: Union[bytes, memoryview] = memoryview(cast(mmap.mmap, mapping))
+            else:
+                mapping = None
+                data = file.read()
+        return KBSnapshot.decode(data, mapping, path)
+
+    @staticmethod
+    def decode (data: Union[bytes, memoryview], mapping: Optional[mmap.mmap] = None, source: str = "bytes") -> "KBSnapshot":
+        """
+        Reads a snapshot from bytes made by encode, or from a view of a
+        mapped file (which is then unmapped if the snapshot is not whole).
+
+        Raises:
+            ValueError: if the data is not a whole snapshot of this version
+        """
+        fields = KBSnapshot.HEADER.unpack_from(data) if len(data) >= KBSnapshot.HEADER.size else (b"", 0, 0, 0, 0, 0)
+        magic, version, backend, walk_flips, max_derived, table_size, *lengths = fields
+        if magic != KBSnapshot.MAGIC or version != KBSnapshot.VERSION or len(data) != KBSnapshot.HEADER.size + table_size + 4 * sum(lengths):
+            if isinstance(data, memoryview):
+                data.release()
+            if mapping is not None:
+                mapping.close()
+            raise ValueError("Not a whole MazeKnowledgeBase snapshot (of version " + str(KBSnapshot.VERSION) + "): " + source)
+
+        from maze_knowledge_base import MazeKnowledgeBase
+        start = KBSnapshot.HEADER.size
+        props = marshal.loads(data[start:start + table_size])
+        start += table_size
+        arrays: dict[str, Sequence[int]] = dict()
+        for name, length in zip(KBSnapshot.ARRAYS, lengths):
+            if isinstance(data, memoryview) and sys.byteorder == "little":
+                arrays[name] = data[start:start + 4 * length].cast("i")
+            else:
+                values = array("i", data[start:start + 4 * length])
+                if sys.byteorder != "little":
+                    values.byteswap()
+                arrays[name] = values
+            start += 4 * length
+        settings = (MazeKnowledgeBase.BACKENDS[backend], None if walk_flips < 0 else walk_flips, None if max_derived < 0 else max_derived)
+        return KBSnapshot(props, settings, arrays, mapping, cast(memoryview, data) if mapping is not None else None)
+
+    def get_ids (self) -> list[int]:
+        """
+        Returns this process's id (see SymbolTable) of each local prop id,
+        interning the props of the table (index 0 is unused).
+        """
+        return [0] + [SYMBOLS.id_of(prop) for prop in self.props]
+
+    def get_clauses (self, ids: Sequence[int]) -> Iterator["MazeClause"]:
+        """
+        Yields the snapshot's clauses, given the ids from get_ids.
+        """
+        offsets, lits = self.arrays["clause_offsets"], self.arrays["clause_lits"]
+        for i in range(len(offsets) - 1):
+            yield MazeClause.from_lits([ids[lit] if lit > 0 else -ids[-lit] for lit in lits[offsets[i]:offsets[i + 1]]])
+
+    def get_constraints (self) -> Iterator["CardinalityConstraint"]:
+        """
+        Yields the snapshot's constraints. Their tags ("@0", "@1", ...) are
+        apart from those of the constraints told later ("#" + the version).
+        """
+        offsets, members, ks = self.arrays["constraint_offsets"], self.arrays["constraint_ids"], self.arrays["constraint_ks"]
+        for i in range(len(ks)):
+            yield CardinalityConstraint([self.props[local_id - 1] for local_id in members[offsets[i]:offsets[i + 1]]], ks[i], "@" + str(i))
+
+    def get_simplified (self, ids: Sequence[int]) -> dict[int, bool]:
+        """
+        Returns the props the KB was simplified by, given the ids from get_ids.
+        """
+        return {ids[abs(lit)]: lit > 0 for lit in self.arrays["simplified"]}
+
+    def close (self) -> None:
+        """
+        Releases the arrays and unmaps the file, if it was mapped.
+        """
+        if self.mapping is not None:
+            for values in self.arrays.values():
+                cast(memoryview, values).release()
+            self.arrays = dict()
+            cast(memoryview, self.view).release()
+            self.view = None
+            self.mapping.close()
+            self.mapping = None
+
+    def __enter__ (self) -> "KBSnapshot":
+        return self
+
+    def __exit__ (self, *exc_info: Any) -> None:
+        self.close()
+
+def _benchmark (width: int, height: int, path: str, seed: int = 0) -> None:
+    """
+    Times saving and loading (mapped and read) a KB of random warning
+    constraints over a grid along with clauses over neighbouring tiles,
+    against deep-copying it and pickling it.
+    """
+    import pickle
+    from copy import deepcopy
+    from maze_knowledge_base import MazeKnowledgeBase
+    rng = random.Random(seed)
+    kb = MazeKnowledgeBase(backend = "cdcl")
+    pits = {(x, y) for x in range(width) for y in range(height) if rng.random() < 0.2}
+    for x in range(width):
+        for y in range(height):
+            near = [(x + dx, y + dy) for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)) if 0 <= x + dx < width and 0 <= y + dy < height]
+            if (x + y) % 2 == 0:
+                kb.tell_exactly([("P", loc) for loc in near], sum(1 for loc in near if loc in pits))
+            else:
+                kb.tell(MazeClause([(("P", loc), loc in pits or rng.random() < 0.5) for loc in rng.sample(near, min(2, len(near)))]))
+    timings: list[tuple[str, Callable[[], Any]]] = [
+        ("save", lambda: kb.save(path)),
+        ("load (mmap)", lambda: MazeKnowledgeBase.load(path)),
+        ("load (read)", lambda: MazeKnowledgeBase.load(path, use_mmap = False)),
+        ("deepcopy", lambda: deepcopy(kb)),
+        ("pickle", lambda: pickle.loads(pickle.dumps(kb))),
+    ]
+    for label, operation in timings:
+        start = time.perf_counter()
+        for _ in range(10):
+            operation()
+        print("  %-12s %7.2fms" % (label, 100 * (time.perf_counter() - start)))
+    print("  (%d clauses, %d constraints, %d bytes; %d pickled)" % (len(kb.clauses), len(kb.constraints), os.path.getsize(path), len(pickle.dumps(kb))))
+    os.remove(path)
+
+if __name__ == "__main__":
+    import tempfile
+    for width, height in ((12, 12), (40, 40)):
+        print("%dx%d grid:" % (width, height))
+        _benchmark(width, height, os.path.join(tempfile.gettempdir(), "maze_snapshot_benchmark.mzkb"))
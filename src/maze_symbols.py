@@ -0,0 +1,72 @@
+from typing import *
+
+class SymbolTable:
+    '''
+    Interns maze propositions, e.g., ("P", (1, 1)), as small, dense integer
+    ids (1, 2, 3, ...) assigned the first time each is seen, and maps ids
+    back to their propositions for printing. A literal, i.e., a proposition
+    with a truth value, is the signed id: +id if positive, -id if negated.
+
+    MazeClauses, the MazeKnowledgeBase and its backends all work on these
+    ints internally, so that propositions are hashed once when interned
+    rather than each time a clause is built, compared, or resolved.
+    '''
+
+    def __init__ (self) -> None:
+        """
+        Initializes an empty symbol table. Id 0 is never used, so that every
+        id can be negated.
+        """
+        self.ids: dict[tuple, int] = dict()
+        self.props: list[tuple] = [()]
+        # The negative literal of each id, kept so that every clause holding
+        # it shares one int object rather than allocating its own
+        self.negated: list[int] = [0]
+
+    def id_of (self, prop: tuple) -> int:
+        """
+        Returns the id of the given proposition, assigning the next free id
+        if it has not been seen before.
+        """
+        prop_id = self.ids.get(prop)
+        if prop_id is None:
+            prop_id = len(self.props)
+            self.ids[prop] = prop_id
+            self.props.append(prop)
+            self.negated.append(-prop_id)
+        return prop_id
+
+    def prop_of (self, prop_id: int) -> tuple:
+        """
+        Returns the proposition with the given id.
+        """
+        return self.props[prop_id]
+
+    def lit (self, prop: tuple, truth_val: bool) -> int:
+        """
+        Returns the literal (signed id) of the given proposition and truth value.
+        """
+        prop_id = self.id_of(prop)
+        return prop_id if truth_val else self.negated[prop_id]
+
+    def literal_of (self, lit: int) -> tuple[tuple, bool]:
+        """
+        Returns the (prop, truth_val) pair that the given literal stands for.
+        """
+        return self.props[abs(lit)], lit > 0
+
+    def __contains__ (self, prop: tuple) -> bool:
+        """
+        Returns whether the given proposition has been assigned an id.
+        """
+        return prop in self.ids
+
+    def __len__ (self) -> int:
+        """
+        Returns the number of propositions that have been assigned ids.
+        """
+        return len(self.props) - 1
+
+# The symbol table shared by every clause and knowledge base, so that literals
+# from different clauses can be compared directly
+SYMBOLS = SymbolTable()
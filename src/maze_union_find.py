@@ -0,0 +1,62 @@
+from typing import *
+
+class PropositionUnionFind:
+    '''
+    Disjoint-set forest over maze propositions (or their ids, see
+    SymbolTable), used by MazeKnowledgeBase to group propositions that
+    (transitively) share a clause into connected components. Uses union
+    by size and path halving.
+    '''
+
+    def __init__ (self) -> None:
+        """
+        Initializes an empty forest; propositions are added on first use.
+        """
+        self.parent: dict[Hashable, Hashable] = dict()
+        self.size: dict[Hashable, int] = dict()
+
+    def find (self, prop: Hashable) -> Hashable:
+        """
+        Returns the representative (root) proposition of the component
+        containing the given proposition, adding it as a singleton if new.
+
+        Parameters:
+            prop (Hashable):
+                A maze proposition, e.g., ("P", (1, 1)), or its id
+
+        Returns:
+            Hashable:
+                The root proposition of its component
+        """
+        parent = self.parent.setdefault(prop, prop)
+        if parent == prop:
+            self.size.setdefault(prop, 1)
+            return prop
+        while parent != prop:
+            self.parent[prop] = self.parent[parent]
+            prop = self.parent[prop]
+            parent = self.parent[prop]
+        return prop
+
+    def union (self, a: Hashable, b: Hashable) -> Hashable:
+        """
+        Merges the components containing the two propositions.
+
+        Returns:
+            Hashable:
+                The root of the merged component
+        """
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        return root_a
+
+    def __contains__ (self, prop: Any) -> bool:
+        """
+        Returns True if the proposition has been added to the forest.
+        """
+        return prop in self.parent